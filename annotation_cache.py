@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger("annotation_cache")
+
+ANNOTATION_CACHE_DIR = "annotation_cache"
+DEFAULT_MEMORY_ENTRIES = 256
+DEFAULT_DISK_ENTRIES = 20000
+# Puts between two checks of the disk tier's size
+PRUNE_EVERY = 100
+
+
+def cache_key(text_hash, profile, kb_version):
+    """Key an annotation by content, pipeline profile and knowledge base version.
+
+    Args:
+        text_hash (str): Hash of the extracted text
+        profile (str): Pipeline profile from annotator.pipeline_profile
+        kb_version (str): Knowledge base version, or 'none' if not used
+
+    Returns:
+        str: Hex digest usable as a file name
+    """
+    return hashlib.sha256(f"{text_hash}|{profile}|{kb_version}".encode("utf-8")).hexdigest()
+
+
+class AnnotationCache:
+    """Two-tier cache of NLP annotations shared by the API and the scheduler.
+
+    The first tier is an in-process LRU of `memory_entries` annotations. The
+    second is a directory of JSON files, one per key, written atomically so
+    either process can read entries the other wrote. Reading a file touches
+    its mtime, and every PRUNE_EVERY puts the least recently used files
+    beyond `disk_entries` are deleted. Set `cache_dir` to None to keep the
+    cache in memory only.
+    """
+
+    def __init__(self, cache_dir=ANNOTATION_CACHE_DIR, memory_entries=DEFAULT_MEMORY_ENTRIES,
+                 disk_entries=DEFAULT_DISK_ENTRIES):
+        self.cache_dir = cache_dir
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _remember(self, key, annotation):
+        with self._lock:
+            self._entries[key] = annotation
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.memory_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        """Return the cached annotation for `key`, or None."""
+        with self._lock:
+            annotation = self._entries.get(key)
+            if annotation is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return annotation
+
+        if self.cache_dir:
+            path = self._path(key)
+            try:
+                with open(path, "r") as f:
+                    annotation = json.load(f)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable cached annotation {key}: {str(e)}")
+            else:
+                try:
+                    # Recently used entries survive pruning
+                    os.utime(path)
+                except OSError:
+                    pass
+                self._remember(key, annotation)
+                self.hits += 1
+                return annotation
+
+        self.misses += 1
+        return None
+
+    def put(self, key, annotation):
+        """Store an annotation in both tiers."""
+        self._remember(key, annotation)
+        if not self.cache_dir:
+            return
+
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(annotation, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not persist annotation {key}: {str(e)}")
+        with self._lock:
+            self._puts += 1
+            prune = self.disk_entries is not None and self._puts % PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        """Delete the least recently used files beyond `disk_entries`.
+
+        Returns:
+            int: Number of files deleted
+        """
+        files = []
+        try:
+            for shard in os.scandir(self.cache_dir):
+                if shard.is_dir():
+                    for entry in os.scandir(shard.path):
+                        if entry.name.endswith(".json"):
+                            try:
+                                files.append((entry.stat().st_mtime_ns, entry.path))
+                            except FileNotFoundError:
+                                pass
+        except OSError as e:
+            logger.warning(f"Could not scan annotation cache {self.cache_dir}: {str(e)}")
+            return 0
+        if len(files) <= self.disk_entries:
+            return 0
+        files.sort()
+        removed = 0
+        for _, path in files[:len(files) - self.disk_entries]:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                # Pruned by the other process
+                pass
+            except OSError as e:
+                logger.warning(f"Could not remove cached annotation {path}: {str(e)}")
+        return removed
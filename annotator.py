@@ -0,0 +1,109 @@
+import re
+from collections import Counter
+
+# Bump when the annotation output changes so cached annotations are not reused
+ANNOTATOR_VERSION = "2"
+
+
+def pipeline_profile(nlp=None):
+    """Identify the pipeline that produced an annotation.
+
+    Only the model and the annotator version matter: FED entities come from
+    the knowledge base, not from pipeline components, so the API and the
+    scheduler share a profile when they load the same model.
+
+    Args:
+        nlp (Language): spaCy pipeline, or None for the regex fallback
+
+    Returns:
+        str: Profile string used in annotation cache keys
+    """
+    if nlp is None:
+        return f"regex/{ANNOTATOR_VERSION}"
+    meta = nlp.meta
+    return f"{meta.get('lang', '')}_{meta.get('name', '')}-{meta.get('version', '')}/{ANNOTATOR_VERSION}"
+
+
+def basic_entity_counts(doc):
+    """Count title-case words in a spaCy Doc.
+
+    Token attributes are read in one pass with `Doc.to_array` and filtered
+    with NumPy masks; words are grouped by lexeme ID, so each distinct word
+    is only turned back into a string once.
+
+    Args:
+        doc (Doc): spaCy Doc
+
+    Returns:
+        dict: Word -> occurrences, most frequent first
+    """
+    import numpy
+    from spacy.attrs import IS_ALPHA, IS_TITLE, LENGTH, ORTH
+
+    if len(doc) == 0:
+        return {}
+    attrs = doc.to_array([ORTH, IS_ALPHA, IS_TITLE, LENGTH])
+    mask = (attrs[:, 1] != 0) & (attrs[:, 2] != 0) & (attrs[:, 3] > 1)
+    orths, counts = numpy.unique(attrs[mask, 0], return_counts=True)
+
+    strings = doc.vocab.strings
+    words = [(strings[int(orth)], int(count)) for orth, count in zip(orths, counts)]
+    words.sort(key=lambda item: (-item[1], item[0]))
+    return dict(words)
+
+
+def extract_basic_entities(doc):
+    """Collect unique title-case words from a spaCy Doc, most frequent first."""
+    return list(basic_entity_counts(doc))
+
+
+def entity_counts_simple(text):
+    """Count title-cased words with a regex when spaCy is not available."""
+    # A simple regex pattern to find title-cased words (names, organizations, etc.)
+    pattern = r'\b[A-Z][a-z]+\b'
+    counts = Counter(re.findall(pattern, text))
+    return dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+
+
+def extract_entities_simple(text):
+    """Find unique title-cased words with a regex, most frequent first."""
+    return list(entity_counts_simple(text))
+
+
+def longest_sentence(doc):
+    longest_sent = ""
+    for sent in doc.sents:
+        if len(sent.text) > len(longest_sent):
+            longest_sent = sent.text
+    return longest_sent
+
+
+def annotate_doc(doc, kb=None):
+    """Build the cached annotation for a processed document.
+
+    Args:
+        doc (Doc): spaCy Doc
+        kb (KnowledgeBase): Compiled knowledge base, or None to skip FED entities
+
+    Returns:
+        dict: 'basic_entities', 'basic_entity_counts', 'fed_entities' and 'summary'
+    """
+    counts = basic_entity_counts(doc)
+    return {
+        "basic_entities": list(counts),
+        "basic_entity_counts": counts,
+        "fed_entities": kb.extract_fed_entities(doc.text) if kb else [],
+        "summary": longest_sentence(doc)
+    }
+
+
+def annotate_text(text, kb=None):
+    """Build the cached annotation for raw text without spaCy."""
+    sentences = re.split(r'(?<=[.!?])\s+', text)
+    counts = entity_counts_simple(text)
+    return {
+        "basic_entities": list(counts),
+        "basic_entity_counts": counts,
+        "fed_entities": kb.extract_fed_entities(text) if kb else [],
+        "summary": max(sentences, key=len).strip() if sentences else ""
+    }
@@ -0,0 +1,194 @@
+import json
+import logging
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+logger = logging.getLogger("change_log")
+
+CHANGE_LOG_DIR = "change_log"
+LEGACY_CHANGE_LOG = "change_log.json"
+DEFAULT_RETENTION_DAYS = 90
+
+_SEGMENT_SUFFIX = ".jsonl"
+_MIGRATED_MARKER = ".migrated"
+
+
+def _segment_date(name):
+    try:
+        return date.fromisoformat(name[:-len(_SEGMENT_SUFFIX)])
+    except ValueError:
+        return None
+
+
+def _entry_time(entry):
+    return datetime.fromisoformat(entry["time"].replace("Z", ""))
+
+
+class ChangeLog:
+    """Append-only change log split into one JSON Lines segment per day.
+
+    Appending opens the day's segment and writes one line, whatever the size
+    of the history. Readers only open the segments covering the requested
+    time range. `enforce_retention()` drops whole segments once they are
+    older than the retention window.
+
+    Args:
+        directory (str): Where segments (YYYY-MM-DD.jsonl) are kept
+        retention_days (int): Days of history to keep; None keeps everything
+    """
+
+    def __init__(self, directory=CHANGE_LOG_DIR, retention_days=DEFAULT_RETENTION_DAYS):
+        self.directory = directory
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _segment_path(self, day):
+        return os.path.join(self.directory, day.isoformat() + _SEGMENT_SUFFIX)
+
+    def segments(self):
+        """Return (date, path) for every segment, oldest first."""
+        found = []
+        for name in os.listdir(self.directory):
+            if name.endswith(_SEGMENT_SUFFIX):
+                day = _segment_date(name)
+                if day is not None:
+                    found.append((day, os.path.join(self.directory, name)))
+        return sorted(found)
+
+    def append(self, entry):
+        """Append one entry (a dict with an ISO 'time') to its day's segment."""
+        line = json.dumps(entry) + "\n"
+        path = self._segment_path(_entry_time(entry).date())
+        with self._lock:
+            with open(path, "a") as f:
+                f.write(line)
+
+    def read(self, since=None, until=None):
+        """Yield entries with since <= time < until, oldest segment first.
+
+        Args:
+            since (datetime): Start of the range, or None for the beginning
+            until (datetime): End of the range, or None for now
+        """
+        for day, path in self.segments():
+            if since is not None and day < since.date():
+                continue
+            if until is not None and day > until.date():
+                break
+            try:
+                with open(path, "r") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                            entry_time = _entry_time(entry)
+                        except (ValueError, KeyError):
+                            continue
+                        if since is not None and entry_time < since:
+                            continue
+                        if until is not None and entry_time >= until:
+                            continue
+                        yield entry
+            except FileNotFoundError:
+                # Dropped by retention while we were reading
+                continue
+
+    def read_new(self, position=None):
+        """Return the entries appended since `position` and the position after them.
+
+        Lets readers follow the log, also across processes, by reading only
+        the lines added since their previous call. A line still being
+        written is left for the next call.
+
+        Args:
+            position (tuple): (date, byte offset) returned by a previous call;
+                None reads every segment
+
+        Returns:
+            tuple: (list of entries, new position)
+        """
+        entries = []
+        for day, path in self.segments():
+            if position is not None and day < position[0]:
+                continue
+            offset = position[1] if position is not None and day == position[0] else 0
+            try:
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break
+                        offset += len(line)
+                        try:
+                            entry = json.loads(line)
+                            _entry_time(entry)
+                        except (ValueError, KeyError):
+                            continue
+                        entries.append(entry)
+            except FileNotFoundError:
+                continue
+            position = (day, offset)
+        return entries, position
+
+    def end(self):
+        """Return the position after the last complete entry, for `read_new()`."""
+        segments = self.segments()
+        if not segments:
+            return None
+        day, path = segments[-1]
+        with open(path, "rb") as f:
+            return day, f.read().rfind(b"\n") + 1
+
+    def enforce_retention(self, now=None):
+        """Delete segments older than the retention window.
+
+        Returns:
+            int: Number of segments removed
+        """
+        if self.retention_days is None:
+            return 0
+        cutoff = (now or datetime.now()).date() - timedelta(days=self.retention_days)
+        removed = 0
+        for day, path in self.segments():
+            if day >= cutoff:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError as e:
+                logger.error(f"Could not remove change log segment {path}: {str(e)}")
+        return removed
+
+    def migrate_json(self, path=LEGACY_CHANGE_LOG):
+        """Split a legacy change_log.json into segments, once.
+
+        The JSON file is left in place; a marker in the segment directory
+        records that it was imported.
+
+        Returns:
+            int: Number of entries imported
+        """
+        marker = os.path.join(self.directory, _MIGRATED_MARKER)
+        if os.path.exists(marker) or not os.path.exists(path):
+            return 0
+        try:
+            with open(path, "r") as f:
+                entries = json.load(f)
+        except Exception as e:
+            logger.error(f"Could not read {path} for migration: {str(e)}")
+            return 0
+
+        by_day = {}
+        for entry in entries:
+            try:
+                by_day.setdefault(_entry_time(entry).date(), []).append(entry)
+            except (ValueError, KeyError, AttributeError):
+                continue
+        with self._lock:
+            for day, day_entries in sorted(by_day.items()):
+                with open(self._segment_path(day), "a") as f:
+                    f.writelines(json.dumps(entry) + "\n" for entry in day_entries)
+            with open(marker, "w") as f:
+                f.write(path + "\n")
+        return sum(len(day_entries) for day_entries in by_day.values())
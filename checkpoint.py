@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+import tempfile
+import uuid
+from datetime import datetime
+
+logger = logging.getLogger("checkpoint")
+
+CHECKPOINT_FILE = "cycle_checkpoint.jsonl"
+
+
+def _fsync_directory(path):
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class CycleCheckpoint:
+    """Crash-safe record of which URLs a check cycle has finished.
+
+    The first line holds the cycle ID, start time and URL list and is
+    written atomically (temporary file, fsync, rename). Each finished URL
+    then appends one fsynced line. After a crash, `load()` returns the
+    unfinished cycle and `remaining()` the URLs still to check; a torn last
+    line is ignored, so that URL is simply checked again. `finish()` deletes
+    the file once the cycle is complete.
+
+    Args:
+        path (str): Checkpoint file
+    """
+
+    def __init__(self, path=CHECKPOINT_FILE):
+        self.path = path
+
+    def load(self):
+        """Return the interrupted cycle as a dict, or None if there is none."""
+        try:
+            with open(self.path, "r") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return None
+        try:
+            state = json.loads(lines[0])
+        except (IndexError, ValueError):
+            logger.warning(f"Ignoring unreadable checkpoint {self.path}")
+            return None
+        if len(lines) > 1 and not lines[-1].endswith("\n"):
+            # Cut off a line torn by a crash so the next append starts cleanly
+            with open(self.path, "r+") as f:
+                f.truncate(sum(len(line.encode("utf-8")) for line in lines[:-1]))
+            lines = lines[:-1]
+        state["done"] = set()
+        for line in lines[1:]:
+            try:
+                state["done"].add(json.loads(line)["done"])
+            except (ValueError, KeyError, TypeError):
+                continue
+        return state
+
+    def start(self, sites):
+        """Begin a new cycle over `sites`, replacing any previous checkpoint."""
+        state = {"cycle": uuid.uuid4().hex, "started": datetime.now().isoformat(), "sites": list(sites)}
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(json.dumps(state) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        _fsync_directory(self.path)
+        state["done"] = set()
+        return state
+
+    def mark_done(self, state, url):
+        """Durably record that `url` is finished."""
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"done": url}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        state["done"].add(url)
+
+    @staticmethod
+    def remaining(state):
+        return [url for url in state["sites"] if url not in state["done"]]
+
+    def finish(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
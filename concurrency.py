@@ -0,0 +1,80 @@
+import asyncio
+
+
+class Saturated(Exception):
+    """Raised when a request cannot be admitted in time."""
+
+
+class AdmissionController:
+    """Bound the number of concurrently running jobs, with a short queue.
+
+    Up to `max_active` jobs run at once and up to `max_queued` more wait for
+    a slot. A job that arrives when the queue is full, or that waits longer
+    than `queue_timeout` seconds, raises Saturated so the caller can answer
+    503 instead of piling up work.
+    """
+
+    def __init__(self, max_active, max_queued, queue_timeout=None):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = None
+
+    def saturated(self):
+        """True if a job arriving now would be rejected."""
+        return self.active + self.waiting >= self.max_active + self.max_queued
+
+    async def __aenter__(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_active)
+        if self.saturated():
+            raise Saturated(f"{self.active} running and {self.waiting} queued")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise Saturated(f"no slot within {self.queue_timeout}s")
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.active -= 1
+        self._semaphore.release()
+        return False
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one in-flight job.
+
+    The first caller for a key starts the job; callers that arrive while it
+    is running await the same result (or exception). The job is shielded,
+    so one caller disconnecting does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+
+    def __contains__(self, key):
+        return key in self._inflight
+
+    async def do(self, key, job):
+        """Run `job()` for `key` unless it is already running, and await it.
+
+        Args:
+            key (hashable): Coalescing key, e.g. the URL
+            job (callable): Zero-argument coroutine function
+
+        Returns:
+            The job's result
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(job())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
@@ -0,0 +1,207 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime
+
+logger = logging.getLogger("doc_store")
+
+DOC_STORE_DIR = "doc_store"
+DEFAULT_MAX_VERSIONS = 5
+MANIFEST_FILE = "manifest.json"
+
+# Span group holding knowledge base matches on stored documents
+FED_SPAN_GROUP = "fed"
+
+
+def _url_key(url):
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()[:24]
+
+
+def _write_atomic(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def add_fed_spans(doc, kb):
+    """Record knowledge base matches on a Doc as the 'fed' span group.
+
+    Matches that do not line up with token boundaries are skipped.
+
+    Args:
+        doc (Doc): Processed spaCy Doc
+        kb (KnowledgeBase): Compiled knowledge base
+
+    Returns:
+        Doc: The same Doc
+    """
+    spans = []
+    for start, end, label in kb.find_spans(doc.text):
+        span = doc.char_span(start, end, label=label)
+        if span is not None:
+            spans.append(span)
+    doc.spans[FED_SPAN_GROUP] = spans
+    return doc
+
+
+def mentions(doc, text, labels=None):
+    """Find mentions of `text` among a stored Doc's entities and FED spans.
+
+    Args:
+        doc (Doc): Deserialized Doc
+        text (str): Entity text to look for
+        labels (set): Optional set of labels to restrict to
+
+    Returns:
+        list: Dicts with 'text', 'label', 'start_char', 'end_char' and 'sentence'
+    """
+    spans = list(doc.ents)
+    if FED_SPAN_GROUP in doc.spans:
+        spans += list(doc.spans[FED_SPAN_GROUP])
+
+    found = []
+    for span in spans:
+        if span.text != text or (labels and span.label_ not in labels):
+            continue
+        try:
+            sentence = span.sent.text
+        except ValueError:
+            # No sentence boundaries were stored
+            sentence = ""
+        found.append({
+            "text": span.text,
+            "label": span.label_,
+            "start_char": span.start_char,
+            "end_char": span.end_char,
+            "sentence": sentence
+        })
+    return found
+
+
+class DocStore:
+    """Per-URL, per-version store of processed spaCy Docs.
+
+    Each URL gets a directory holding one DocBin file per content hash and a
+    manifest listing the stored versions, newest last. Only the newest
+    `max_versions` are kept. Docs are deserialized on demand with the
+    caller's vocab, so annotations can be re-queried without re-running the
+    pipeline.
+    """
+
+    def __init__(self, directory=DOC_STORE_DIR, max_versions=DEFAULT_MAX_VERSIONS):
+        self.directory = directory
+        self.max_versions = max_versions
+
+    def _url_dir(self, url):
+        return os.path.join(self.directory, _url_key(url))
+
+    def _read_manifest(self, url_dir):
+        try:
+            with open(os.path.join(url_dir, MANIFEST_FILE), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable manifest in {url_dir}: {str(e)}")
+            return None
+
+    def urls(self):
+        """Return every URL with at least one stored document."""
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        for name in sorted(os.listdir(self.directory)):
+            manifest = self._read_manifest(os.path.join(self.directory, name))
+            if manifest and manifest.get("versions"):
+                found.append(manifest["url"])
+        return found
+
+    def versions(self, url):
+        """Return the stored versions of `url`, oldest first."""
+        manifest = self._read_manifest(self._url_dir(url))
+        return manifest["versions"] if manifest else []
+
+    def has(self, url, version):
+        return any(v["hash"] == version for v in self.versions(url))
+
+    def save(self, url, version, doc, profile=""):
+        """Serialize a processed Doc as the `version` of `url`.
+
+        Args:
+            url (str): Page URL
+            version (str): Content hash of the page text
+            doc (Doc): Processed spaCy Doc
+            profile (str): Pipeline profile that produced the Doc
+        """
+        from spacy.tokens import DocBin
+
+        url_dir = self._url_dir(url)
+        os.makedirs(url_dir, exist_ok=True)
+
+        doc_bin = DocBin(store_user_data=True)
+        doc_bin.add(doc)
+        _write_atomic(os.path.join(url_dir, f"{version}.spacy"), doc_bin.to_bytes())
+
+        manifest = self._read_manifest(url_dir) or {"url": url, "versions": []}
+        versions = [v for v in manifest["versions"] if v["hash"] != version]
+        versions.append({"hash": version, "time": datetime.now().isoformat(), "profile": profile})
+        for old in versions[:-self.max_versions]:
+            try:
+                os.unlink(os.path.join(url_dir, f"{old['hash']}.spacy"))
+            except FileNotFoundError:
+                pass
+        manifest["versions"] = versions[-self.max_versions:]
+        _write_atomic(os.path.join(url_dir, MANIFEST_FILE), json.dumps(manifest, indent=2).encode("utf-8"))
+
+    def load(self, url, vocab, version=None):
+        """Deserialize a stored Doc.
+
+        Args:
+            url (str): Page URL
+            vocab (Vocab): Vocab to attach the Doc to, usually `nlp.vocab`
+            version (str): Content hash; the newest version if omitted
+
+        Returns:
+            Doc: Stored document, or None if not stored
+        """
+        from spacy.tokens import DocBin
+
+        if version is None:
+            versions = self.versions(url)
+            if not versions:
+                return None
+            version = versions[-1]["hash"]
+
+        try:
+            with open(os.path.join(self._url_dir(url), f"{version}.spacy"), "rb") as f:
+                doc_bin = DocBin().from_bytes(f.read())
+        except FileNotFoundError:
+            return None
+        docs = list(doc_bin.get_docs(vocab))
+        return docs[0] if docs else None
+
+    def iter_docs(self, vocab, urls=None, all_versions=False):
+        """Lazily yield stored Docs.
+
+        Args:
+            vocab (Vocab): Vocab to attach Docs to
+            urls (list): URLs to include; every stored URL if omitted
+            all_versions (bool): Yield every stored version, not just the newest
+
+        Yields:
+            tuple: (url, version_info, doc)
+        """
+        for url in (urls if urls is not None else self.urls()):
+            versions = self.versions(url)
+            for info in (versions if all_versions else versions[-1:]):
+                doc = self.load(url, vocab, info["hash"])
+                if doc is not None:
+                    yield url, info, doc
@@ -0,0 +1,181 @@
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+from datetime import datetime
+
+from knowledge_base import entity_id
+
+logger = logging.getLogger("entity_index")
+
+ENTITY_INDEX_FILE = "entity_index.json"
+
+BASIC_TYPE = "basic"
+FED_TYPES = ("person", "organization", "publication")
+SORT_KEYS = ("count", "urls", "last_seen", "entity")
+
+
+class EntityIndex:
+    """Inverted index from entity to the URLs that mention it.
+
+    Each entry, keyed by (type, text), keeps per-URL counts, the total count,
+    when it was last seen and, for FED entities, the knowledge base ID
+    (details are looked up in the knowledge base when a response needs
+    them). `update_url()` replaces one URL's contribution in place, so the
+    index is maintained incrementally as pages change instead of being
+    rebuilt from the whole store. Sorted views used by `query()` are built
+    once per change and reused between requests. URLs and entity texts are
+    interned, and the saved file lists each URL once.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.url_keys = {}
+        self._sorted = {}
+        self._lock = threading.Lock()
+
+    def _remove_url(self, url):
+        for key in self.url_keys.pop(url, ()):
+            entry = self.entries.get(key)
+            if entry is None:
+                continue
+            entry["count"] -= entry["urls"].pop(url, 0)
+            if not entry["urls"]:
+                del self.entries[key]
+
+    def update_url(self, url, basic_counts, fed_entities, seen_at=None):
+        """Replace the entities recorded for `url`.
+
+        Args:
+            url (str): Page URL
+            basic_counts (dict): Basic entity -> occurrences on the page
+            fed_entities (list): FED entity dicts from the knowledge base
+            seen_at (str): ISO timestamp; now if omitted
+        """
+        seen_at = seen_at or datetime.now().isoformat()
+        url = sys.intern(url)
+        mentions = {(BASIC_TYPE, sys.intern(text)): (count, None) for text, count in basic_counts.items()}
+        for entity in fed_entities:
+            if isinstance(entity, dict) and entity.get("type") in FED_TYPES:
+                key = (entity["type"], sys.intern(entity["text"]))
+                count, _ = mentions.get(key, (0, None))
+                mentions[key] = (count + 1, entity_id(entity))
+
+        with self._lock:
+            self._remove_url(url)
+            for key, (count, kb_id) in mentions.items():
+                entry = self.entries.get(key)
+                if entry is None:
+                    entry = self.entries[key] = {"entity": key[1], "type": key[0], "count": 0,
+                                                 "urls": {}, "last_seen": seen_at, "id": kb_id}
+                entry["urls"][url] = count
+                entry["count"] += count
+                entry["last_seen"] = max(entry["last_seen"], seen_at)
+                if kb_id:
+                    entry["id"] = kb_id
+            self.url_keys[url] = list(mentions)
+            self._sorted = {}
+
+    def query(self, entity_type=None, sort="count", descending=True, offset=0, limit=50):
+        """Return one page of entries.
+
+        Args:
+            entity_type (str): 'basic', 'person', 'organization', 'publication' or None for all
+            sort (str): 'count', 'urls', 'last_seen' or 'entity'
+            descending (bool): Sort order
+            offset (int): Entries to skip
+            limit (int): Page size
+
+        Returns:
+            tuple: (total matching entries, list of entry dicts)
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_KEYS)}")
+        view_key = (entity_type, sort, descending)
+        with self._lock:
+            view = self._sorted.get(view_key)
+            if view is None:
+                entries = [e for e in self.entries.values()
+                           if entity_type is None or e["type"] == entity_type]
+                if sort == "urls":
+                    sort_key = lambda e: (len(e["urls"]), e["entity"])
+                elif sort == "entity":
+                    sort_key = lambda e: e["entity"]
+                else:
+                    sort_key = lambda e: (e[sort], e["entity"])
+                view = sorted(entries, key=sort_key, reverse=descending)
+                self._sorted[view_key] = view
+        return len(view), view[offset:offset + limit]
+
+    def to_dict(self):
+        """Serialize with a shared URL table; entries hold [URL position, count] pairs."""
+        with self._lock:
+            urls = list(self.url_keys)
+            positions = {url: i for i, url in enumerate(urls)}
+            return {"urls": urls,
+                    "entries": [dict(e, urls=[[positions[url], count] for url, count in e["urls"].items()])
+                                for e in self.entries.values()]}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Load `to_dict()` output, or the older layout with URL dicts and copied 'info'."""
+        index = cls()
+        urls = [sys.intern(url) for url in data.get("urls", [])]
+        for entry in data.get("entries", []):
+            if isinstance(entry["urls"], dict):
+                entry["urls"] = {sys.intern(url): count for url, count in entry["urls"].items()}
+            else:
+                entry["urls"] = {urls[position]: count for position, count in entry["urls"]}
+            info = entry.pop("info", None)
+            if "id" not in entry:
+                entry["id"] = entity_id(info) if info else None
+            entry["entity"] = sys.intern(entry["entity"])
+            key = (entry["type"], entry["entity"])
+            index.entries[key] = entry
+            for url in entry["urls"]:
+                index.url_keys.setdefault(url, []).append(key)
+        return index
+
+    @classmethod
+    def from_entity_store(cls, store):
+        """Build an index from entity_store.json in either of its layouts.
+
+        Accepts the scheduler layout ({"entities": {url: {...}}}) and the
+        API layout ({url: {"basic": [...], "fed_*": [...]}}).
+        """
+        index = cls()
+        pages = store.get("entities", store) if isinstance(store.get("entities"), dict) else store
+        for url, page in pages.items():
+            if not isinstance(page, dict):
+                continue
+            counts = page.get("entity_counts")
+            if counts is None:
+                counts = {text: 1 for text in page.get("entities", page.get("basic", []))}
+            fed_entities = list(page.get("fed_entities", []))
+            for field in ("fed_people", "fed_organizations", "fed_publications"):
+                fed_entities += [e for e in page.get(field, []) if isinstance(e, dict)]
+            index.update_url(url, counts, fed_entities, page.get("time"))
+        return index
+
+
+def load_entity_index(path=ENTITY_INDEX_FILE):
+    """Load a saved index, or return None if there is none."""
+    try:
+        with open(path, "r") as f:
+            return EntityIndex.from_dict(json.load(f))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error(f"Could not load entity index {path}: {str(e)}")
+        return None
+
+
+def save_entity_index(index, path=ENTITY_INDEX_FILE):
+    """Write the index atomically (temporary file + rename)."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(index.to_dict(), f)
+    os.replace(tmp_path, path)
@@ -0,0 +1,202 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime, time, timedelta
+
+logger = logging.getLogger("events")
+
+CHANGE_EVENTS_FILE = "change_events.jsonl"
+READ_CHUNK_BYTES = 64 * 1024
+MAX_EVENTS_PER_POLL = 500
+
+_write_lock = threading.Lock()
+
+
+def _journal_start(f):
+    """Return (offset, header length) of an open journal, leaving `f` at its first event.
+
+    A trimmed journal starts with a header line {"type": "journal", "start": N}
+    giving the offset of its first event, so the offsets of the events it
+    kept do not change.
+    """
+    f.seek(0)
+    first = f.readline()
+    if first.endswith(b"\n") and first.startswith(b'{"type": "journal"'):
+        try:
+            return json.loads(first)["start"], len(first)
+        except (ValueError, KeyError):
+            pass
+    f.seek(0)
+    return 0, 0
+
+
+def publish_change(url, old_hash, new_hash, entities_found, path=CHANGE_EVENTS_FILE):
+    """Append a change event to the local event journal.
+
+    Each event is one JSON line written with a single append, so readers in
+    other processes never see a partial event followed by another one.
+
+    Args:
+        url (str): Page that changed
+        old_hash (str): Previous content hash, or None for a new page
+        new_hash (str): Current content hash
+        entities_found (dict): Entity lists as stored in the change log
+        path (str): Journal file
+
+    Returns:
+        dict: The published event
+    """
+    event = {
+        "type": "change",
+        "time": datetime.now().isoformat(),
+        "url": url,
+        "old_hash": old_hash,
+        "new_hash": new_hash,
+        "entities_found": entities_found
+    }
+    line = json.dumps(event) + "\n"
+    with _write_lock:
+        with open(path, "a") as f:
+            f.write(line)
+    return event
+
+
+def trim_events(path=CHANGE_EVENTS_FILE, retention_days=90, now=None):
+    """Drop events logged before the retention window (whole days, like the change log).
+
+    The kept events are copied to a new journal that replaces the old one,
+    behind a header recording where they start, so offsets held by readers
+    and clients stay valid. Events appended by another process in the
+    instant between the last copy and the replace can be lost.
+
+    Args:
+        path (str): Journal file
+        retention_days (int): Days of events to keep
+        now (datetime): Current time, for tests
+
+    Returns:
+        int: Number of events dropped
+    """
+    cutoff = datetime.combine((now or datetime.now()).date() - timedelta(days=retention_days), time()).isoformat()
+    with _write_lock:
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return 0
+        with f:
+            start, position = _journal_start(f)
+            # Event offset of the file's first byte
+            base = start - position
+            dropped = 0
+            # Events are appended in time order, so the old ones are a prefix
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    if json.loads(line).get("time", "") >= cutoff:
+                        break
+                except ValueError:
+                    pass
+                position += len(line)
+                dropped += 1
+            if not dropped:
+                return 0
+
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as out:
+                    out.write((json.dumps({"type": "journal", "start": base + position}) + "\n").encode("utf-8"))
+                    f.seek(position)
+                    shutil.copyfileobj(f, out)
+                    # Pick up what other processes appended while copying
+                    while os.path.getsize(path) > f.tell():
+                        shutil.copyfileobj(f, out)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+    logger.info(f"Dropped {dropped} events older than {retention_days} days from {path}")
+    return dropped
+
+
+class ChangeEventReader:
+    """Tail the change event journal from a byte offset.
+
+    `poll()` returns the complete events appended since the last call, at
+    most `max_events` of them, reading the journal in chunks of
+    READ_CHUNK_BYTES; the rest is returned by the following calls. Each
+    event carries an 'offset' (the position just after it), which a reader
+    can later pass back in to resume right after that event. Offsets stay
+    valid when `trim_events()` drops old events; an offset into the dropped
+    part resumes at the oldest kept event, and if the journal shrinks below
+    it (truncated or replaced), reading restarts from the beginning.
+
+    Args:
+        path (str): Journal file
+        offset (int): Where to start; the current end of the journal if None
+        max_events (int): Events returned per poll
+    """
+
+    def __init__(self, path=CHANGE_EVENTS_FILE, offset=None, max_events=MAX_EVENTS_PER_POLL):
+        self.path = path
+        if offset is None:
+            try:
+                with open(path, "rb") as f:
+                    start, header = _journal_start(f)
+                    offset = start + os.fstat(f.fileno()).st_size - header
+            except OSError:
+                offset = 0
+        self.offset = offset
+        self.max_events = max_events
+
+    def poll(self):
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return []
+        with f:
+            start, header = _journal_start(f)
+            size = os.fstat(f.fileno()).st_size
+            end = start + size - header
+            if end < self.offset:
+                logger.info(f"{self.path} was truncated, reading from the start")
+                self.offset = start
+            elif self.offset < start:
+                logger.info(f"Events before offset {start} were dropped from {self.path}, resuming there")
+                self.offset = start
+            if end == self.offset:
+                return []
+            return self._read(f, header + self.offset - start, size)
+
+    def _read(self, f, physical, size):
+        """Read complete events from byte `physical` of the open journal `f`."""
+        events = []
+        position = self.offset
+        partial = b""
+        f.seek(physical)
+        remaining = size - physical
+        while remaining > 0 and len(events) < self.max_events:
+            chunk = f.read(min(READ_CHUNK_BYTES, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            lines = (partial + chunk).split(b"\n")
+            # Only consume complete lines; a partial trailing line is
+            # completed by the next chunk or read next time
+            partial = lines.pop()
+            for line in lines:
+                position += len(line) + 1
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Skipping malformed event at offset {position - len(line) - 1}")
+                    continue
+                event["offset"] = position
+                events.append(event)
+                if len(events) >= self.max_events:
+                    break
+        self.offset = position
+        return events
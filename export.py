@@ -0,0 +1,431 @@
+import argparse
+import hashlib
+import html
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+import metrics
+from change_log import ChangeLog, CHANGE_LOG_DIR
+from reports import TEMPLATE_DIR, load_template, write_atomic
+from storage import Storage, STORAGE_FILE
+
+logger = logging.getLogger("export")
+
+EXPORT_DIR = "site"
+MANIFEST_FILE = "export_manifest.json"
+LAYOUT_TEMPLATE = os.path.join("site", "page.html")
+DEFAULT_WORKERS = 4
+DEFAULT_MIN_BATCH = 8  # pages; smaller batches are rendered by the calling thread
+BASIC_ENTITIES_SHOWN = 25
+
+# fed_entities.json groups with a page per entry: (group, title, type their mentions are stored under)
+GROUPS = (
+    ("people", "Officials", "person"),
+    ("organizations", "Organizations", "organization"),
+    ("publications", "Publications", "publication"),
+    ("events", "Events", None),
+    ("data_releases", "Data Releases", None),
+    ("topics", "Topics", None),
+)
+# Record fields shown elsewhere on an entity page or only used by the scheduler
+_HIDDEN_FIELDS = ("name", "aliases", "release")
+
+EXPORT_SECONDS = metrics.Histogram(
+    "fedload_export_seconds",
+    "Duration of a static site export update",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60))
+EXPORT_PAGES = metrics.Counter(
+    "fedload_export_pages_total",
+    "Static site pages written or removed by the export",
+    ["action"])
+
+
+def _slug(text):
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-") or "page"
+
+
+def site_slug(url):
+    """Return the file name (without .html) of a tracked site's page."""
+    digest = hashlib.blake2b(url.encode("utf-8"), digest_size=4).hexdigest()
+    return f"{_slug(re.sub(r'^https?://', '', url))[:80]}-{digest}"
+
+
+def _digest(value):
+    return hashlib.blake2b(json.dumps(value, sort_keys=True, default=str).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _records(entities, group):
+    return [record for record in entities.get(group, []) if isinstance(record, dict) and record.get("name")]
+
+
+def _entity_paths(entities):
+    """Return {(group, name): page path}, with unique file names within each group."""
+    paths = {}
+    for group, _, _ in GROUPS:
+        used = set()
+        for record in _records(entities, group):
+            slug = base = _slug(record["name"])
+            suffix = 2
+            while slug in used:
+                slug = f"{base}-{suffix}"
+                suffix += 1
+            used.add(slug)
+            paths[(group, record["name"])] = f"{group}/{slug}.html"
+    return paths
+
+
+def _site_entry(page):
+    """The parts of a stored page shown on the site's page (JSON types, compared between cycles)."""
+    fed = sorted({(entity["type"], entity["id"]) for entity in page["fed_entities"]})
+    return {"changed_at": page["changed_at"], "hash": page["hash"],
+            "fed": [list(key) for key in fed], "basic": page["entities"][:BASIC_ENTITIES_SHOWN]}
+
+
+# Page content, built in the export worker threads
+
+def _link(href, text):
+    return f"<a href='{html.escape(href)}'>{html.escape(text)}</a>"
+
+
+def _table(headers, rows, empty):
+    if not rows:
+        return f"<p>{empty}</p>"
+    head = "".join(f"<th>{header}</th>" for header in headers)
+    body = "".join("<tr>" + "".join(f"<td>{cell}</td>" for cell in row) + "</tr>" for row in rows)
+    return f"<table><tr>{head}</tr>{body}</table>"
+
+
+def _field(value):
+    if isinstance(value, str):
+        return _link(value, value) if value.startswith(("http://", "https://")) else html.escape(value)
+    if isinstance(value, list) and all(isinstance(item, str) for item in value):
+        return ", ".join(html.escape(item) for item in value)
+    if isinstance(value, (int, float)):
+        return str(value)
+    return None
+
+
+def _home_content(data):
+    rows = [(_link(f"{group}/index.html", title), str(count)) for group, title, count in data["groups"]]
+    rows.append((_link("sites/index.html", "Tracked Sites"), str(data["sites"])))
+    return ("<p>Federal Reserve officials, organizations, publications and tracked sites, "
+            "with the tracked pages that mention them.</p>" + _table(("Section", "Pages"), rows, ""))
+
+
+def _group_content(data):
+    headers = ("Name", "Details") + (("Tracked pages mentioning",) if data["tracked"] else ())
+    rows = []
+    for name, details, href, mentions in data["rows"]:
+        row = (_link(href, name), html.escape(details))
+        rows.append(row + ((str(mentions),) if data["tracked"] else ()))
+    return _table(headers, rows, "No entries in the knowledge base.")
+
+
+def _entity_content(data):
+    rows = []
+    for key, value in data["fields"]:
+        formatted = _field(value)
+        if formatted:
+            rows.append((html.escape(key.replace("_", " ").capitalize()), formatted))
+    content = "<h2>Details</h2>" + _table(("Field", "Value"), rows, "No details in the knowledge base.")
+    if data["mentions"] is not None:
+        content += "<h2>Mentioned On</h2>" + _table(
+            ("Tracked page", "Source"),
+            [(_link(href, url), _link(url, "open")) for url, href in data["mentions"]],
+            "Not mentioned on any tracked page.")
+    return content
+
+
+def _site_content(data):
+    entry = data["entry"]
+    if entry is None:
+        return f"<p>{_link(data['url'], data['url'])} has not been checked yet.</p>"
+    content = _table(("Field", "Value"), [
+        ("URL", _link(data["url"], data["url"])),
+        ("Last changed", html.escape(entry["changed_at"] or "never")),
+        ("Content hash", html.escape(entry["hash"] or "")),
+    ], "")
+    entities = [(f"<span class='{html.escape(kind)}'>{_link(href, name) if href else html.escape(name)}</span>",
+                 html.escape(kind)) for kind, name, href in data["entities"]]
+    content += "<h2>FED Entities</h2>" + _table(("Entity", "Type"), entities, "No FED entities on this page.")
+    basic = ", ".join(html.escape(text) for text in entry["basic"])
+    content += "<h2>Other Entities</h2>" + (f"<p>{basic}</p>" if basic else "<p>None.</p>")
+    return content
+
+
+def _sites_content(data):
+    rows = [(_link(href, url), html.escape(changed_at or "not checked yet"), str(count))
+            for url, href, changed_at, count in data["rows"]]
+    return _table(("Site", "Last changed", "FED entities"), rows, "No tracked sites.")
+
+
+_CONTENT = {"home": _home_content, "group": _group_content, "entity": _entity_content,
+            "site": _site_content, "sites": _sites_content}
+
+
+def _render_page(job):
+    """Render one page into its file (runs in the export worker threads)."""
+    template_path, path, title, root, kind, data, generated = job
+    text = load_template(template_path).render({"TITLE": html.escape(title), "ROOT": root,
+                                                "CONTENT": _CONTENT[kind](data), "GENERATION_TIME": generated})
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_atomic(path, text)
+    return path
+
+
+class StaticSiteExport:
+    """Static site with a page per FED entity and per tracked site, kept up to date incrementally.
+
+    Every page lists the data it was rendered from ("site:<url>" for a
+    stored page, "record:<group>/<name>" for a knowledge base entry,
+    "mentions:<type>/<name>" for the set of pages mentioning an entity,
+    "group:<group>" and "sites" for the lists behind the index pages). An
+    update reads the change log from where the previous one stopped,
+    compares the affected pages, knowledge base entries and the site list
+    with the manifest and re-renders only the pages depending on data that
+    changed, so its cost follows the size of the change. Batches of at
+    least `min_batch` pages are rendered by a pool of `workers` threads,
+    which overlap the file writes; each page is written atomically.
+
+    Args:
+        storage (Storage): Page store
+        change_log (ChangeLog): Log of changes
+        directory (str): Output directory of the site
+        template_dir (str): Directory holding site/page.html
+        manifest (str): JSON file recording each page's dependencies and the log position
+        workers (int): Rendering threads; 1 renders in the calling thread
+        min_batch (int): Fewest pages worth sending to the pool
+    """
+
+    def __init__(self, storage, change_log, directory=EXPORT_DIR, template_dir=TEMPLATE_DIR,
+                 manifest=MANIFEST_FILE, workers=DEFAULT_WORKERS, min_batch=DEFAULT_MIN_BATCH):
+        self.storage = storage
+        self.change_log = change_log
+        self.directory = directory
+        self.template_path = os.path.abspath(os.path.join(template_dir, LAYOUT_TEMPLATE))
+        self.manifest = manifest
+        self.workers = workers
+        self.min_batch = min_batch
+        self._state = None
+        self._state_mtime = None
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _load_state(self):
+        # Re-read only when another process (a new leader, the CLI) wrote the manifest
+        try:
+            mtime = os.stat(self.manifest).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if self._state is not None and mtime == self._state_mtime:
+            return self._state
+        try:
+            with open(self.manifest, "r") as f:
+                state = json.load(f)
+            if state["position"] is not None:
+                state["position"] = (date.fromisoformat(state["position"][0]), state["position"][1])
+        except Exception as e:
+            logger.error(f"Could not load export manifest {self.manifest}: {str(e)}")
+            return None
+        self._state, self._state_mtime = state, mtime
+        return state
+
+    def _save_state(self, state):
+        position = state["position"]
+        write_atomic(self.manifest, json.dumps(dict(state, position=[position[0].isoformat(), position[1]]
+                                                    if position is not None else None)))
+        self._state, self._state_mtime = state, os.stat(self.manifest).st_mtime_ns
+
+    def _update_site(self, state, url):
+        page = self.storage.get_page(url)
+        old = state["site_state"].get(url)
+        new = _site_entry(page) if page is not None else None
+        if new == old:
+            return set()
+        state["site_state"][url] = new
+        old_fed = {tuple(key) for key in (old or {}).get("fed", [])}
+        new_fed = {tuple(key) for key in (new or {}).get("fed", [])}
+        return {f"site:{url}"} | {f"mentions:{kind}/{name}" for kind, name in old_fed ^ new_fed}
+
+    def _update_records(self, state, entities):
+        records = {f"{group}/{record['name']}": _digest(record)
+                   for group, _, _ in GROUPS for record in _records(entities, group)}
+        dirty = set()
+        for key in records.keys() | state["records"].keys():
+            if records.get(key) != state["records"].get(key):
+                dirty.add(f"record:{key}")
+                if key not in records or key not in state["records"]:
+                    dirty.add(f"group:{key.split('/', 1)[0]}")
+        state["records"] = records
+        return dirty
+
+    def _plan(self, entities, state, paths):
+        """Return {page path: (dependencies, kind, key)} for every page of the site."""
+        plan = {"index.html": (["sites"] + [f"group:{group}" for group, _, _ in GROUPS], "home", None)}
+        for group, _, kind in GROUPS:
+            names = [record["name"] for record in _records(entities, group)]
+            mention_deps = [f"mentions:{kind}/{name}" for name in names] if kind else []
+            plan[f"{group}/index.html"] = ([f"group:{group}"] + [f"record:{group}/{name}" for name in names]
+                                           + mention_deps, "group", group)
+            for name in names:
+                plan[paths[(group, name)]] = ([f"record:{group}/{name}"] + ([f"mentions:{kind}/{name}"] if kind else []),
+                                              "entity", (group, name))
+        plan["sites/index.html"] = (["sites"] + [f"site:{url}" for url in state["sites"]], "sites", None)
+        for url in state["sites"]:
+            plan[f"sites/{site_slug(url)}.html"] = ([f"site:{url}"], "site", url)
+        return plan
+
+    def _context(self, kind, key, entities, state, paths, mentioned):
+        """Return (title, data) of one page."""
+        kinds = {kind: group for group, _, kind in GROUPS if kind}
+        if kind == "home":
+            return "FedLoad", {"groups": [(group, title, len(_records(entities, group))) for group, title, _ in GROUPS],
+                               "sites": len(state["sites"])}
+        if kind == "group":
+            group, title, entity_type = next(entry for entry in GROUPS if entry[0] == key)
+            rows = []
+            for record in _records(entities, key):
+                details = record.get("title") or record.get("full_name") or record.get("type") or record.get("description", "")
+                rows.append((record["name"], str(details), os.path.basename(paths[(key, record["name"])]),
+                             len(mentioned.get((entity_type, record["name"]), ()))))
+            return title, {"rows": rows, "tracked": entity_type is not None}
+        if kind == "entity":
+            group, name = key
+            entity_type = next(entry[2] for entry in GROUPS if entry[0] == group)
+            record = next(record for record in _records(entities, group) if record["name"] == name)
+            mentions = None
+            if entity_type:
+                mentions = [(url, f"../sites/{site_slug(url)}.html") for url in mentioned.get((entity_type, name), ())]
+            return name, {"fields": [(field, value) for field, value in record.items() if field not in _HIDDEN_FIELDS],
+                          "mentions": mentions}
+        if kind == "site":
+            entry = state["site_state"].get(key)
+            found = []
+            for entity_type, name in (entry or {}).get("fed", []):
+                path = paths.get((kinds.get(entity_type), name))
+                found.append((entity_type, name, f"../{path}" if path else None))
+            return key, {"url": key, "entry": entry, "entities": found}
+        rows = []
+        for url in state["sites"]:
+            entry = state["site_state"].get(url) or {}
+            rows.append((url, f"{site_slug(url)}.html", entry.get("changed_at"), len(entry.get("fed", []))))
+        return "Tracked Sites", {"rows": rows}
+
+    def _render(self, jobs):
+        if self.workers > 1 and len(jobs) >= self.min_batch:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="export")
+            return list(self._pool.map(_render_page, jobs))
+        return [_render_page(job) for job in jobs]
+
+    def update(self, entities, sites, full=False, now=None):
+        """Re-render the pages whose data changed since the last update.
+
+        Args:
+            entities (dict): Parsed fed_entities.json
+            sites (list): Tracked URLs
+            full (bool): Render every page, e.g. after editing the template
+            now (datetime): Generation time shown on the pages
+
+        Returns:
+            tuple: (pages written, pages removed)
+        """
+        now = now or datetime.now()
+        with self._lock:
+            started = time.perf_counter()
+            state = None if full else self._load_state()
+            if state is not None and not os.path.exists(os.path.join(self.directory, "index.html")):
+                state = None
+            dirty = set()
+            moved = False
+            if state is None:
+                # Entries logged after this position are applied again next time, which is harmless
+                state = {"position": self.change_log.end(), "sites": [], "site_state": {}, "records": {}, "pages": {}}
+                for page in self.storage.pages():
+                    state["site_state"][page["url"]] = _site_entry(page)
+            else:
+                position = state["position"]
+                entries, state["position"] = self.change_log.read_new(position)
+                for url in dict.fromkeys(entry["url"] for entry in entries if entry.get("changed")):
+                    dirty |= self._update_site(state, url)
+                moved = state["position"] != position
+            sites = list(dict.fromkeys(url for url in sites if url))
+            if sites != state["sites"]:
+                state["sites"] = sites
+                dirty.add("sites")
+            dirty |= self._update_records(state, entities)
+
+            paths = _entity_paths(entities)
+            plan = self._plan(entities, state, paths)
+            stale = [path for path, (deps, _, _) in plan.items()
+                     if state["pages"].get(path) != deps or dirty.intersection(deps)]
+            removed = [path for path in state["pages"] if path not in plan]
+            if not stale and not removed:
+                if moved:
+                    self._save_state(state)
+                return 0, 0
+
+            mentioned = {}
+            for url in state["sites"]:
+                for entity_type, name in (state["site_state"].get(url) or {}).get("fed", []):
+                    mentioned.setdefault((entity_type, name), []).append(url)
+            generated = now.strftime("%Y-%m-%d %H:%M:%S")
+            jobs = []
+            for path in stale:
+                _, kind, key = plan[path]
+                title, data = self._context(kind, key, entities, state, paths, mentioned)
+                root = "../" * path.count("/")
+                jobs.append((self.template_path, os.path.join(self.directory, path), title, root, kind, data, generated))
+            self._render(jobs)
+            for path in removed:
+                try:
+                    os.remove(os.path.join(self.directory, path))
+                except FileNotFoundError:
+                    pass
+
+            state["pages"] = {path: deps for path, (deps, _, _) in plan.items()}
+            self._save_state(state)
+            EXPORT_PAGES.labels(action="written").inc(len(jobs))
+            EXPORT_PAGES.labels(action="removed").inc(len(removed))
+            EXPORT_SECONDS.observe(time.perf_counter() - started)
+            return len(jobs), len(removed)
+
+    def close(self):
+        """Stop the rendering threads."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the FedLoad static site")
+    parser.add_argument("--directory", default=EXPORT_DIR, help="Output directory")
+    parser.add_argument("--database", default=STORAGE_FILE)
+    parser.add_argument("--manifest", default=MANIFEST_FILE)
+    parser.add_argument("--entities", default="fed_entities.json")
+    parser.add_argument("--sites", default="tracked_sites.json")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--full", action="store_true", help="Render every page, not only those whose data changed")
+    args = parser.parse_args()
+
+    with open(args.entities, "r") as f:
+        entities = json.load(f)
+    with open(args.sites, "r") as f:
+        sites = json.load(f).get("sites", [])
+    export = StaticSiteExport(Storage(args.database), ChangeLog(CHANGE_LOG_DIR, None), args.directory,
+                              manifest=args.manifest, workers=args.workers)
+    try:
+        written, removed = export.update(entities, sites, args.full)
+    finally:
+        export.close()
+    print(f"Wrote {written} pages and removed {removed} in {args.directory}/")
+
+
+if __name__ == "__main__":
+    main()
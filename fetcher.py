@@ -9,6 +9,8 @@ import paramiko
 from urllib.parse import urlparse
 import tempfile
 import logging
+from metrics import EXTRACTIONS, FETCHED_BYTES, NOT_MODIFIED, host_of, stage
+import tracing
 
 # Configure logging
 logging.basicConfig(
@@ -18,14 +20,28 @@ logging.basicConfig(
 )
 logger = logging.getLogger("fetcher")
 
-def fetch_page(url):
+class _NotModified:
+    """Falsy marker, so callers that only test for content treat it like a failed fetch."""
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return "PAGE_NOT_MODIFIED"
+
+# Returned instead of content when a conditional request found the page unchanged
+PAGE_NOT_MODIFIED = _NotModified()
+
+def fetch_page(url, validators=None):
     """Fetch content from a web page, local file, or FTP server.
     
     Args:
         url (str): URL, file path, or FTP URL to fetch
+        validators (dict): HTTP validators of the last fetch ('etag',
+            'last_modified'), see `fetch_http`
         
     Returns:
-        str: HTML content or None if failed
+        str: HTML content, PAGE_NOT_MODIFIED, or None if failed
     """
     # Parse the URL to determine the protocol
     parsed_url = urlparse(url)
@@ -46,11 +62,11 @@ def fetch_page(url):
     
     # 2. HTTP
     if scheme == "http":
-        return fetch_http(url)
+        return fetch_http(url, validators)
     
     # 3. HTTPS
     if scheme == "https":
-        return fetch_http(url)
+        return fetch_http(url, validators)
     
     # 4. FTP
     if scheme == "ftp":
@@ -162,27 +178,58 @@ def fetch_sftp(parsed_url):
         logger.error(f"Error fetching {protocol} file {parsed_url.geturl()}: {str(e)}")
         return None
 
-def fetch_http(url):
+def fetch_http(url, validators=None):
     """Fetch content from an HTTP/HTTPS URL.
     
+    With `validators`, the request is conditional (If-None-Match /
+    If-Modified-Since) and the dict is updated with the validators of a
+    full response.
+    
     Args:
         url (str): URL to fetch
+        validators (dict): 'etag' and 'last_modified' of the last fetch
         
     Returns:
-        str: HTML content or None if failed
+        str: HTML content, PAGE_NOT_MODIFIED if the server answered 304, or None if failed
     """
     try:
         headers = {
             "User-Agent": "FedLoad Monitor/1.0"
         }
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
+        if validators:
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                headers["If-Modified-Since"] = validators["last_modified"]
+        # "response" covers DNS, connect and time to headers; "download" the body
+        with stage("response", url):
+            response = requests.get(url, headers=headers, timeout=10, stream=True)
+            if response.status_code == 304 and validators:
+                response.close()
+                NOT_MODIFIED.labels(host=host_of(url)).inc()
+                tracing.annotate(not_modified=True)
+                logger.info(f"Not modified: {url}")
+                return PAGE_NOT_MODIFIED
+            response.raise_for_status()
+        if validators is not None:
+            validators.clear()
+            validators.update({"etag": response.headers.get("ETag"),
+                               "last_modified": response.headers.get("Last-Modified")})
+        with stage("download", url):
+            content = response.content
+        FETCHED_BYTES.labels(host=host_of(url)).inc(len(content))
+        tracing.annotate(bytes=len(content))
         logger.info(f"Successfully fetched HTTP URL: {url}")
-        return response.content
+        return content
     except Exception as e:
         logger.error(f"Error fetching HTTP URL {url}: {str(e)}")
         return None
 
+def record_extraction(method):
+    """Count which extraction method produced a page's text."""
+    EXTRACTIONS.labels(method=method).inc()
+    tracing.annotate(extraction_method=method)
+
 def extract_text(html, method="trafilatura"):
     """Extract main text content from HTML.
     
@@ -201,6 +248,7 @@ def extract_text(html, method="trafilatura"):
         text = trafilatura.extract(html, include_comments=False, include_tables=True, 
                                    include_links=False, include_images=False)
         if text:
+            record_extraction("trafilatura")
             return text
         # Fall back to other methods if trafilatura fails
     
@@ -210,6 +258,7 @@ def extract_text(html, method="trafilatura"):
             article = Article(url="")
             article.set_html(html)
             article.parse()
+            record_extraction("newspaper")
             return article.text
         except Exception:
             # Fall back to other methods
@@ -225,7 +274,9 @@ def extract_text(html, method="trafilatura"):
             h.skip_internal_links = True
             h.single_line_break = True
             h.ignore_emphasis = True
-            return h.handle(html.decode('utf-8') if isinstance(html, bytes) else html)
+            text = h.handle(html.decode('utf-8') if isinstance(html, bytes) else html)
+            record_extraction("html2text")
+            return text
         except Exception:
             # Fall back to BeautifulSoup
             pass
@@ -243,22 +294,41 @@ def extract_text(html, method="trafilatura"):
     chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
     text = '\n'.join(chunk for chunk in chunks if chunk)
     
+    record_extraction("bs4")
     return text
 
-def extract_main_content(url, method="trafilatura"):
+def extract_main_content(url, method="trafilatura", validators=None):
     """Fetch a page and extract its main content.
     
     Args:
         url (str): URL, file path, or FTP URL to fetch
         method (str): Method to use for extraction
+        validators (dict): HTTP validators for a conditional fetch, see `fetch_http`
         
     Returns:
-        dict: Dictionary with 'title', 'text', and 'meta' data
+        dict: Dictionary with 'title', 'text', and 'meta' data; 'not_modified'
+            is True when a conditional fetch found the page unchanged
     """
-    html = fetch_page(url)
+    html = fetch_page(url, validators)
+    if html is PAGE_NOT_MODIFIED:
+        return {"title": "", "text": "", "meta": {}, "not_modified": True}
     if not html:
         return {"title": "", "text": "", "meta": {}}
     
+    with stage("extraction", url):
+        return extract_content(html, url, method)
+
+def extract_content(html, url, method="trafilatura"):
+    """Extract the main content from an already fetched page.
+    
+    Args:
+        html (bytes): Page content
+        url (str): URL or path the content came from
+        method (str): Method to use for extraction
+        
+    Returns:
+        dict: Dictionary with 'title', 'text', and 'meta' data
+    """
     # Handle non-HTML files
     content_type = detect_content_type(html, url)
     if content_type != "html":
@@ -360,6 +430,7 @@ def process_non_html_file(content, content_type, url):
         # Simple text file handling
         try:
             text = content.decode('utf-8', errors='replace')
+            record_extraction("text")
             return {
                 "title": title,
                 "text": text,
@@ -377,6 +448,7 @@ def process_non_html_file(content, content_type, url):
             from pdfminer.high_level import extract_text as pdf_extract_text
             
             text = pdf_extract_text(io.BytesIO(content))
+            record_extraction("pdfminer")
             return {
                 "title": title,
                 "text": text,
@@ -0,0 +1,227 @@
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+logger = logging.getLogger("jobs")
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_PER_HOST = 1
+DEFAULT_JITTER_FRACTION = 0.1
+DEFAULT_MAX_JITTER = 60  # seconds
+DEFAULT_DEADLINE = 300  # seconds after the nominal due time
+
+JOB_LAG_SECONDS = metrics.Histogram(
+    "fedload_job_lag_seconds",
+    "Delay between a check's nominal due time and its start (jitter excluded)",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600))
+DEADLINE_MISSES = metrics.Counter(
+    "fedload_job_deadline_misses_total",
+    "Checks that started or finished after their deadline",
+    ["phase"])
+JOBS_QUEUED = metrics.Gauge(
+    "fedload_jobs_queued",
+    "Checks waiting in the scheduler queue")
+JOBS_RUNNING = metrics.Gauge(
+    "fedload_jobs_running",
+    "Checks currently running")
+
+
+class Job:
+    """One scheduled check of a URL.
+
+    `due` is when the check should happen, `run_at` the jittered start time
+    and `deadline` the latest acceptable completion time (all epoch seconds).
+    """
+
+    __slots__ = ("url", "due", "run_at", "deadline", "cancelled")
+
+    def __init__(self, url, due, run_at, deadline):
+        self.url = url
+        self.due = due
+        self.run_at = run_at
+        self.deadline = deadline
+        self.cancelled = False
+
+
+class JobScheduler:
+    """Time-ordered queue of per-URL checks run by a pool of workers.
+
+    Each URL has at most one queued job. A dispatcher thread starts jobs
+    whose (jittered) start time has passed, oldest first, as long as a
+    worker is free, the URL is not already running and its host has fewer
+    than `max_per_host` checks in flight. When a job finishes,
+    `next_delay(url, result)` says when the URL is due again and the job is
+    queued once more. Start delays beyond the nominal due time are observed
+    in `fedload_job_lag_seconds`; jobs that start or finish after their
+    deadline count in `fedload_job_deadline_misses_total`.
+
+    Args:
+        run (callable): run(url) performs one check and returns a result
+        next_delay (callable): next_delay(url, result) -> seconds until the next check
+        workers (int): Checks running at once
+        max_per_host (int): Checks running at once against the same host
+        jitter_fraction (float): Random start delay as a fraction of the URL's interval
+        max_jitter (float): Upper bound for the start delay in seconds
+        deadline (float): Seconds after the due time by which a check should be done
+    """
+
+    def __init__(self, run, next_delay, workers=DEFAULT_WORKERS, max_per_host=DEFAULT_MAX_PER_HOST,
+                 jitter_fraction=DEFAULT_JITTER_FRACTION, max_jitter=DEFAULT_MAX_JITTER,
+                 deadline=DEFAULT_DEADLINE):
+        self.run = run
+        self.next_delay = next_delay
+        self.workers = workers
+        self.max_per_host = max_per_host
+        self.jitter_fraction = jitter_fraction
+        self.max_jitter = max_jitter
+        self.deadline = deadline
+        self._heap = []
+        self._queued = {}
+        self._running = set()
+        self._cancelled = set()
+        self._hosts = {}
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._executor = None
+        self._dispatcher = None
+
+    def schedule(self, url, delay=0.0, interval=None):
+        """Queue a check of `url` due in `delay` seconds, replacing any queued one.
+
+        Args:
+            url (str): URL to check
+            delay (float): Seconds until the check is due
+            interval (float): The URL's check interval in seconds, used to size the jitter
+        """
+        due = time.time() + max(delay, 0.0)
+        spread = min((interval or 0) * self.jitter_fraction, self.max_jitter)
+        job = Job(url, due, due + random.uniform(0, spread), due + self.deadline)
+        with self._cond:
+            self._cancelled.discard(url)
+            previous = self._queued.get(url)
+            if previous is not None:
+                previous.cancelled = True
+            self._queued[url] = job
+            heapq.heappush(self._heap, (job.run_at, next(self._counter), job))
+            JOBS_QUEUED.set(len(self._queued))
+            self._cond.notify()
+
+    def cancel(self, url):
+        """Drop the queued check of `url`; a running one finishes but is not rescheduled."""
+        with self._cond:
+            job = self._queued.pop(url, None)
+            if job is not None:
+                job.cancelled = True
+                JOBS_QUEUED.set(len(self._queued))
+            self._cancelled.add(url)
+
+    def queued(self):
+        """Return {url: start time} of the queued jobs."""
+        with self._cond:
+            return {url: job.run_at for url, job in self._queued.items()}
+
+    def urls(self):
+        """Return the URLs that are queued or running."""
+        with self._cond:
+            return set(self._queued) | self._running
+
+    def start(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="check")
+        self._dispatcher = threading.Thread(target=self._dispatch, name="job-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def stop(self, wait=True):
+        """Stop starting jobs and, if `wait`, let the running ones finish."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._dispatcher is not None:
+            self._dispatcher.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+    def _runnable(self, job):
+        if job.url in self._running or len(self._running) >= self.workers:
+            return False
+        return self._hosts.get(metrics.host_of(job.url), 0) < self.max_per_host
+
+    def _next_job(self):
+        """Pop the earliest startable job, or return how long to wait (call with the lock held)."""
+        now = time.time()
+        deferred = []
+        try:
+            while self._heap:
+                run_at, _, job = self._heap[0]
+                if job.cancelled:
+                    heapq.heappop(self._heap)
+                    continue
+                if run_at > now:
+                    return None, run_at - now
+                heapq.heappop(self._heap)
+                if self._runnable(job):
+                    return job, 0
+                # Busy URL or host: try later jobs, keep this one at the front
+                deferred.append((run_at, next(self._counter), job))
+                if len(self._running) >= self.workers:
+                    break
+            return None, None
+        finally:
+            for entry in deferred:
+                heapq.heappush(self._heap, entry)
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopping:
+                        return
+                    job, wait = self._next_job()
+                    if job is not None:
+                        break
+                    # Woken early by new jobs and finished checks
+                    self._cond.wait(wait)
+                del self._queued[job.url]
+                self._running.add(job.url)
+                host = metrics.host_of(job.url)
+                self._hosts[host] = self._hosts.get(host, 0) + 1
+                JOBS_QUEUED.set(len(self._queued))
+                JOBS_RUNNING.set(len(self._running))
+            try:
+                self._executor.submit(self._execute, job, host)
+            except RuntimeError:
+                # The interpreter is shutting down
+                logger.warning(f"Not starting the check of {job.url}: executor shut down")
+                return
+
+    def _execute(self, job, host):
+        started = time.time()
+        JOB_LAG_SECONDS.observe(max(started - job.run_at, 0.0))
+        if started > job.deadline:
+            DEADLINE_MISSES.labels(phase="start").inc()
+        result = None
+        try:
+            result = self.run(job.url)
+        except Exception as e:
+            logger.error(f"Check of {job.url} failed: {str(e)}")
+        if time.time() > job.deadline:
+            DEADLINE_MISSES.labels(phase="finish").inc()
+        try:
+            delay = self.next_delay(job.url, result)
+        except Exception as e:
+            logger.error(f"Could not schedule the next check of {job.url}: {str(e)}")
+            delay = None
+        with self._cond:
+            self._running.discard(job.url)
+            self._hosts[host] -= 1
+            JOBS_RUNNING.set(len(self._running))
+            if delay is not None and job.url not in self._cancelled and not self._stopping:
+                # Condition locks are reentrant, so this cannot race with cancel()
+                self.schedule(job.url, delay, delay)
+            self._cond.notify()
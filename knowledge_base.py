@@ -0,0 +1,623 @@
+import argparse
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from array import array
+
+logger = logging.getLogger("knowledge_base")
+
+# File paths
+FED_ENTITIES_FILE = "fed_entities.json"
+FED_TERMS_FILE = "fed_terms.json"
+FED_KB_ARTIFACT = "fed_kb.bin"
+
+# Binary artifact layout: magic, format version, header length, JSON header,
+# then 4-byte aligned sections of little-endian uint32 arrays
+ARTIFACT_MAGIC = b"FEDKB"
+ARTIFACT_FORMAT = 1
+_PREAMBLE = struct.Struct("<5sHI")
+
+# How often (seconds) the manager stats the source files for changes
+DEFAULT_CHECK_INTERVAL = 2.0
+
+# Entity kinds and the spaCy labels used for them in the NLP pipeline
+LABELS = {
+    "person": "FED_PERSON",
+    "organization": "FED_ORG",
+    "publication": "FED_PUB",
+}
+KINDS_BY_LABEL = {label: kind for kind, label in LABELS.items()}
+
+
+def _surface_forms(kind, record):
+    """Return the surface forms of a record in match-priority order.
+
+    Args:
+        kind (str): 'person', 'organization', 'publication' or 'term'
+        record (dict): Knowledge base record
+
+    Returns:
+        list: Non-empty names, aliases, acronyms or full names
+    """
+    if kind == "person":
+        forms = [record.get("name", "")] + list(record.get("aliases", []))
+    elif kind == "publication":
+        forms = [record.get("name", ""), record.get("full_name", "")]
+    else:
+        forms = [record.get("name", ""), record.get("acronym", "")]
+    return [form for form in forms if form]
+
+
+def _trie_pattern(words):
+    """Build a regex that matches the longest of `words` at a position.
+
+    The alternation is factored into a character trie, so the regex engine
+    only follows the branch for the next character instead of trying every
+    alias at every position.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def node_pattern(node):
+        branches = [re.escape(ch) + node_pattern(child)
+                    for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            return "(?:" + body + ")?"
+        return body
+
+    return node_pattern(trie)
+
+
+class KnowledgeBase:
+    """Compiled, read-only form of fed_entities.json and fed_terms.json.
+
+    Holds the raw records, an alias -> record index per kind and a single
+    prebuilt matcher over every surface form. Instances are never mutated
+    after construction, so they can be shared between threads and swapped
+    out wholesale when the source files change.
+    """
+
+    KINDS = ("person", "organization", "publication", "term")
+
+    def __init__(self, fed_data, terms_data=None, version="empty"):
+        self.version = version
+        self._set_sources(fed_data, terms_data)
+
+        # surface forms per record, in match-priority order
+        self.forms = {kind: [_surface_forms(kind, record) for record in self.records[kind]]
+                      for kind in self.KINDS}
+        # surface form -> first record index, per kind
+        self.index = {kind: {} for kind in self.KINDS}
+        # surface form -> kinds that use it
+        self.alias_kinds = {}
+        for kind in self.KINDS:
+            for idx, forms in enumerate(self.forms[kind]):
+                for form in forms:
+                    self.index[kind].setdefault(form, idx)
+                    kinds = self.alias_kinds.setdefault(form, [])
+                    if kind not in kinds:
+                        kinds.append(kind)
+
+        aliases = sorted(self.alias_kinds)
+        alias_set = set(aliases)
+        # Aliases that are proper prefixes of a longer alias also occur
+        # wherever the longer one does; the matcher only reports the longest
+        self.prefixes = {
+            alias: [alias[:i] for i in range(1, len(alias)) if alias[:i] in alias_set]
+            for alias in aliases
+        }
+        self.pattern = "(?=(" + _trie_pattern(aliases) + "))" if aliases else ""
+        self._matcher = None
+
+    @classmethod
+    def from_parts(cls, version, forms, index, alias_kinds, prefixes, pattern, load_sources):
+        """Assemble a knowledge base from precompiled parts.
+
+        Used when loading a binary artifact: the indexes and matcher pattern
+        are taken as-is and the raw records are only decoded, through
+        `load_sources()`, the first time they are needed.
+        """
+        kb = cls.__new__(cls)
+        kb.version = version
+        kb.forms = forms
+        kb.index = index
+        kb.alias_kinds = alias_kinds
+        kb.prefixes = prefixes
+        kb.pattern = pattern
+        kb._matcher = None
+        kb._data = None
+        kb._records = None
+        kb._load_sources = load_sources
+        return kb
+
+    def _set_sources(self, fed_data, terms_data):
+        self._data = fed_data or {}
+        self._records = {
+            "person": list(self._data.get("people", [])),
+            "organization": list(self._data.get("organizations", [])),
+            "publication": list(self._data.get("publications", [])),
+            "term": list((terms_data or {}).get("terms", [])),
+        }
+        self._load_sources = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._set_sources(*self._load_sources())
+        return self._data
+
+    @property
+    def records(self):
+        if self._records is None:
+            self._set_sources(*self._load_sources())
+        return self._records
+
+    @property
+    def matcher(self):
+        # Compiled on first use; the regex engine cannot serialize it
+        if self._matcher is None and self.pattern:
+            self._matcher = re.compile(self.pattern)
+        return self._matcher
+
+    @property
+    def people(self):
+        return self.records["person"]
+
+    @property
+    def organizations(self):
+        return self.records["organization"]
+
+    @property
+    def publications(self):
+        return self.records["publication"]
+
+    @property
+    def events(self):
+        return self.data.get("events", [])
+
+    def find_all(self, text):
+        """Find every occurrence of every surface form, overlaps included.
+
+        Args:
+            text (str): Text to scan
+
+        Yields:
+            tuple: (start, end, surface_form)
+        """
+        if self.matcher is None or not text:
+            return
+        for match in self.matcher.finditer(text):
+            start = match.start()
+            alias = match.group(1)
+            yield start, start + len(alias), alias
+            for prefix in self.prefixes[alias]:
+                yield start, start + len(prefix), prefix
+
+    def find_spans(self, text, kinds=("person", "organization", "publication")):
+        """Find all occurrences of entity surface forms as labelled spans.
+
+        Args:
+            text (str): Text to scan
+            kinds (tuple): Entity kinds to report
+
+        Returns:
+            list: (start, end, label) tuples using the FED_* spaCy labels
+        """
+        spans = []
+        for start, end, alias in self.find_all(text):
+            for kind in self.alias_kinds[alias]:
+                if kind in kinds and kind in LABELS:
+                    spans.append((start, end, LABELS[kind]))
+        return spans
+
+    def lookup(self, kind, text):
+        """Return the first record of `kind` whose name or alias is `text`."""
+        idx = self.index.get(kind, {}).get(text)
+        return None if idx is None else self.records[kind][idx]
+
+    def describe(self, kind, text, record=None):
+        """Build the flat entity dict stored in entity_store.json.
+
+        Args:
+            kind (str): 'person', 'organization' or 'publication'
+            text (str): Surface form found in the text
+            record (dict): Matching record; looked up from `text` if omitted
+
+        Returns:
+            dict: Entity description with 'text', 'type', 'id' and kind fields
+        """
+        if record is None:
+            record = self.lookup(kind, text) or {}
+        if kind == "person":
+            return {
+                "text": text,
+                "type": "person",
+                "id": record.get("name", text),
+                "full_name": record.get("name", text),
+                "title": record.get("title", ""),
+                "organization": record.get("organization", "")
+            }
+        if kind == "organization":
+            return {
+                "text": text,
+                "type": "organization",
+                "id": record.get("name", text),
+                "full_name": record.get("name", text),
+                "acronym": record.get("acronym", ""),
+                "description": record.get("description", "")
+            }
+        return {
+            "text": text,
+            "type": "publication",
+            "id": record.get("name", text),
+            "full_name": record.get("full_name", record.get("name", text)),
+            "publishing_body": record.get("publishing_body", ""),
+            "description": record.get("description", "")
+        }
+
+    def extract_fed_entities(self, text):
+        """Return one entity per record that is mentioned anywhere in `text`.
+
+        For each record the first surface form (name, then aliases, acronym
+        or full name) present in the text is reported.
+
+        Args:
+            text (str): Text to scan
+
+        Returns:
+            list: Entity dicts in knowledge base order
+        """
+        found = {alias for _, _, alias in self.find_all(text)}
+        if not found:
+            return []
+
+        fed_entities = []
+        for kind in ("person", "organization", "publication"):
+            for idx, forms in enumerate(self.forms[kind]):
+                for form in forms:
+                    if form in found:
+                        fed_entities.append(self.describe(kind, form, self.records[kind][idx]))
+                        break
+        return fed_entities
+
+    def summary(self):
+        counts = {kind: len(self.forms[kind]) for kind in self.KINDS}
+        return (f"{counts['person']} people, {counts['organization']} organizations, "
+                f"{counts['publication']} publications and {counts['term']} terms")
+
+
+def entity_id(entity):
+    """Return the knowledge base ID of an entity dict.
+
+    The ID is the record's name, which `KnowledgeBase.lookup()` resolves
+    back to the record. Dicts created before IDs were added fall back to
+    their full name or surface form, which resolve the same way.
+    """
+    return entity.get("id") or entity.get("full_name") or entity["text"]
+
+
+def _read_json(path):
+    with open(path, "rb") as f:
+        raw = f.read()
+    return json.loads(raw), raw
+
+
+def load_knowledge_base(entities_file=FED_ENTITIES_FILE, terms_file=FED_TERMS_FILE):
+    """Read and compile the knowledge base from its JSON sources.
+
+    A missing terms file is treated as empty; a missing or invalid entities
+    file raises.
+
+    Returns:
+        KnowledgeBase: Compiled knowledge base
+    """
+    digest = hashlib.sha256()
+    fed_data, raw = _read_json(entities_file)
+    digest.update(raw)
+
+    terms_data = {}
+    if terms_file and os.path.exists(terms_file):
+        terms_data, raw = _read_json(terms_file)
+        digest.update(raw)
+
+    return KnowledgeBase(fed_data, terms_data, version=digest.hexdigest()[:16])
+
+
+def _source_signature(path):
+    try:
+        st = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _uint32_array(values):
+    arr = array("I", values)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _uint32_view(buf, offset, length):
+    view = memoryview(buf)[offset:offset + length]
+    if sys.byteorder == "little":
+        return view.cast("I")
+    arr = array("I", bytes(view))
+    arr.byteswap()
+    return arr
+
+
+def build_artifact(output_file=FED_KB_ARTIFACT, entities_file=FED_ENTITIES_FILE,
+                   terms_file=FED_TERMS_FILE):
+    """Compile the JSON knowledge base into a versioned binary artifact.
+
+    The artifact holds an interned string table, the alias -> record index,
+    per-record surface forms, the alias prefix table, the prebuilt matcher
+    pattern and the raw JSON records (decoded lazily on load). It is written
+    to a temporary file and renamed into place.
+
+    Returns:
+        KnowledgeBase: The knowledge base that was written
+    """
+    signatures = {"entities": _source_signature(entities_file),
+                  "terms": _source_signature(terms_file)}
+    kb = load_knowledge_base(entities_file, terms_file)
+
+    strings = []
+    string_ids = {}
+
+    def intern(value):
+        if value not in string_ids:
+            string_ids[value] = len(strings)
+            strings.append(value)
+        return string_ids[value]
+
+    kind_ids = {kind: i for i, kind in enumerate(KnowledgeBase.KINDS)}
+    pattern_id = intern(kb.pattern)
+
+    aliases = []
+    for kind in KnowledgeBase.KINDS:
+        for form, idx in kb.index[kind].items():
+            aliases += [intern(form), kind_ids[kind], idx]
+
+    forms = []
+    for kind in KnowledgeBase.KINDS:
+        forms.append(len(kb.forms[kind]))
+        for record_forms in kb.forms[kind]:
+            forms.append(len(record_forms))
+            forms += [intern(form) for form in record_forms]
+
+    prefixes = []
+    for alias, alias_prefixes in kb.prefixes.items():
+        prefixes += [intern(alias), len(alias_prefixes)] + [intern(p) for p in alias_prefixes]
+
+    encoded = [value.encode("utf-8") for value in strings]
+    offsets = [0]
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+    sections = {
+        "string_offsets": _uint32_array(offsets),
+        "strings": b"".join(encoded),
+        "aliases": _uint32_array(aliases),
+        "forms": _uint32_array(forms),
+        "prefixes": _uint32_array(prefixes),
+        "sources": json.dumps({"fed": kb.data, "terms": {"terms": kb.records["term"]}}).encode("utf-8"),
+    }
+
+    layout = {}
+    offset = 0
+    for name, payload in sections.items():
+        layout[name] = [offset, len(payload)]
+        offset += len(payload) + (-len(payload) % 4)
+    header = json.dumps({
+        "version": kb.version,
+        "sources": signatures,
+        "string_count": len(strings),
+        "pattern": pattern_id,
+        "sections": layout,
+    }).encode("utf-8")
+    header += b" " * (-(_PREAMBLE.size + len(header)) % 4)
+
+    tmp_file = f"{output_file}.tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(_PREAMBLE.pack(ARTIFACT_MAGIC, ARTIFACT_FORMAT, len(header)))
+        f.write(header)
+        for payload in sections.values():
+            f.write(payload)
+            f.write(b"\0" * (-len(payload) % 4))
+    os.replace(tmp_file, output_file)
+    return kb
+
+
+def load_artifact(artifact_file=FED_KB_ARTIFACT, entities_file=FED_ENTITIES_FILE,
+                  terms_file=FED_TERMS_FILE):
+    """Load a knowledge base from a binary artifact if it is current.
+
+    The file is memory-mapped; index arrays are read straight from the
+    mapping and the raw JSON records are only decoded when first needed.
+
+    Returns:
+        KnowledgeBase: Loaded knowledge base, or None if the artifact is
+        missing, has another format version or was built from different
+        source files
+    """
+    try:
+        with open(artifact_file, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        magic, fmt, header_len = _PREAMBLE.unpack_from(buf, 0)
+        if magic != ARTIFACT_MAGIC or fmt != ARTIFACT_FORMAT:
+            logger.warning(f"Ignoring {artifact_file}: unsupported artifact format")
+            return None
+        header = json.loads(bytes(buf[_PREAMBLE.size:_PREAMBLE.size + header_len]))
+        return _read_artifact(buf, header, header_len, artifact_file, entities_file, terms_file)
+    except (struct.error, ValueError, KeyError, IndexError) as e:
+        logger.warning(f"Ignoring {artifact_file}: unreadable artifact ({str(e)})")
+        return None
+
+
+def _read_artifact(buf, header, header_len, artifact_file, entities_file, terms_file):
+    current = {"entities": _source_signature(entities_file), "terms": _source_signature(terms_file)}
+    if header["sources"] != current:
+        logger.info(f"Ignoring {artifact_file}: built from older knowledge base files")
+        return None
+
+    base = _PREAMBLE.size + header_len
+    sections = {name: (base + offset, length) for name, (offset, length) in header["sections"].items()}
+
+    offsets = _uint32_view(buf, *sections["string_offsets"])
+    blob_start = sections["strings"][0]
+    strings = [sys.intern(str(buf[blob_start + offsets[i]:blob_start + offsets[i + 1]], "utf-8"))
+               for i in range(header["string_count"])]
+
+    kinds = KnowledgeBase.KINDS
+    index = {kind: {} for kind in kinds}
+    alias_kinds = {}
+    aliases = _uint32_view(buf, *sections["aliases"])
+    for i in range(0, len(aliases), 3):
+        form, kind = strings[aliases[i]], kinds[aliases[i + 1]]
+        index[kind][form] = aliases[i + 2]
+        alias_kinds.setdefault(form, []).append(kind)
+
+    forms = {}
+    values = _uint32_view(buf, *sections["forms"])
+    pos = 0
+    for kind in kinds:
+        count, pos = values[pos], pos + 1
+        forms[kind] = []
+        for _ in range(count):
+            n, pos = values[pos], pos + 1
+            forms[kind].append([strings[sid] for sid in values[pos:pos + n]])
+            pos += n
+
+    prefixes = {}
+    values = _uint32_view(buf, *sections["prefixes"])
+    pos = 0
+    while pos < len(values):
+        alias, n = strings[values[pos]], values[pos + 1]
+        prefixes[alias] = [strings[sid] for sid in values[pos + 2:pos + 2 + n]]
+        pos += 2 + n
+
+    def load_sources():
+        offset, length = sections["sources"]
+        sources = json.loads(bytes(buf[offset:offset + length]))
+        return sources["fed"], sources["terms"]
+
+    return KnowledgeBase.from_parts(header["version"], forms, index, alias_kinds,
+                                    prefixes, strings[header["pattern"]], load_sources)
+
+
+class KnowledgeBaseManager:
+    """Serve the current compiled knowledge base and hot-reload it on edit.
+
+    `get()` stats the source files at most every `check_interval` seconds.
+    When their mtimes change, one caller compiles a new KnowledgeBase while
+    the others keep getting the previous version, and it is then swapped in
+    with a single reference assignment, so callers holding the previous
+    version keep a consistent view. If the edited files fail to parse, the
+    previous version stays in service.
+
+    When `artifact_file` is given and the artifact was built from the
+    current sources, it is loaded instead of compiling the JSON.
+    """
+
+    def __init__(self, entities_file=FED_ENTITIES_FILE, terms_file=FED_TERMS_FILE,
+                 check_interval=DEFAULT_CHECK_INTERVAL, artifact_file=None):
+        self.entities_file = entities_file
+        self.terms_file = terms_file
+        self.artifact_file = artifact_file
+        self.check_interval = check_interval
+        self._kb = None
+        self._mtimes = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def _source_mtimes(self):
+        mtimes = []
+        for path in (self.entities_file, self.terms_file, self.artifact_file):
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except (OSError, TypeError):
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    def _compile(self):
+        if self.artifact_file:
+            kb = load_artifact(self.artifact_file, self.entities_file, self.terms_file)
+            if kb is not None:
+                return kb
+        return load_knowledge_base(self.entities_file, self.terms_file)
+
+    def get(self):
+        """Return the current KnowledgeBase, reloading it if the files changed."""
+        kb = self._kb
+        if kb is not None and time.monotonic() - self._last_check < self.check_interval:
+            return kb
+
+        with self._lock:
+            now = time.monotonic()
+            if self._kb is not None and now - self._last_check < self.check_interval:
+                return self._kb
+            self._last_check = now
+
+            mtimes = self._source_mtimes()
+            if self._kb is not None and mtimes == self._mtimes:
+                return self._kb
+
+            try:
+                new_kb = self._compile()
+            except Exception as e:
+                # Remember the failed mtimes so the next edit triggers a retry
+                self._mtimes = mtimes
+                if self._kb is None:
+                    logger.error(f"Could not load knowledge base from {self.entities_file}: {str(e)}")
+                    self._kb = KnowledgeBase({})
+                else:
+                    logger.error(f"Keeping knowledge base {self._kb.version}, reload failed: {str(e)}")
+                return self._kb
+
+            previous = self._kb
+            self._kb = new_kb
+            self._mtimes = mtimes
+            if previous is None:
+                logger.info(f"Loaded knowledge base {new_kb.version}: {new_kb.summary()}")
+            else:
+                logger.info(f"Reloaded knowledge base {previous.version} -> {new_kb.version}: {new_kb.summary()}")
+            return new_kb
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FedLoad knowledge base tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help=f"Compile the knowledge base into {FED_KB_ARTIFACT}")
+    build.add_argument("--entities", default=FED_ENTITIES_FILE)
+    build.add_argument("--terms", default=FED_TERMS_FILE)
+    build.add_argument("--output", default=FED_KB_ARTIFACT)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        kb = build_artifact(args.output, args.entities, args.terms)
+        print(f"Wrote {args.output} (version {kb.version}, {os.path.getsize(args.output)} bytes) "
+              f"with {kb.summary()} in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,32 @@
 # main.py
 
-from fastapi import FastAPI, Query, HTTPException
+from fastapi import FastAPI, Query, HTTPException, Request, Response, Header, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
 from fetcher import fetch_page, extract_text, extract_main_content
 from hasher import hash_content
 from diff import is_changed
+from knowledge_base import KnowledgeBaseManager, KINDS_BY_LABEL
+from annotator import annotate_doc, pipeline_profile
+from annotation_cache import AnnotationCache, cache_key, DEFAULT_DISK_ENTRIES
+from concurrency import AdmissionController, Saturated, SingleFlight
+from concurrent.futures import ThreadPoolExecutor
+from events import ChangeEventReader
+from entity_index import EntityIndex, load_entity_index, FED_TYPES, BASIC_TYPE, SORT_KEYS
+from search_index import SearchIndex
+from storage import Storage
+from metrics import REGISTRY, CONTENT_TYPE, Gauge, Histogram, stage
+import tracing
+from response_cache import ResponseCache, etag_matches
+import asyncio
+import threading
+import time
 import spacy
-from spacy.language import Language
-from spacy.tokens import Span
 from collections import Counter
 import json
 import os
 import re
 import uvicorn
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
 from datetime import datetime
@@ -23,6 +37,7 @@ class EntityResponse(BaseModel):
     type: str
     count: int
     sources: List[str]
+    last_seen: Optional[str] = None
 
 class PublicationResponse(BaseModel):
     name: str
@@ -31,6 +46,20 @@ class PublicationResponse(BaseModel):
     frequency: Optional[str] = None
     description: Optional[str] = None
     mentions: int
+    sources: List[str] = []
+    last_seen: Optional[str] = None
+
+class EntityPage(BaseModel):
+    total: int
+    offset: int
+    limit: int
+    items: List[EntityResponse]
+
+class PublicationPage(BaseModel):
+    total: int
+    offset: int
+    limit: int
+    items: List[PublicationResponse]
 
 class FedEntity(BaseModel):
     text: str
@@ -42,9 +71,28 @@ class FedEntity(BaseModel):
     description: Optional[str] = None
     publishing_body: Optional[str] = None
 
+class SearchResult(BaseModel):
+    url: str
+    site: str
+    time: str
+    hash: str
+    latest: bool
+    score: float
+    snippet: str
+
+class SearchPage(BaseModel):
+    total: int
+    offset: int
+    limit: int
+    items: List[SearchResult]
+
+class BatchCheckRequest(BaseModel):
+    urls: List[str]
+
 class CheckResponse(BaseModel):
     url: str
     basic_entities: List[str]
+    basic_entity_counts: Dict[str, int] = {}
     fed_entities: List[FedEntity]
     summary: str
 
@@ -57,7 +105,12 @@ nlp = spacy.load("en_core_web_sm")
 # Constants
 CONFIG_FILE = "config.json"
 ENTITIES_FILE = "entity_store.json"
+STORAGE_FILE = "fedload.db"
 FED_ENTITIES_FILE = "fed_entities.json"
+FED_TERMS_FILE = "fed_terms.json"
+FED_KB_ARTIFACT = "fed_kb.bin"
+CHANGE_EVENTS_FILE = "change_events.jsonl"
+ENTITY_INDEX_FILE = "entity_index.json"
 DAILY_REPORT = "daily_report.html"
 WEEKLY_SUMMARY = "weekly_summary.html"
 
@@ -79,6 +132,21 @@ try:
     timeout_seconds = monitoring_config.get("timeout_seconds", 10)
     user_agent = monitoring_config.get("user_agent", "FedLoad Monitor/1.0")
     
+    # Get annotation cache configuration
+    annotation_cache_config = config.get("caching", {}).get("annotations", {})
+    
+    # Get API concurrency configuration
+    api_config = config.get("api", {})
+    
+    # Get full-text search configuration
+    search_config = config.get("search", {})
+    
+    # Get storage configuration
+    storage_config = config.get("storage", {})
+    
+    # Get profiling configuration
+    profiling_config = config.get("profiling", {})
+    
     print(f"[{datetime.now().isoformat()}] Entity recognition: use_fed_entities={use_fed_entities}, enrich_existing={enrich_existing_entities}")
     print("Configuration loaded successfully")
 except Exception as e:
@@ -88,135 +156,54 @@ except Exception as e:
     enrich_existing_entities = True
     timeout_seconds = 10
     user_agent = "FedLoad Monitor/1.0"
+    annotation_cache_config = {}
+    api_config = {}
+    search_config = {}
+    storage_config = {}
+    profiling_config = {}
 
-# Load fed_entities.json for enhanced entity recognition
-try:
-    print(f"[{datetime.now().isoformat()}] Loading FED entities from {FED_ENTITIES_FILE}...")
-    with open(FED_ENTITIES_FILE, "r") as f:
-        fed_entities = json.load(f)
-    print(f"[{datetime.now().isoformat()}] Loaded {len(fed_entities['people'])} people, {len(fed_entities['organizations'])} organizations, and {len(fed_entities['publications'])} publications")
-except Exception as e:
-    print(f"[{datetime.now().isoformat()}] Warning: Could not load {FED_ENTITIES_FILE}: {e}")
-    fed_entities = {"people": [], "organizations": [], "publications": []}
+# Compiled knowledge base for enhanced entity recognition; edits to
+# fed_entities.json / fed_terms.json are picked up without a restart
+kb_manager = KnowledgeBaseManager(FED_ENTITIES_FILE, FED_TERMS_FILE, artifact_file=FED_KB_ARTIFACT)
+print(f"[{datetime.now().isoformat()}] Loaded knowledge base {kb_manager.get().version}: {kb_manager.get().summary()}")
 
-# Create a custom component for FED entity recognition
-@Language.component("fed_entity_recognizer")
-def fed_entity_recognizer(doc):
-    entities = []
-    
-    # Search for each person in the text
-    for person in fed_entities.get("people", []):
-        # Check full name
-        name = person["name"]
-        for match in find_all_occurrences(doc.text, name):
-            entities.append((match, match + len(name), "FED_PERSON"))
-        
-        # Check aliases
-        for alias in person.get("aliases", []):
-            for match in find_all_occurrences(doc.text, alias):
-                entities.append((match, match + len(alias), "FED_PERSON"))
-    
-    # Search for organizations
-    for org in fed_entities.get("organizations", []):
-        name = org["name"]
-        for match in find_all_occurrences(doc.text, name):
-            entities.append((match, match + len(name), "FED_ORG"))
-        
-        # Check acronyms
-        acronym = org.get("acronym", "")
-        if acronym:
-            for match in find_all_occurrences(doc.text, acronym):
-                entities.append((match, match + len(acronym), "FED_ORG"))
-    
-    # Search for publications - added FED_PUB type
-    for pub in fed_entities.get("publications", []):
-        # Check publication name
-        name = pub["name"]
-        for match in find_all_occurrences(doc.text, name):
-            entities.append((match, match + len(name), "FED_PUB"))
-        
-        # Check full name
-        full_name = pub.get("full_name", "")
-        if full_name:
-            for match in find_all_occurrences(doc.text, full_name):
-                entities.append((match, match + len(full_name), "FED_PUB"))
-
-    # Create Spans for the entities and add them to the document
-    spans = []
-    for start, end, label in entities:
-        # Skip if span is already part of an entity
-        if any(start >= e.start_char and end <= e.end_char for e in doc.ents):
-            continue
-        # Create and add the span
-        try:
-            span = Span(doc, doc.char_span(start, end).start, doc.char_span(start, end).end, label=label)
-            spans.append(span)
-        except Exception:
-            continue
-    
-    if spans:
-        try:
-            doc.ents = list(doc.ents) + spans
-        except Exception as e:
-            print(f"Error adding entities: {e}")
-    
-    return doc
-
-# Helper function to find all occurrences of a substring
-def find_all_occurrences(text, substring):
-    start = 0
-    while True:
-        start = text.find(substring, start)
-        if start == -1:
-            return
-        yield start
-        start += 1  # Move past this match
-
-# Add the custom component to the spaCy pipeline
-try:
-    if use_fed_entities and "fed_entity_recognizer" not in nlp.pipe_names:
-        nlp.add_pipe("fed_entity_recognizer", after="ner")
-        print("Added fed_entity_recognizer to NLP pipeline")
-except Exception as e:
-    print(f"Error adding fed_entity_recognizer to pipeline: {e}")
+# FED entities come from the knowledge base matcher in annotate_doc, which
+# reads doc.text only, so the pipeline needs no FED component of its own
 
 # Function to enrich entities with additional information
 def enrich_entity(ent):
-    if ent.label_ == "FED_PERSON":
-        for person in fed_entities.get("people", []):
-            if person["name"] == ent.text or ent.text in person.get("aliases", []):
-                return {
-                    "text": ent.text,
-                    "type": "person",
-                    "position": person.get("position", ""),
-                    "title": person.get("title", ""),
-                    "organization": person.get("organization", ""),
-                    "committees": person.get("committees", []),
-                    "roles": person.get("roles", [])
-                }
+    kind = KINDS_BY_LABEL.get(ent.label_)
+    record = kb_manager.get().lookup(kind, ent.text) if kind else None
+
+    if kind == "person" and record:
+        return {
+            "text": ent.text,
+            "type": "person",
+            "position": record.get("position", ""),
+            "title": record.get("title", ""),
+            "organization": record.get("organization", ""),
+            "committees": record.get("committees", []),
+            "roles": record.get("roles", [])
+        }
     
-    elif ent.label_ == "FED_ORG":
-        for org in fed_entities.get("organizations", []):
-            if org["name"] == ent.text or org.get("acronym", "") == ent.text:
-                return {
-                    "text": ent.text,
-                    "type": "organization",
-                    "acronym": org.get("acronym", ""),
-                    "district": org.get("district", ""),
-                    "description": org.get("description", "")
-                }
+    elif kind == "organization" and record:
+        return {
+            "text": ent.text,
+            "type": "organization",
+            "acronym": record.get("acronym", ""),
+            "district": record.get("district", ""),
+            "description": record.get("description", "")
+        }
     
-    elif ent.label_ == "FED_PUB":
-        for pub in fed_entities.get("publications", []):
-            if pub["name"] == ent.text or pub.get("full_name", "") == ent.text:
-                return {
-                    "text": ent.text,
-                    "type": "publication",
-                    "full_name": pub.get("full_name", ""),
-                    "frequency": pub.get("frequency", ""),
-                    "publishing_body": pub.get("publishing_body", ""),
-                    "related_topics": pub.get("related_topics", [])
-                }
+    elif kind == "publication" and record:
+        return {
+            "text": ent.text,
+            "type": "publication",
+            "full_name": record.get("full_name", ""),
+            "frequency": record.get("frequency", ""),
+            "publishing_body": record.get("publishing_body", ""),
+            "related_topics": record.get("related_topics", [])
+        }
     
     # Return basic entity info if no enrichment found
     return {
@@ -224,145 +211,467 @@ def enrich_entity(ent):
         "type": ent.label_
     }
 
+# Annotation cache shared with the scheduler: identical text skips NLP
+annotation_cache = None
+if annotation_cache_config.get("enabled", True):
+    annotation_cache = AnnotationCache(annotation_cache_config.get("directory", "annotation_cache"),
+                                       annotation_cache_config.get("memory_entries", 256),
+                                       annotation_cache_config.get("disk_entries", DEFAULT_DISK_ENTRIES))
+
+# /check runs fetch + extraction on a bounded I/O pool and NLP on its own
+# pool so the event loop stays responsive. spaCy shares one loaded model,
+# so NLP uses threads rather than processes; keep nlp_workers small.
+io_executor = ThreadPoolExecutor(max_workers=api_config.get("io_workers", 8),
+                                 thread_name_prefix="check-io")
+nlp_executor = ThreadPoolExecutor(max_workers=api_config.get("nlp_workers", 1),
+                                  thread_name_prefix="check-nlp")
+check_admission = AdmissionController(api_config.get("max_active_checks", 8),
+                                      api_config.get("max_queued_checks", 32),
+                                      api_config.get("queue_timeout_seconds", 15))
+# Concurrent /check calls for the same URL share one in-flight job
+check_flights = SingleFlight()
+max_batch_urls = api_config.get("max_batch_urls", 100)
+
+# API metrics, served with the shared fetch/extraction stage metrics on /metrics
+REQUEST_SECONDS = Histogram("fedload_api_request_seconds",
+                            "API request latency until response headers, per route", ["route", "status"])
+Gauge("fedload_api_checks_active", "Checks running in the API").set_function(lambda: check_admission.active)
+Gauge("fedload_api_checks_queued", "Checks waiting for a slot in the API").set_function(lambda: check_admission.waiting)
+
+# Response cache for /check, /entities and /publications; entries are
+# invalidated by the scheduler's change events and entity store writes
+response_cache = ResponseCache(api_config.get("cache_ttl_seconds",
+                                              {"check": 60, "entities": 30, "publications": 30}))
+change_events = ChangeEventReader(CHANGE_EVENTS_FILE)
+EVENT_POLL_INTERVAL = 1.0
+
+# Opt-in per-request traces for /check (and cProfile for a sample of them)
+tracer = tracing.Tracer(profiling_config.get("trace_file", tracing.TRACE_FILE),
+                        profiling_config.get("enabled", False),
+                        profiling_config.get("cprofile_sample_rate", 0.0))
+
+# Full-text index written by the scheduler
+search_index = None
+if search_config.get("enabled", True):
+    search_index = SearchIndex(search_config.get("database", "search_index.db"))
+
+# Live change feed over SSE and WebSocket
+feed_poll_interval = api_config.get("events_poll_interval_seconds", 0.5)
+feed_keepalive = api_config.get("events_keepalive_seconds", 15)
+
 stored_hashes = {}
 
-# Load persistent entities
-try:
-    with open(ENTITIES_FILE, "r") as f:
-        persistent_entities = json.load(f)
-except:
-    persistent_entities = {}
+# Per-URL state written by the scheduler; read concurrently thanks to WAL
+storage = Storage(storage_config.get("database", STORAGE_FILE))
+storage.migrate_json(ENTITIES_FILE)
+storage_version = storage.data_version()
+
+# Inverted entity index written by the scheduler; built from storage when
+# the scheduler has not saved one yet
+def load_index():
+    index = load_entity_index(ENTITY_INDEX_FILE)
+    if index is None:
+        index = EntityIndex.from_entity_store(storage.as_entity_store())
+    return index
+
+def entity_index_mtime():
+    try:
+        return os.stat(ENTITY_INDEX_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+entity_index_file_mtime = entity_index_mtime()
+entity_index = load_index()
+
+# Apply scheduler change events: drop stale cached responses and reload the
+# entity index when it was rewritten. Runs every EVENT_POLL_INTERVAL in a
+# background thread started with the app, so request handlers only read the
+# cache and index; the lock keeps two refreshes from applying the same events.
+refresh_lock = threading.Lock()
+refresher_stop = threading.Event()
+refresher_thread = None
+
+def refresh_from_events():
+    with refresh_lock:
+        _refresh_from_events()
+
+def _refresh_from_events():
+    global storage_version
+    global entity_index, entity_index_file_mtime
+    events = change_events.poll()
+    for event in events:
+        response_cache.invalidate("check", event.get("url"))
+    
+    index_mtime = entity_index_mtime()
+    version = storage.data_version()
+    # Without an index file the index is built from storage, so storage writes matter too
+    reloaded = False
+    if index_mtime != entity_index_file_mtime or (index_mtime is None and version != storage_version):
+        # Build the new index completely, then publish it with one reference
+        # swap; requests keep using the old one until then, or if loading fails
+        try:
+            index = load_index()
+        except Exception as e:
+            print(f"[{datetime.now().isoformat()}] ERROR reloading the entity index, keeping the current one: {str(e)}")
+        else:
+            entity_index = index
+            entity_index_file_mtime = index_mtime
+            storage_version = version
+            reloaded = True
+    if not events and not reloaded:
+        return
+    response_cache.invalidate("entities")
+    response_cache.invalidate("publications")
+
+def run_refresher():
+    while not refresher_stop.wait(EVENT_POLL_INTERVAL):
+        try:
+            refresh_from_events()
+        except Exception as e:
+            print(f"[{datetime.now().isoformat()}] ERROR applying change events: {str(e)}")
+
+# Build a JSON response from a cache entry, answering 304 when the client
+# already has this version
+def json_response(request, entry):
+    headers = {"ETag": entry.etag, "Cache-Control": f"max-age={entry.max_age()}"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+def cached_json(request, endpoint, build):
+    # Each combination of query parameters is cached separately
+    key = str(request.query_params) or None
+    entry = response_cache.get(endpoint, key)
+    if entry is None:
+        entry = response_cache.put(endpoint, key, jsonable_encoder(build()))
+    return json_response(request, entry)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    REQUEST_SECONDS.labels(route=getattr(route, "path", "unmatched"),
+                           status=response.status_code).observe(time.perf_counter() - start)
+    return response
+
+@app.on_event("startup")
+def on_startup():
+    global refresher_thread
+    refresher_stop.clear()
+    refresher_thread = threading.Thread(target=run_refresher, name="event-refresher", daemon=True)
+    refresher_thread.start()
 
 @app.on_event("shutdown")
 def on_shutdown():
     print("🌙 Gracefully shutting down API server...")
-    with open(ENTITIES_FILE, "w") as f:
-        json.dump(persistent_entities, f, indent=2)
+    refresher_stop.set()
+    io_executor.shutdown(wait=False, cancel_futures=True)
+    nlp_executor.shutdown(wait=False, cancel_futures=True)
+
+# Annotate extracted texts, reusing cached annotations and running the
+# remaining ones through nlp.pipe as one batch
+def annotate_texts_cached(texts, current_kb):
+    profile = pipeline_profile(nlp)
+    kb_version = current_kb.version if current_kb else "none"
+    keys = [cache_key(hash_content(text), profile, kb_version) for text in texts]
+    annotations = [annotation_cache.get(key) if annotation_cache else None for key in keys]
+    
+    missing = [i for i, annotation in enumerate(annotations) if annotation is None]
+    if missing:
+        # Process with NLP pipeline
+        with stage("nlp"):
+            docs = nlp.pipe([texts[i] for i in missing])
+            for i, doc in zip(missing, docs):
+                annotations[i] = annotate_doc(doc, current_kb)
+                if annotation_cache:
+                    annotation_cache.put(keys[i], annotations[i])
+    return annotations
+
+def annotate_text_cached(text, current_kb):
+    return annotate_texts_cached([text], current_kb)[0]
+
+def build_check_result(url, content_data, annotation):
+    # Generate summary (use provided summary or longest sentence)
+    summary = content_data.get("meta", {}).get("summary", "") or annotation["summary"]
+    
+    return {
+        "url": url,
+        "basic_entities": annotation["basic_entities"],
+        "basic_entity_counts": annotation["basic_entity_counts"],
+        "fed_entities": annotation["fed_entities"],
+        "summary": summary
+    }
+
+async def run_check(url):
+    async with check_admission:
+        loop = asyncio.get_running_loop()
+        with tracer.trace(url, "api"):
+            # Fetch and extract content
+            content_data = await loop.run_in_executor(io_executor,
+                                                      tracing.in_context(extract_main_content, url))
+            
+            if not content_data["text"]:
+                raise HTTPException(status_code=500, detail="Failed to extract content from URL")
+            
+            # Reuse the annotation if this exact text was already processed
+            current_kb = kb_manager.get() if use_fed_entities else None
+            annotation = await loop.run_in_executor(nlp_executor,
+                                                    tracing.in_context(annotate_text_cached,
+                                                                       content_data["text"], current_kb))
+            tracing.annotate(text_length=len(content_data["text"]),
+                             basic_entities=len(annotation["basic_entities"]),
+                             fed_entities=len(annotation["fed_entities"]))
+            return build_check_result(url, content_data, annotation)
+
+def is_checkable_url(url):
+    return bool(re.match(r'^https?://.*\.gov', url))
+
+def ndjson_line(payload):
+    return (json.dumps(jsonable_encoder(payload)) + "\n").encode("utf-8")
 
 @app.get("/check", response_model=CheckResponse)
-async def check_url(url: str = Query(..., description="FED website URL to check")):
-    if not re.match(r'^https?://.*\.gov', url):
+async def check_url(request: Request, url: str = Query(..., description="FED website URL to check")):
+    if not is_checkable_url(url):
         raise HTTPException(status_code=400, detail="URL must be a .gov site")
     
-    try:
-        # Use enhanced fetcher module
-        from fetcher import extract_main_content
-        
-        # Fetch and extract content
-        content_data = extract_main_content(url)
-        
-        if not content_data["text"]:
-            raise HTTPException(status_code=500, detail="Failed to extract content from URL")
-        
-        # Process with NLP pipeline
-        doc = nlp(content_data["text"])
-        
-        # Get basic entities (title-case words)
-        basic_entities = []
-        for sent in doc.sents:
-            for token in sent:
-                if token.is_alpha and token.is_title and len(token.text) > 1:
-                    basic_entities.append(token.text)
-        
-        # Remove duplicates
-        basic_entities = list(set(basic_entities))
-        
-        # Get FED-specific entities
-        fed_entities = []
-        for ent in doc.ents:
-            if ent.label_ in ["FED_PERSON", "FED_ORG", "FED_PUB"]:
-                entity_type = ent.label_.split("_")[1].lower()
-                if entity_type == "person":
-                    # Find the matching person in fed_entities.json
-                    matching_person = None
-                    if use_fed_entities:
-                        for person in fed_entities.get("people", []):
-                            if person["name"] == ent.text or ent.text in person.get("aliases", []):
-                                matching_person = person
-                                break
-                    
-                    fed_entities.append({
-                        "text": ent.text,
-                        "type": "person",
-                        "full_name": matching_person["name"] if matching_person else ent.text,
-                        "title": matching_person.get("title", "") if matching_person else "",
-                        "organization": matching_person.get("organization", "") if matching_person else ""
-                    })
-                elif entity_type == "org":
-                    # Find the matching organization in fed_entities.json
-                    matching_org = None
-                    if use_fed_entities:
-                        for org in fed_entities.get("organizations", []):
-                            if org["name"] == ent.text or org.get("acronym", "") == ent.text:
-                                matching_org = org
-                                break
-                    
-                    fed_entities.append({
-                        "text": ent.text,
-                        "type": "organization",
-                        "full_name": matching_org["name"] if matching_org else ent.text,
-                        "acronym": matching_org.get("acronym", "") if matching_org else "",
-                        "description": matching_org.get("description", "") if matching_org else ""
-                    })
-                elif entity_type == "pub":
-                    # Find the matching publication in fed_entities.json
-                    matching_pub = None
-                    if use_fed_entities:
-                        for pub in fed_entities.get("publications", []):
-                            if pub["name"] == ent.text or pub.get("full_name", "") == ent.text:
-                                matching_pub = pub
-                                break
-                    
-                    fed_entities.append({
-                        "text": ent.text,
-                        "type": "publication",
-                        "full_name": matching_pub.get("full_name", ent.text) if matching_pub else ent.text,
-                        "publishing_body": matching_pub.get("publishing_body", "") if matching_pub else "",
-                        "description": matching_pub.get("description", "") if matching_pub else ""
-                    })
-        
-        # Generate summary (use provided summary or longest sentence)
-        summary = content_data.get("meta", {}).get("summary", "")
-        if not summary:
-            longest_sent = ""
-            for sent in doc.sents:
-                if len(sent.text) > len(longest_sent):
-                    longest_sent = sent.text
-            summary = longest_sent
-        
-        return {
-            "url": url,
-            "basic_entities": basic_entities,
-            "fed_entities": fed_entities,
-            "summary": summary
-        }
+    entry = response_cache.get("check", url)
+    if entry is None:
+        try:
+            result = await check_flights.do(url, lambda: run_check(url))
+        except Saturated as e:
+            raise HTTPException(status_code=503, detail=f"Too many checks in progress: {str(e)}",
+                                headers={"Retry-After": "5"})
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error checking URL: {str(e)}")
+        entry = response_cache.put("check", url, jsonable_encoder(CheckResponse(**result)))
     
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error checking URL: {str(e)}")
+    return json_response(request, entry)
+
+def validate_sort(sort, order):
+    if sort not in SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(SORT_KEYS)}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be asc or desc")
+
+def entity_sources(entry):
+    return sorted(entry["urls"], key=lambda url: (-entry["urls"][url], url))
+
+def build_entities(entity_type, sort, descending, offset, limit):
+    total, entries = entity_index.query(entity_type, sort, descending, offset, limit)
+    items = [EntityResponse(entity=e["entity"], type=e["type"], count=e["count"],
+                            sources=entity_sources(e), last_seen=e["last_seen"])
+             for e in entries]
+    return EntityPage(total=total, offset=offset, limit=limit, items=items)
 
-@app.get("/entities", summary="Get all tracked entities")
-def get_entities():
-    return persistent_entities
+def build_publications(sort, descending, offset, limit):
+    total, entries = entity_index.query("publication", sort, descending, offset, limit)
+    kb = kb_manager.get()
+    items = []
+    for e in entries:
+        # The index keeps only the knowledge base ID; details come from the current knowledge base
+        record = kb.lookup("publication", e.get("id") or e["entity"]) or {}
+        items.append(PublicationResponse(name=e["entity"], full_name=record.get("full_name", record.get("name")),
+                                         publishing_body=record.get("publishing_body"),
+                                         frequency=record.get("frequency"),
+                                         description=record.get("description"),
+                                         mentions=len(e["urls"]), sources=entity_sources(e),
+                                         last_seen=e["last_seen"]))
+    return PublicationPage(total=total, offset=offset, limit=limit, items=items)
 
-@app.get("/publications", summary="Get all tracked FED publications")
-def get_publications():
-    all_publications = {}
+# Fetch every URL concurrently and annotate whatever has arrived with one
+# nlp.pipe call, yielding each result as soon as it is ready
+async def stream_batch(urls):
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Queue()
     
-    for url, entities in persistent_entities.items():
-        if "fed_publications" in entities:
-            for pub in entities["fed_publications"]:
-                if isinstance(pub, dict) and "text" in pub:
-                    pub_text = pub["text"]
-                    if pub_text not in all_publications:
-                        all_publications[pub_text] = {
-                            "info": pub,
-                            "mentioned_in": [url]
-                        }
+    async def fetch(url):
+        try:
+            content_data = await loop.run_in_executor(io_executor, extract_main_content, url)
+            if not content_data["text"]:
+                raise ValueError("Failed to extract content from URL")
+            await ready.put((url, content_data, None))
+        except Exception as e:
+            await ready.put((url, None, e))
+    
+    to_fetch = []
+    for url in urls:
+        if not is_checkable_url(url):
+            yield ndjson_line({"url": url, "ok": False, "status_code": 400, "error": "URL must be a .gov site"})
+            continue
+        entry = response_cache.get("check", url)
+        if entry is not None:
+            yield ndjson_line({"url": url, "ok": True, "result": json.loads(entry.body)})
+        else:
+            to_fetch.append(url)
+    
+    if not to_fetch:
+        return
+    
+    try:
+        async with check_admission:
+            for url in to_fetch:
+                asyncio.ensure_future(fetch(url))
+            
+            pending = len(to_fetch)
+            while pending:
+                batch = [await ready.get()]
+                while not ready.empty():
+                    batch.append(ready.get_nowait())
+                pending -= len(batch)
+                
+                fetched = []
+                for url, content_data, error in batch:
+                    if error is not None:
+                        yield ndjson_line({"url": url, "ok": False, "status_code": 500, "error": str(error)})
                     else:
-                        if url not in all_publications[pub_text]["mentioned_in"]:
-                            all_publications[pub_text]["mentioned_in"].append(url)
+                        fetched.append((url, content_data))
+                if not fetched:
+                    continue
+                
+                current_kb = kb_manager.get() if use_fed_entities else None
+                try:
+                    annotations = await loop.run_in_executor(
+                        nlp_executor, annotate_texts_cached,
+                        [content_data["text"] for _, content_data in fetched], current_kb)
+                except Exception as e:
+                    for url, _ in fetched:
+                        yield ndjson_line({"url": url, "ok": False, "status_code": 500, "error": str(e)})
+                    continue
+                
+                for (url, content_data), annotation in zip(fetched, annotations):
+                    result = jsonable_encoder(CheckResponse(**build_check_result(url, content_data, annotation)))
+                    response_cache.put("check", url, result)
+                    yield ndjson_line({"url": url, "ok": True, "result": result})
+    except Saturated as e:
+        for url in to_fetch:
+            yield ndjson_line({"url": url, "ok": False, "status_code": 503,
+                               "error": f"Too many checks in progress: {str(e)}"})
+
+@app.post("/check/batch", summary="Check several FED URLs, streaming NDJSON results")
+async def check_batch(body: BatchCheckRequest):
+    # Drop duplicates, keeping the first occurrence
+    urls = list(dict.fromkeys(body.urls))
+    if len(urls) > max_batch_urls:
+        raise HTTPException(status_code=400, detail=f"At most {max_batch_urls} URLs per batch")
+    if check_admission.saturated():
+        raise HTTPException(status_code=503, detail="Too many checks in progress",
+                            headers={"Retry-After": "5"})
+    return StreamingResponse(stream_batch(urls), media_type="application/x-ndjson")
+
+# Tail the change event journal from `offset` (the end of the journal if
+# None), yielding batches of new events; an empty batch is a keepalive.
+# Journal reads run in a worker thread, a bounded batch at a time, so a
+# client resuming from an old offset does not stall the event loop
+async def follow_events(offset):
+    reader = ChangeEventReader(CHANGE_EVENTS_FILE, offset)
+    idle = 0.0
+    while True:
+        events = await asyncio.to_thread(reader.poll)
+        if events or idle >= feed_keepalive:
+            idle = 0.0
+            yield events
+        else:
+            await asyncio.sleep(feed_poll_interval)
+            idle += feed_poll_interval
+
+async def sse_stream(request, offset):
+    async for events in follow_events(offset):
+        if await request.is_disconnected():
+            break
+        if not events:
+            yield ": keepalive\n\n"
+        for event in events:
+            yield f"id: {event['offset']}\nevent: {event.get('type', 'change')}\ndata: {json.dumps(event)}\n\n"
+
+@app.get("/events", summary="Stream change events (Server-Sent Events)")
+async def get_events(request: Request,
+                     offset: Optional[int] = Query(None, ge=0, description="Journal offset to resume from"),
+                     last_event_id: Optional[str] = Header(None)):
+    # A reconnecting EventSource sends the id of the last event it received,
+    # which is the journal offset just after that event
+    if offset is None and last_event_id and last_event_id.isdigit():
+        offset = int(last_event_id)
+    return StreamingResponse(sse_stream(request, offset), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.websocket("/ws/events")
+async def websocket_events(websocket: WebSocket,
+                           offset: Optional[int] = Query(None, ge=0, description="Journal offset to resume from")):
+    await websocket.accept()
+    
+    async def push():
+        try:
+            async for events in follow_events(offset):
+                for event in events:
+                    await websocket.send_json(event)
+                if not events:
+                    await websocket.send_json({"type": "keepalive"})
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            print(f"[{datetime.now().isoformat()}] ERROR in change feed: {str(e)}")
+            # The client's reply to the close ends the receive loop below
+            try:
+                await websocket.close(code=1011)
+            except Exception:
+                pass
     
-    return all_publications
+    # Clients only listen; reading here notices a disconnect immediately
+    # instead of at the next send
+    sender = asyncio.ensure_future(push())
+    try:
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+
+@app.get("/entities", response_model=EntityPage, summary="Get tracked entities, one page at a time")
+def get_entities(request: Request,
+                 entity_type: Optional[str] = Query(None, alias="type",
+                                                    description="basic, person, organization or publication"),
+                 sort: str = Query("count", description="count, urls, last_seen or entity"),
+                 order: str = Query("desc", description="asc or desc"),
+                 offset: int = Query(0, ge=0),
+                 limit: int = Query(50, ge=1, le=500)):
+    if entity_type is not None and entity_type not in (BASIC_TYPE,) + FED_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown entity type: {entity_type}")
+    validate_sort(sort, order)
+    return cached_json(request, "entities",
+                       lambda: build_entities(entity_type, sort, order == "desc", offset, limit))
+
+@app.get("/publications", response_model=PublicationPage, summary="Get tracked FED publications, one page at a time")
+def get_publications(request: Request,
+                     sort: str = Query("urls", description="count, urls, last_seen or entity"),
+                     order: str = Query("desc", description="asc or desc"),
+                     offset: int = Query(0, ge=0),
+                     limit: int = Query(50, ge=1, le=500)):
+    validate_sort(sort, order)
+    return cached_json(request, "publications",
+                       lambda: build_publications(sort, order == "desc", offset, limit))
+
+@app.get("/search", response_model=SearchPage, summary="Full-text search over extracted page content")
+def search(q: str = Query(..., min_length=1, description="Search terms; a trailing * matches prefixes"),
+           site: Optional[str] = Query(None, description="Host, e.g. www.federalreserve.gov"),
+           since: Optional[str] = Query(None, description="ISO date/time, inclusive"),
+           until: Optional[str] = Query(None, description="ISO date/time, exclusive"),
+           entity: Optional[str] = Query(None, description="Only pages mentioning this entity"),
+           latest: bool = Query(False, description="Only the current version of each page"),
+           offset: int = Query(0, ge=0),
+           limit: int = Query(20, ge=1, le=100)):
+    if search_index is None:
+        raise HTTPException(status_code=503, detail="Full-text search is disabled")
+    total, results = search_index.search(q, site=site, since=since, until=until, entity=entity,
+                                         latest_only=latest, offset=offset, limit=limit)
+    return SearchPage(total=total, offset=offset, limit=limit, items=results)
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
 
 @app.get("/config", summary="Get current configuration")
 def get_config():
@@ -371,12 +680,18 @@ def get_config():
         with open(CONFIG_FILE) as f:
             config_data = json.load(f)
         
-        # Remove any sensitive information if needed
-        if "notifications" in config_data and "on_change" in config_data["notifications"]:
-            if "email_recipients" in config_data["notifications"]["on_change"]:
-                config_data["notifications"]["on_change"]["email_recipients"] = [
-                    "***" if email else "" for email in config_data["notifications"]["on_change"]["email_recipients"]
-                ]
+        # Remove sensitive information: addresses, SMTP credentials and webhook
+        # URLs (which usually carry a token)
+        notifications = config_data.get("notifications", {})
+        for kind in ("on_change", "on_error"):
+            settings = notifications.get(kind, {})
+            for field in ("email_recipients", "webhook_urls"):
+                if field in settings:
+                    settings[field] = ["***" if value else "" for value in settings[field]]
+        smtp = notifications.get("smtp", {})
+        for field in ("username", "password"):
+            if smtp.get(field):
+                smtp[field] = "***"
         
         return config_data
     except Exception as e:
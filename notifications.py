@@ -0,0 +1,274 @@
+import heapq
+import itertools
+import logging
+import os
+import smtplib
+import threading
+import time
+from datetime import datetime
+from email.message import EmailMessage
+
+import requests
+
+import metrics
+
+logger = logging.getLogger("notifications")
+
+KINDS = ("on_change", "on_error")
+DEFAULT_WINDOW = 60  # seconds an event may wait to be coalesced with later ones
+DEFAULT_MAX_EVENTS = 100  # events per digest
+DEFAULT_MAX_PENDING = 10000  # buffered events per kind before the oldest are dropped
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_INITIAL_BACKOFF = 5  # seconds
+DEFAULT_MAX_BACKOFF = 300  # seconds
+SMTP_PASSWORD_ENV = "FEDLOAD_SMTP_PASSWORD"
+
+NOTIFICATIONS = metrics.Counter(
+    "fedload_notifications_total",
+    "Digest deliveries by sink and outcome (sent, retried, failed)",
+    ["kind", "sink", "outcome"])
+NOTIFICATION_EVENTS_DROPPED = metrics.Counter(
+    "fedload_notification_events_dropped_total",
+    "Events dropped because the notification buffer was full",
+    ["kind"])
+NOTIFICATIONS_PENDING = metrics.Gauge(
+    "fedload_notifications_pending",
+    "Events waiting to be sent in a digest")
+
+
+def format_digest(kind, events):
+    """Return the (subject, body) of a digest of `events`."""
+    sites = len({event["url"] for event in events})
+    if kind == "on_error":
+        subject = f"FedLoad: {len(events)} errors on {sites} sites"
+        lines = [f"- {event['time']} {event['url']}: {event.get('error', 'unknown error')}" for event in events]
+    else:
+        subject = f"FedLoad: {len(events)} changes on {sites} sites"
+        lines = []
+        for event in events:
+            found = event.get("entities_found", {})
+            mentions = [f"{label}: {', '.join(found[field])}" for field, label in
+                        (("fed_people", "people"), ("fed_organizations", "organizations"),
+                         ("fed_publications", "publications")) if found.get(field)]
+            lines.append(f"- {event['time']} {event['url']}" + (f" ({'; '.join(mentions)})" if mentions else ""))
+    return subject, "\n".join(lines) + "\n"
+
+
+class ConsoleSink:
+    """Prints digests to standard output."""
+
+    name = "console"
+
+    def send(self, kind, events):
+        subject, body = format_digest(kind, events)
+        print(f"[{datetime.now().isoformat()}] {subject}\n{body}", end="")
+
+
+class SmtpSink:
+    """Emails digests through an SMTP server.
+
+    Args:
+        recipients (list): Addresses to send to
+        host (str): SMTP server
+        port (int): SMTP port
+        sender (str): From address
+        username (str): Login name, if the server requires authentication
+        password (str): Password; read from FEDLOAD_SMTP_PASSWORD if omitted
+        starttls (bool): Upgrade the connection with STARTTLS
+        timeout (float): Seconds before a connection or command times out
+    """
+
+    name = "email"
+
+    def __init__(self, recipients, host="localhost", port=25, sender="fedload@localhost", username=None,
+                 password=None, starttls=False, timeout=10):
+        self.recipients = list(recipients)
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password or os.environ.get(SMTP_PASSWORD_ENV)
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def send(self, kind, events):
+        subject, body = format_digest(kind, events)
+        message = EmailMessage()
+        message["Subject"] = subject
+        message["From"] = self.sender
+        message["To"] = ", ".join(self.recipients)
+        message.set_content(body)
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password or "")
+            smtp.send_message(message)
+
+
+class WebhookSink:
+    """POSTs digests as JSON ({"kind", "subject", "events"}) to a URL.
+
+    Args:
+        url (str): Endpoint; any non-2xx response counts as a failure
+        timeout (float): Request timeout in seconds
+    """
+
+    name = "webhook"
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, kind, events):
+        subject, _ = format_digest(kind, events)
+        response = requests.post(self.url, json={"kind": kind, "subject": subject, "events": events},
+                                 timeout=self.timeout)
+        response.raise_for_status()
+
+
+def sinks_from_config(settings, smtp_settings=None):
+    """Build the sinks of one `notifications.on_change` / `on_error` block.
+
+    Args:
+        settings (dict): {"console", "email", "email_recipients", "webhook_urls"}
+        smtp_settings (dict): `notifications.smtp` block
+    """
+    smtp_settings = smtp_settings or {}
+    sinks = []
+    if settings.get("console", True):
+        sinks.append(ConsoleSink())
+    if settings.get("email", False) and settings.get("email_recipients"):
+        sinks.append(SmtpSink(settings["email_recipients"], smtp_settings.get("host", "localhost"),
+                              smtp_settings.get("port", 25), smtp_settings.get("sender", "fedload@localhost"),
+                              smtp_settings.get("username"), smtp_settings.get("password"),
+                              smtp_settings.get("starttls", False), smtp_settings.get("timeout_seconds", 10)))
+    for url in settings.get("webhook_urls", []):
+        sinks.append(WebhookSink(url, settings.get("webhook_timeout_seconds", 10)))
+    return sinks
+
+
+class NotificationDispatcher:
+    """Coalesces events into digests and delivers them from a background thread.
+
+    `publish()` only appends the event to an in-memory buffer, so checks
+    never wait for a mail server or webhook. The first event of a kind
+    opens a window of `window` seconds; when it closes (or `max_events`
+    are waiting) the buffered events go out as one digest to every sink of
+    that kind, so a burst of changes on FOMC day becomes a few messages. A
+    failed delivery is retried for that sink alone, after `initial_backoff`
+    seconds doubling up to `max_backoff`, and dropped after `max_attempts`.
+    If a sink stays down, events beyond `max_pending` per kind are dropped
+    oldest first.
+
+    Args:
+        sinks (dict): kind ("on_change", "on_error") -> list of sinks
+        window (float): Seconds to collect events into one digest
+        max_events (int): Events per digest
+        max_pending (int): Buffered events per kind
+        max_attempts (int): Delivery attempts per digest and sink
+        initial_backoff (float): Seconds before the first retry
+        max_backoff (float): Upper bound for the delay between retries
+    """
+
+    def __init__(self, sinks, window=DEFAULT_WINDOW, max_events=DEFAULT_MAX_EVENTS, max_pending=DEFAULT_MAX_PENDING,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, initial_backoff=DEFAULT_INITIAL_BACKOFF,
+                 max_backoff=DEFAULT_MAX_BACKOFF):
+        self.sinks = {kind: list(kind_sinks) for kind, kind_sinks in sinks.items() if kind_sinks}
+        self.window = window
+        self.max_events = max_events
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self._pending = {kind: [] for kind in self.sinks}
+        self._opened = {}
+        self._retries = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+    def enabled(self, kind):
+        return kind in self.sinks
+
+    def publish(self, kind, event):
+        """Queue an event (a dict with "url" and "time") for the next digest of `kind`."""
+        if kind not in self.sinks:
+            return
+        with self._cond:
+            pending = self._pending[kind]
+            pending.append(event)
+            if len(pending) > self.max_pending:
+                del pending[0]
+                NOTIFICATION_EVENTS_DROPPED.labels(kind=kind).inc()
+            self._opened.setdefault(kind, time.time())
+            NOTIFICATIONS_PENDING.set(sum(len(events) for events in self._pending.values()))
+            if len(pending) == 1 or len(pending) >= self.max_events:
+                # A new window or a full digest: the dispatcher may be sleeping until later
+                self._cond.notify()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="notifications", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """Send what is buffered and make a last attempt at pending retries, waiting at most `timeout` seconds."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _due_digests(self, now, flush):
+        """Take the digests whose window closed (call with the lock held)."""
+        digests = []
+        for kind, pending in self._pending.items():
+            while pending and (flush or len(pending) >= self.max_events or now - self._opened[kind] >= self.window):
+                digests.append((kind, pending[:self.max_events]))
+                del pending[:self.max_events]
+            if not pending:
+                self._opened.pop(kind, None)
+        if digests:
+            NOTIFICATIONS_PENDING.set(sum(len(events) for events in self._pending.values()))
+        return digests
+
+    def _next_wakeup(self, now):
+        times = [opened + self.window for opened in self._opened.values()]
+        if self._retries:
+            times.append(self._retries[0][0])
+        return max(min(times) - now, 0) if times else None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.time()
+                    work = [(kind, sink, events, 1) for kind, events in self._due_digests(now, self._stopping)
+                            for sink in self.sinks[kind]]
+                    while self._retries and (self._retries[0][0] <= now or self._stopping):
+                        _, _, kind, sink, events, attempt = heapq.heappop(self._retries)
+                        work.append((kind, sink, events, attempt))
+                    if work:
+                        break
+                    if self._stopping:
+                        return
+                    self._cond.wait(self._next_wakeup(now))
+            for kind, sink, events, attempt in work:
+                self._deliver(kind, sink, events, attempt, final=self._stopping)
+
+    def _deliver(self, kind, sink, events, attempt, final=False):
+        try:
+            sink.send(kind, events)
+            NOTIFICATIONS.labels(kind=kind, sink=sink.name, outcome="sent").inc()
+        except Exception as e:
+            if attempt >= self.max_attempts or final:
+                NOTIFICATIONS.labels(kind=kind, sink=sink.name, outcome="failed").inc()
+                logger.error(f"Dropping {kind} digest of {len(events)} events for {sink.name} "
+                             f"after {attempt} attempts: {str(e)}")
+                return
+            NOTIFICATIONS.labels(kind=kind, sink=sink.name, outcome="retried").inc()
+            delay = min(self.initial_backoff * 2 ** (attempt - 1), self.max_backoff)
+            logger.warning(f"Sending {kind} digest to {sink.name} failed ({str(e)}), retrying in {delay:.0f}s")
+            with self._cond:
+                heapq.heappush(self._retries, (time.time() + delay, next(self._counter), kind, sink, events, attempt + 1))
@@ -0,0 +1,233 @@
+import logging
+import math
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+logger = logging.getLogger("polling")
+
+POLLING_FILE = "fedload.db"
+DEFAULT_MIN_INTERVAL = 5  # minutes
+DEFAULT_MAX_INTERVAL = 1440  # minutes
+DEFAULT_HALF_LIFE_DAYS = 14
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS poll_state (
+    url TEXT PRIMARY KEY,
+    changes REAL NOT NULL,
+    exposure REAL NOT NULL,
+    updated_at TEXT NOT NULL,
+    checked_at TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _parse(value):
+    return datetime.fromisoformat(value.replace("Z", ""))
+
+
+class AdaptivePolling:
+    """Per-URL check intervals learned from how often each URL changes.
+
+    Each URL's changes are modelled as a Poisson process. Its rate is the
+    exponentially weighted number of changes divided by the equally
+    weighted time it was observed (in hours), so old history fades with
+    `half_life_days`. A check only shows whether the page changed at least
+    once since the last one, so a detected change is credited with the
+    expected number of changes behind it under the current rate; otherwise
+    pages checked rarely could never look busier than their interval. A
+    prior of one change per base interval keeps new URLs at the
+    fixed-frequency behaviour until evidence accumulates.
+
+    Intervals split a fixed budget of checks per hour (what checking every
+    URL every `base_interval` minutes costs) in proportion to the square
+    root of each URL's rate. That allocation minimizes the mean time from a
+    change to its detection; intervals are clamped to [min, max] and the
+    budget freed or used by clamped URLs is redistributed over the rest.
+
+    Args:
+        path (str): SQLite database file (shared with the page store)
+        base_interval (float): Fixed check frequency in minutes, defining the budget
+        min_interval (float): Shortest interval in minutes
+        max_interval (float): Longest interval in minutes
+        half_life_days (float): Age at which a change counts half as much
+    """
+
+    def __init__(self, path=POLLING_FILE, base_interval=30, min_interval=DEFAULT_MIN_INTERVAL,
+                 max_interval=DEFAULT_MAX_INTERVAL, half_life_days=DEFAULT_HALF_LIFE_DAYS):
+        self.path = path
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        # Decay time constant in hours
+        self.tau = half_life_days * 24 / math.log(2)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _decayed(self, state, now):
+        """Return (changes, exposure) decayed from the last update to `now`."""
+        hours = max((now - _parse(state["updated_at"])).total_seconds() / 3600, 0.0)
+        decay = math.exp(-hours / self.tau)
+        return state["changes"] * decay, state["exposure"] * decay + self.tau * (1 - decay)
+
+    def states(self):
+        return {row["url"]: dict(row) for row in self._conn().execute("SELECT * FROM poll_state")}
+
+    def record_check(self, url, changed, checked_at=None):
+        """Update a URL's change rate after a check.
+
+        Args:
+            url (str): Checked URL
+            changed (bool): Whether the content changed; None when the check
+                failed, which moves the next check without learning anything
+            checked_at (datetime): Time of the check; now if omitted
+        """
+        now = checked_at or datetime.now()
+        conn = self._conn()
+        with conn:
+            row = conn.execute("SELECT * FROM poll_state WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                # First observation: nothing is known about the time before it
+                changes, exposure, updated_at = 0.0, 0.0, now
+            elif changed is None:
+                changes, exposure, updated_at = row["changes"], row["exposure"], _parse(row["updated_at"])
+            else:
+                changes, exposure = self._decayed(row, now)
+                updated_at = now
+                if changed:
+                    rate = (changes + 1) / (exposure + self.base_interval / 60)
+                    since = _parse(row["checked_at"] or row["updated_at"])
+                    expected = rate * max((now - since).total_seconds() / 3600, 0.0)
+                    # Expected number of changes given that at least one happened
+                    changes += expected / -math.expm1(-expected) if expected > 1e-9 else 1
+            conn.execute(
+                """INSERT INTO poll_state (url, changes, exposure, updated_at, checked_at) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT (url) DO UPDATE SET changes = excluded.changes, exposure = excluded.exposure,
+                       updated_at = excluded.updated_at, checked_at = excluded.checked_at""",
+                (url, changes, exposure, updated_at.isoformat(), now.isoformat()))
+
+    def rate(self, state, now=None):
+        """Estimated changes per hour, including the prior."""
+        prior_hours = self.base_interval / 60
+        if state is None:
+            return 1 / prior_hours
+        changes, exposure = self._decayed(state, now or datetime.now())
+        return (changes + 1) / (exposure + prior_hours)
+
+    def intervals(self, urls, now=None):
+        """Return {url: check interval in minutes} for `urls`.
+
+        Args:
+            urls (list): URLs sharing the check budget
+            now (datetime): Time to evaluate rates at; now if omitted
+        """
+        now = now or datetime.now()
+        states = self.states()
+        weights = {url: math.sqrt(self.rate(states.get(url), now)) for url in urls}
+        intervals = {}
+        free = dict(weights)
+        budget = len(urls) / self.base_interval  # checks per minute
+        # Water-filling: clamp what falls outside the bounds, then share the
+        # remaining budget among the others
+        while free:
+            scale = budget / sum(free.values()) if budget > 0 else 0
+            clamped = {}
+            for url, weight in free.items():
+                interval = 1 / (scale * weight) if scale > 0 else self.max_interval
+                if interval < self.min_interval:
+                    clamped[url] = self.min_interval
+                elif interval > self.max_interval:
+                    clamped[url] = self.max_interval
+                else:
+                    intervals[url] = interval
+            if not clamped:
+                break
+            for url, interval in clamped.items():
+                intervals[url] = interval
+                budget -= 1 / interval
+                del free[url]
+            for url in free:
+                intervals.pop(url, None)
+        return intervals
+
+    def next_checks(self, urls, now=None, interval=None):
+        """Return {url: datetime of the next check}; never-checked URLs are due now.
+
+        Args:
+            urls (list): URLs sharing the check budget
+            now (datetime): Reference time; now if omitted
+            interval (float): Fixed interval in minutes to use instead of the learned ones
+        """
+        now = now or datetime.now()
+        states = self.states()
+        intervals = self.intervals(urls, now) if interval is None else dict.fromkeys(urls, interval)
+        next_checks = {}
+        for url in urls:
+            checked_at = states.get(url, {}).get("checked_at")
+            next_checks[url] = _parse(checked_at) + timedelta(minutes=intervals[url]) if checked_at else now
+        return next_checks
+
+    def due(self, urls, now=None):
+        """Return the URLs whose next check is due, most overdue first."""
+        now = now or datetime.now()
+        next_checks = self.next_checks(urls, now)
+        return sorted((url for url in urls if next_checks[url] <= now), key=lambda url: next_checks[url])
+
+    def backfill(self, entries, urls, now=None):
+        """Seed change rates from the change log, once.
+
+        Every URL is treated as observed since the oldest entry, each logged
+        change counting with its age-decayed weight.
+
+        Args:
+            entries (iterable): Change log entries, oldest first
+            urls (list): Tracked URLs
+            now (datetime): Reference time; now if omitted
+
+        Returns:
+            int: Number of URLs seeded (0 if already done)
+        """
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'polling_backfilled'").fetchone():
+            return 0
+        now = now or datetime.now()
+        first = None
+        changes = {url: 0.0 for url in urls}
+        for entry in entries:
+            try:
+                when = _parse(entry["time"])
+            except (KeyError, ValueError, AttributeError):
+                continue
+            first = when if first is None else min(first, when)
+            if entry.get("changed") and entry.get("url") in changes:
+                age = max((now - when).total_seconds() / 3600, 0.0)
+                changes[entry["url"]] += math.exp(-age / self.tau)
+
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('polling_backfilled', ?)",
+                         (now.isoformat(),))
+            if first is None:
+                return 0
+            span = max((now - first).total_seconds() / 3600, 0.0)
+            exposure = self.tau * (1 - math.exp(-span / self.tau))
+            # Seeded URLs have no check time yet, so they are all due now
+            conn.executemany(
+                """INSERT OR IGNORE INTO poll_state (url, changes, exposure, updated_at) VALUES (?, ?, ?, ?)""",
+                [(url, count, exposure, now.isoformat()) for url, count in changes.items()])
+        logger.info(f"Seeded change rates for {len(changes)} URLs from {span:.0f}h of change log")
+        return len(changes)
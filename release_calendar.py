@@ -0,0 +1,271 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from datetime import date, datetime, time as datetime_time, timedelta
+from zoneinfo import ZoneInfo
+
+from bs4 import BeautifulSoup
+
+import metrics
+
+logger = logging.getLogger("release_calendar")
+
+FOMC_CALENDAR_URL = "https://www.federalreserve.gov/monetarypolicy/fomccalendars.htm"
+RELEASE_CALENDAR_FILE = "release_calendar.json"
+DEFAULT_TIMEZONE = "America/New_York"
+DEFAULT_BEFORE = 5  # minutes before a release
+DEFAULT_AFTER = 30  # minutes after a release
+DEFAULT_BURST_INTERVAL = 15  # seconds
+DEFAULT_HORIZON_DAYS = 60
+
+# fed_entities.json groups whose entries may carry a "release" schedule
+RELEASE_GROUPS = ("events", "publications", "data_releases")
+
+MONTHS = {name: number for number, name in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), 1)}
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+_YEAR = re.compile(r"^(\d{4}) FOMC Meetings$", re.IGNORECASE)
+_MONTH = re.compile(r"^([A-Za-z]+)\.?(?:\s*/\s*([A-Za-z]+)\.?)?$")
+_DAYS = re.compile(r"^(\d{1,2})(?:\s*[-–]\s*(\d{1,2}))?(?!\d)")
+
+RELEASE_DETECTION_SECONDS = metrics.Histogram(
+    "fedload_release_detection_seconds",
+    "Time from a scheduled release to the detection of the change it caused",
+    buckets=(5, 15, 30, 60, 120, 300, 600, 1800))
+BURST_WINDOWS = metrics.Gauge(
+    "fedload_burst_windows_active",
+    "Release windows in which related URLs are being checked at the burst interval")
+
+
+def _month(name):
+    return MONTHS.get(name[:3].lower()) if name else None
+
+
+def parse_fomc_calendar(html):
+    """Return the (first day, last day) of every meeting listed on fomccalendars.htm.
+
+    The page has a panel per year headed "2025 FOMC Meetings" with a month
+    cell ("January", "Apr/May") and a day cell ("28-29", "30-1*") for each
+    meeting. A meeting spanning two months ends in the second one;
+    one-day entries such as notation votes have the same first and last day.
+
+    Args:
+        html (str): Page HTML (or its text)
+
+    Returns:
+        list: Sorted (date, date) tuples
+    """
+    text = BeautifulSoup(html, "html.parser").get_text("\n")
+    meetings = set()
+    year = None
+    months = None
+    for line in (line.strip() for line in text.splitlines()):
+        if not line:
+            continue
+        match = _YEAR.match(line)
+        if match:
+            year = int(match.group(1))
+            months = None
+            continue
+        if year is None:
+            continue
+        match = _MONTH.match(line)
+        if match and _month(match.group(1)):
+            first_month = _month(match.group(1))
+            months = (first_month, _month(match.group(2)) or first_month)
+            continue
+        match = _DAYS.match(line)
+        if match and months:
+            first_month, last_month = months
+            try:
+                first = date(year, first_month, int(match.group(1)))
+                last = date(year + (last_month < first_month), last_month, int(match.group(2) or match.group(1)))
+            except ValueError:
+                continue
+            meetings.add((first, last))
+            months = None
+    return sorted(meetings)
+
+
+def load_meetings(path=RELEASE_CALENDAR_FILE):
+    """Load meetings saved by `save_meetings()`; [] if there are none."""
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+        return [(date.fromisoformat(first), date.fromisoformat(last)) for first, last in data["fomc_meetings"]]
+    except FileNotFoundError:
+        return []
+    except Exception as e:
+        logger.error(f"Could not load release calendar {path}: {str(e)}")
+        return []
+
+
+def save_meetings(meetings, path=RELEASE_CALENDAR_FILE):
+    """Write the meeting dates atomically (temporary file + rename)."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump({"updated": datetime.now().isoformat(),
+                   "fomc_meetings": [[first.isoformat(), last.isoformat()] for first, last in meetings]}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class Release:
+    """One scheduled release: `at` is a naive local datetime."""
+
+    __slots__ = ("name", "at", "urls")
+
+    def __init__(self, name, at, urls):
+        self.name = name
+        self.at = at
+        self.urls = urls
+
+    def __repr__(self):
+        return f"Release({self.name!r}, {self.at.isoformat()})"
+
+
+def _release_days(spec, meetings, first, last):
+    basis = spec.get("basis")
+    if basis == "fomc":
+        # Statements follow the last meeting day; minutes and the Beige Book are offset from it
+        offset = timedelta(days=spec.get("offset_days", 0))
+        for start_day, end_day in meetings:
+            day = (start_day if spec.get("anchor") == "start" else end_day) + offset
+            if first <= day <= last:
+                yield day
+    elif basis in ("weekly", "weekdays"):
+        weekdays = range(5) if basis == "weekdays" else [WEEKDAYS.index(spec["weekday"].lower())]
+        day = first
+        while day <= last:
+            if day.weekday() in weekdays:
+                yield day
+            day += timedelta(days=1)
+    for value in spec.get("dates", []):
+        day = date.fromisoformat(value)
+        if first <= day <= last:
+            yield day
+
+
+def expand_releases(entities, meetings, start, end, timezone=DEFAULT_TIMEZONE):
+    """Return the releases between `start` and `end` from fed_entities.json.
+
+    Entries in the events, publications and data_releases groups may have a
+    "release" object: "time" (HH:MM in "timezone", default US Eastern),
+    "urls" to watch and either "basis": "fomc" (with optional "offset_days"
+    and "anchor": "start" or "end" of the meeting), "basis": "weekly" with a
+    "weekday", "basis": "weekdays", or explicit "dates" (YYYY-MM-DD).
+
+    Args:
+        entities (dict): Parsed fed_entities.json
+        meetings (list): (first day, last day) of the FOMC meetings
+        start (datetime): Start of the range (naive local time)
+        end (datetime): End of the range (naive local time)
+        timezone (str): Default time zone of release times
+
+    Returns:
+        list: Releases sorted by time
+    """
+    releases = []
+    for group in RELEASE_GROUPS:
+        for entry in entities.get(group, []):
+            spec = entry.get("release") if isinstance(entry, dict) else None
+            if not isinstance(spec, dict) or not spec.get("urls"):
+                continue
+            try:
+                zone = ZoneInfo(spec.get("timezone", timezone))
+                hour, minute = map(int, spec.get("time", "14:00").split(":"))
+                days = set(_release_days(spec, meetings, start.date() - timedelta(days=1), end.date() + timedelta(days=1)))
+            except (ValueError, KeyError) as e:
+                logger.error(f"Invalid release schedule for {entry.get('name')}: {str(e)}")
+                continue
+            for day in days:
+                at = datetime.combine(day, datetime_time(hour, minute), zone).astimezone().replace(tzinfo=None)
+                if start <= at < end:
+                    releases.append(Release(entry.get("name", ""), at, list(spec["urls"])))
+    return sorted(releases, key=lambda release: release.at)
+
+
+class BurstPolling:
+    """Frequent checks of release URLs in a window around each scheduled release.
+
+    From `before` minutes ahead of a release until `after` minutes past it,
+    the release's URLs are checked every `interval` seconds instead of at
+    their normal interval. The first change seen after the release time
+    ends that URL's window early, so a burst costs a few dozen conditional
+    requests per release.
+
+    Args:
+        before (float): Minutes before a release to start checking frequently
+        after (float): Minutes after a release to keep checking frequently
+        interval (float): Seconds between checks within a window
+    """
+
+    def __init__(self, before=DEFAULT_BEFORE, after=DEFAULT_AFTER, interval=DEFAULT_BURST_INTERVAL):
+        self.before = timedelta(minutes=before)
+        self.after = timedelta(minutes=after)
+        self.interval = interval
+        self.releases = []
+        self._windows = {}
+        self._detected = set()
+        self._lock = threading.Lock()
+
+    def update(self, releases):
+        """Replace the known releases."""
+        windows = {}
+        for release in releases:
+            for url in release.urls:
+                windows.setdefault(url, []).append((release.at - self.before, release.at + self.after, release))
+        for url_windows in windows.values():
+            url_windows.sort(key=lambda window: window[0])
+        cutoff = datetime.now() - self.after
+        with self._lock:
+            self.releases = list(releases)
+            self._windows = windows
+            self._detected = {key for key in self._detected if key[1] >= cutoff}
+
+    def _open_windows(self, url, now):
+        for start, end, release in self._windows.get(url, ()):
+            if end > now and (url, release.at) not in self._detected:
+                yield start, end, release
+
+    def record_check(self, url, changed, now=None):
+        """Note a check of `url`; a change after a release ends its window."""
+        if not changed:
+            return
+        now = now or datetime.now()
+        with self._lock:
+            for start, end, release in list(self._open_windows(url, now)):
+                if release.at <= now <= end:
+                    self._detected.add((url, release.at))
+                    seconds = (now - release.at).total_seconds()
+                    RELEASE_DETECTION_SECONDS.observe(seconds)
+                    logger.info(f"{release.name} detected on {url} {seconds:.0f}s after release")
+
+    def next_delay(self, url, delay, now=None):
+        """Return the seconds until `url`'s next check, shortened by release windows.
+
+        Args:
+            url (str): Checked URL
+            delay (float): Seconds until the next check at the normal interval
+            now (datetime): Reference time; now if omitted
+        """
+        now = now or datetime.now()
+        with self._lock:
+            for start, end, release in self._open_windows(url, now):
+                if start <= now:
+                    return min(delay, self.interval)
+                return min(delay, (start - now).total_seconds())
+        return delay
+
+    def active(self, now=None):
+        """Return the releases whose window is open for at least one URL."""
+        now = now or datetime.now()
+        with self._lock:
+            active = {(release.name, release.at): release for url in self._windows
+                      for start, end, release in self._open_windows(url, now) if start <= now}
+        BURST_WINDOWS.set(len(active))
+        return sorted(active.values(), key=lambda release: release.at)
@@ -0,0 +1,222 @@
+import html
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+import metrics
+
+logger = logging.getLogger("reports")
+
+TEMPLATE_DIR = "templates"
+DAILY_REPORT = "daily_report.html"
+WEEKLY_SUMMARY = "weekly_summary.html"
+DAILY_TOP = 10
+WEEKLY_TOP = 5
+
+# Template slots look like <!-- CHANGES_CONTENT -->
+_SLOT = re.compile(r"<!--\s*([A-Z][A-Z0-9_]*)\s*-->")
+
+REPORT_SECONDS = metrics.Histogram(
+    "fedload_report_seconds",
+    "Time to render a report from the aggregates",
+    ["report"])
+REPORT_WRITES = metrics.Counter(
+    "fedload_report_writes_total",
+    "Report files rewritten because their content changed",
+    ["report"])
+
+
+class Template:
+    """A report template compiled once into literal text and named slots.
+
+    Slots are HTML comments such as `<!-- CHANGES_CONTENT -->`; rendering
+    joins the literal parts with the slot values, so nothing is searched
+    or replaced per render and the template file itself is never written.
+
+    Args:
+        text (str): Template source
+    """
+
+    def __init__(self, text):
+        parts = _SLOT.split(text)
+        self._literals = parts[0::2]
+        self.slots = parts[1::2]
+
+    def render(self, values):
+        """Fill every slot from `values` (a dict of HTML strings); KeyError on a missing one."""
+        out = [self._literals[0]]
+        for slot, literal in zip(self.slots, self._literals[1:]):
+            out.append(values[slot])
+            out.append(literal)
+        return "".join(out)
+
+
+_compiled = {}
+
+
+def load_template(path):
+    """Return the compiled template at `path`, compiling it again only when the file changed."""
+    mtime = os.stat(path).st_mtime_ns
+    cached = _compiled.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, "r", encoding="utf-8") as f:
+            cached = (mtime, Template(f.read()))
+        _compiled[path] = cached
+    return cached[1]
+
+
+def write_atomic(path, text):
+    """Replace `path` with `text` through a temporary file, so readers never see a partial report."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _link(url):
+    return f"<a href='{html.escape(url)}'>{html.escape(url)}</a>"
+
+
+def _list(items, empty, tag="ul"):
+    if not items:
+        return f"<p>{empty}</p>"
+    return f"<{tag}>" + "".join(f"<li>{item}</li>" for item in items) + f"</{tag}>"
+
+
+def _mentions(rows, empty, tag="ul"):
+    return _list([f"{html.escape(entity)} - {count} mentions" for entity, count in rows], empty, tag)
+
+
+class RecentChanges:
+    """Changes logged in the last `window`, kept current by tailing the change log.
+
+    Each `refresh()` reads only the lines appended since the previous one,
+    including lines written by other worker processes, and drops changes
+    that left the window.
+
+    Args:
+        change_log (ChangeLog): Log to follow
+        window (timedelta): How far back to keep changes
+    """
+
+    def __init__(self, change_log, window=timedelta(days=1)):
+        self.change_log = change_log
+        self.window = window
+        self._changes = deque()
+        self._position = None
+
+    def refresh(self, now=None):
+        """Read newly logged changes and return [(time, url)] within the window, oldest first."""
+        now = now or datetime.now()
+        since = now - self.window
+        if self._position is None:
+            # Start with the segments that can still hold changes in the window
+            self._position = (since.date(), 0)
+        entries, self._position = self.change_log.read_new(self._position)
+        for entry in entries:
+            if entry.get("changed"):
+                moment = datetime.fromisoformat(entry["time"].replace("Z", ""))
+                if moment >= since:
+                    self._changes.append((moment, entry["url"]))
+        while self._changes and self._changes[0][0] < since:
+            self._changes.popleft()
+        return [change for change in self._changes if change[0] <= now]
+
+
+class ReportEngine:
+    """Renders the daily report and weekly summary from the current aggregates.
+
+    Templates are read from `template_dir` and compiled once (again only if
+    the file changes); reports are written to `output_dir`, so templates
+    and output never share a file. Mention and change counts come from the
+    rollups and the daily list of changes from a tail of the change log, so
+    an update costs a few indexed queries whatever the size of the history
+    and can run after every cycle. A report is only rewritten, atomically,
+    when its data changed since it was last written, or when forced (the
+    scheduled runs, so the generation time moves on even on quiet days).
+
+    Args:
+        rollups (MentionRollups): Mention and change counters
+        change_log (ChangeLog): Log of changes
+        template_dir (str): Directory of daily_report.html and weekly_summary.html templates
+        output_dir (str): Directory the reports are written to
+    """
+
+    def __init__(self, rollups, change_log, template_dir=TEMPLATE_DIR, output_dir="."):
+        self.rollups = rollups
+        self.template_dir = template_dir
+        self.output_dir = output_dir
+        self.recent_changes = RecentChanges(change_log)
+        self._written = {}
+        self._lock = threading.Lock()
+
+    def template(self, name):
+        """Return the compiled template `name`."""
+        return load_template(os.path.join(self.template_dir, name))
+
+    def _write(self, name, values, now, force=False):
+        path = os.path.join(self.output_dir, name)
+        if not force and self._written.get(name) == values and os.path.exists(path):
+            return False
+        text = self.template(name).render(dict(values, GENERATION_TIME=now.strftime("%Y-%m-%d %H:%M:%S")))
+        write_atomic(path, text)
+        self._written[name] = values
+        REPORT_WRITES.labels(report=name).inc()
+        return True
+
+    def daily_values(self, now):
+        since = now - timedelta(days=1)
+        changes = self.recent_changes.refresh(now)
+        people = [(entity, count) for entity, _, count in self.rollups.mentions(since, now, "person", limit=DAILY_TOP)]
+        publications = [(entity, count) for entity, _, count in
+                        self.rollups.mentions(since, now, "publication", limit=DAILY_TOP)]
+        return {
+            "CHANGES_CONTENT": _list([f"{_link(url)} - {moment.strftime('%Y-%m-%d %H:%M:%S')}" for moment, url in changes],
+                                     "No changes detected in the last 24 hours."),
+            "OFFICIALS_CONTENT": _mentions(people, "No FED officials mentioned in the last 24 hours."),
+            "PUBLICATIONS_CONTENT": _mentions(publications, "No FED publications mentioned in the last 24 hours."),
+        }
+
+    def weekly_values(self, now):
+        since = now - timedelta(days=7)
+        sites = self.rollups.changes(since, now)
+        people = [(entity, count) for entity, _, count in self.rollups.mentions(since, now, "person")]
+        publications = [(entity, count) for entity, _, count in self.rollups.mentions(since, now, "publication")]
+        return {
+            "TOTAL_CHANGES": str(sum(count for _, count in sites)),
+            "ACTIVE_SITES": str(len(sites)),
+            "OFFICIALS_COUNT": str(len(people)),
+            "PUBLICATIONS_COUNT": str(len(publications)),
+            "ACTIVE_SITES_CONTENT": _list([f"{_link(site)} - {count} changes" for site, count in sites[:WEEKLY_TOP]],
+                                          "No site activity this week.", "ol"),
+            "OFFICIALS_CONTENT": _mentions(people[:WEEKLY_TOP], "No FED officials mentioned this week.", "ol"),
+            "PUBLICATIONS_CONTENT": _mentions(publications[:WEEKLY_TOP], "No FED publications mentioned this week.", "ol"),
+        }
+
+    def update_daily(self, now=None, force=False):
+        """Render the daily report (rewritten even if unchanged when `force`); returns whether the file was rewritten."""
+        now = now or datetime.now()
+        with self._lock:
+            started = time.perf_counter()
+            values = self.daily_values(now)
+            REPORT_SECONDS.labels(report=DAILY_REPORT).observe(time.perf_counter() - started)
+            return self._write(DAILY_REPORT, values, now, force)
+
+    def update_weekly(self, now=None, force=False):
+        """Render the weekly summary (rewritten even if unchanged when `force`); returns whether the file was rewritten."""
+        now = now or datetime.now()
+        with self._lock:
+            started = time.perf_counter()
+            values = self.weekly_values(now)
+            REPORT_SECONDS.labels(report=WEEKLY_SUMMARY).observe(time.perf_counter() - started)
+            return self._write(WEEKLY_SUMMARY, values, now, force)
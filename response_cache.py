@@ -0,0 +1,86 @@
+import hashlib
+import json
+import threading
+import time
+
+
+class CachedResponse:
+    """A serialized response body with its validator and expiry time."""
+
+    __slots__ = ("body", "etag", "expires")
+
+    def __init__(self, body, etag, expires):
+        self.body = body
+        self.etag = etag
+        self.expires = expires
+
+    def max_age(self):
+        return max(0, int(self.expires - time.monotonic()))
+
+
+def make_etag(body):
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """Evaluate an If-None-Match header against an ETag (weak comparison)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+class ResponseCache:
+    """In-memory cache of JSON response bodies per endpoint.
+
+    Each endpoint has its own TTL in seconds; an endpoint with a TTL of 0
+    (or missing from `ttls`) is not cached. Bodies are serialized once on
+    `put()` and tagged with a content-derived ETag, so unchanged payloads
+    keep the same ETag across refreshes and clients can revalidate with
+    If-None-Match.
+    """
+
+    def __init__(self, ttls):
+        self.ttls = dict(ttls)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def enabled(self, endpoint):
+        return self.ttls.get(endpoint, 0) > 0
+
+    def get(self, endpoint, key=None):
+        """Return the fresh cached response, or None."""
+        with self._lock:
+            entry = self._entries.get((endpoint, key))
+            if entry is None:
+                return None
+            if entry.expires <= time.monotonic():
+                del self._entries[(endpoint, key)]
+                return None
+            return entry
+
+    def put(self, endpoint, key, payload):
+        """Serialize and cache a JSON-compatible payload.
+
+        Returns:
+            CachedResponse: The entry, also returned when caching is disabled
+        """
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        entry = CachedResponse(body, make_etag(body), time.monotonic() + self.ttls.get(endpoint, 0))
+        if self.enabled(endpoint):
+            with self._lock:
+                self._entries[(endpoint, key)] = entry
+        return entry
+
+    def invalidate(self, endpoint=None, key=None):
+        """Drop cached entries for an endpoint (optionally one key), or all."""
+        with self._lock:
+            if endpoint is None:
+                self._entries.clear()
+            elif key is None:
+                for cached_key in [k for k in self._entries if k[0] == endpoint]:
+                    del self._entries[cached_key]
+            else:
+                self._entries.pop((endpoint, key), None)
@@ -0,0 +1,249 @@
+import logging
+import sqlite3
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+logger = logging.getLogger("rollups")
+
+ROLLUPS_FILE = "fedload.db"
+DEFAULT_HOURLY_RETENTION_DAYS = 14
+
+HOUR = "hour"
+DAY = "day"
+
+# change log field -> entity type
+ENTITY_FIELDS = {
+    "basic": "basic",
+    "fed_people": "person",
+    "fed_organizations": "organization",
+    "fed_publications": "publication"
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS mention_rollups (
+    granularity TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    entity TEXT NOT NULL,
+    type TEXT NOT NULL,
+    site TEXT NOT NULL,
+    mentions INTEGER NOT NULL,
+    PRIMARY KEY (granularity, bucket, entity, type, site)
+);
+CREATE TABLE IF NOT EXISTS change_rollups (
+    granularity TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    site TEXT NOT NULL,
+    changes INTEGER NOT NULL,
+    PRIMARY KEY (granularity, bucket, site)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _hour_key(moment):
+    return moment.strftime("%Y-%m-%dT%H")
+
+
+def _day_key(moment):
+    return moment.strftime("%Y-%m-%d")
+
+
+def _floor_hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _ceil_hour(moment):
+    floored = _floor_hour(moment)
+    return floored if floored == moment else floored + timedelta(hours=1)
+
+
+def _midnight(moment):
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class MentionRollups:
+    """Hourly and daily counters of entity mentions and changes per site.
+
+    Every logged change adds its mentions (entity x type x site) and one
+    change for its site to the hour and the day it happened in. Queries sum
+    daily buckets for the whole days of a window and hourly buckets for the
+    partial days at either end, so their cost depends on the window length
+    in days, not on how many changes were logged. Windows are rounded out
+    to whole hours. Hourly buckets are dropped after `hourly_retention_days`
+    (windows reaching further back are rounded out to whole days); daily
+    buckets are kept.
+
+    Args:
+        path (str): SQLite database file (shared with the page store)
+        hourly_retention_days (int): Days of hourly buckets to keep
+    """
+
+    def __init__(self, path=ROLLUPS_FILE, hourly_retention_days=DEFAULT_HOURLY_RETENTION_DAYS):
+        self.path = path
+        self.hourly_retention_days = hourly_retention_days
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, entry):
+        """Count one change log entry; entries without a change are ignored."""
+        self.add_many([entry])
+
+    def add_many(self, entries):
+        """Count change log entries in a single transaction.
+
+        Returns:
+            int: Number of changes counted
+        """
+        return self._add(entries)
+
+    def _add(self, entries, backfilled=False):
+        mentions = Counter()
+        changes = Counter()
+        counted = 0
+        for entry in entries:
+            if not entry.get("changed"):
+                continue
+            try:
+                moment = datetime.fromisoformat(entry["time"].replace("Z", ""))
+                site = entry["url"]
+            except (KeyError, ValueError, AttributeError):
+                continue
+            counted += 1
+            buckets = ((HOUR, _hour_key(moment)), (DAY, _day_key(moment)))
+            found = entry.get("entities_found", {})
+            for granularity, bucket in buckets:
+                changes[(granularity, bucket, site)] += 1
+                for field, entity_type in ENTITY_FIELDS.items():
+                    for entity in found.get(field, []):
+                        mentions[(granularity, bucket, entity, entity_type, site)] += 1
+        conn = self._conn()
+        with conn:
+            if backfilled:
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rollups_backfilled', ?)",
+                             (datetime.now().isoformat(),))
+            conn.executemany(
+                """INSERT INTO mention_rollups (granularity, bucket, entity, type, site, mentions)
+                   VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (granularity, bucket, entity, type, site)
+                   DO UPDATE SET mentions = mentions + excluded.mentions""",
+                [key + (count,) for key, count in mentions.items()])
+            conn.executemany(
+                """INSERT INTO change_rollups (granularity, bucket, site, changes)
+                   VALUES (?, ?, ?, ?)
+                   ON CONFLICT (granularity, bucket, site)
+                   DO UPDATE SET changes = changes + excluded.changes""",
+                [key + (count,) for key, count in changes.items()])
+        return counted
+
+    def _ranges(self, since, until):
+        """Split [since, until) into (granularity, first key, end key) ranges."""
+        until = until or datetime.now()
+        start = _floor_hour(since)
+        end = _ceil_hour(until)
+        hourly_cutoff = _midnight(datetime.now()) - timedelta(days=self.hourly_retention_days)
+        if start < hourly_cutoff:
+            # Hourly buckets are gone that far back; round out to whole days
+            start = _midnight(start)
+        if end < hourly_cutoff and end != _midnight(end):
+            end = _midnight(end) + timedelta(days=1)
+
+        first_day = start if start == _midnight(start) else _midnight(start) + timedelta(days=1)
+        last_day = _midnight(end)
+        if first_day >= last_day:
+            return [(HOUR, _hour_key(start), _hour_key(end))]
+        ranges = [(DAY, _day_key(first_day), _day_key(last_day))]
+        if start < first_day:
+            ranges.append((HOUR, _hour_key(start), _hour_key(first_day)))
+        if last_day < end:
+            ranges.append((HOUR, _hour_key(last_day), _hour_key(end)))
+        return ranges
+
+    def _window(self, since, until):
+        clauses = []
+        params = []
+        for granularity, first, end in self._ranges(since, until):
+            clauses.append("(granularity = ? AND bucket >= ? AND bucket < ?)")
+            params += [granularity, first, end]
+        return "(" + " OR ".join(clauses) + ")", params
+
+    def mentions(self, since, until=None, entity_type=None, site=None, limit=None):
+        """Return (entity, type, mentions) in the window, most mentioned first.
+
+        Args:
+            since (datetime): Start of the window
+            until (datetime): End of the window; now if omitted
+            entity_type (str): Only this type (basic, person, organization, publication)
+            site (str): Only mentions on this URL
+            limit (int): Maximum number of rows
+        """
+        where, params = self._window(since, until)
+        if entity_type is not None:
+            where += " AND type = ?"
+            params.append(entity_type)
+        if site is not None:
+            where += " AND site = ?"
+            params.append(site)
+        sql = f"""SELECT entity, type, SUM(mentions) AS total FROM mention_rollups
+                  WHERE {where} GROUP BY entity, type ORDER BY total DESC, entity"""
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [tuple(row) for row in self._conn().execute(sql, params)]
+
+    def changes(self, since, until=None, limit=None):
+        """Return (site, changes) in the window, most active first."""
+        where, params = self._window(since, until)
+        sql = f"""SELECT site, SUM(changes) AS total FROM change_rollups
+                  WHERE {where} GROUP BY site ORDER BY total DESC, site"""
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [tuple(row) for row in self._conn().execute(sql, params)]
+
+    def enforce_retention(self, now=None):
+        """Delete hourly buckets older than the retention window.
+
+        Returns:
+            int: Number of rows removed
+        """
+        if self.hourly_retention_days is None:
+            return 0
+        cutoff = _hour_key(_midnight(now or datetime.now()) - timedelta(days=self.hourly_retention_days))
+        conn = self._conn()
+        with conn:
+            removed = conn.execute("DELETE FROM mention_rollups WHERE granularity = ? AND bucket < ?",
+                                   (HOUR, cutoff)).rowcount
+            removed += conn.execute("DELETE FROM change_rollups WHERE granularity = ? AND bucket < ?",
+                                    (HOUR, cutoff)).rowcount
+        return removed
+
+    def backfill(self, entries):
+        """Count existing change log entries, once.
+
+        Args:
+            entries (iterable): Change log entries, e.g. `ChangeLog.read()`
+
+        Returns:
+            int: Number of changes counted (0 if already backfilled)
+        """
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'rollups_backfilled'").fetchone():
+            return 0
+        counted = self._add(entries, backfilled=True)
+        if counted:
+            logger.info(f"Backfilled mention rollups from {counted} logged changes")
+        return counted
@@ -1,27 +1,56 @@
+import argparse
 import json
 import time
 import os
 import signal
 import sys
 import schedule
-from datetime import datetime, time as datetime_time
-from threading import Event
+from datetime import datetime, timedelta, time as datetime_time
+from threading import Event, Lock, Timer
 import hashlib
 import requests
 from bs4 import BeautifulSoup
 import re
+from knowledge_base import KnowledgeBaseManager
+from annotator import annotate_doc, annotate_text, pipeline_profile
+from annotation_cache import AnnotationCache, cache_key, DEFAULT_DISK_ENTRIES
+from doc_store import DocStore, add_fed_spans
+from events import publish_change, trim_events
+from entity_index import EntityIndex, load_entity_index, save_entity_index
+from search_index import SearchIndex
+from storage import Storage
+from change_log import ChangeLog, CHANGE_LOG_DIR, DEFAULT_RETENTION_DAYS
+from checkpoint import CycleCheckpoint, CHECKPOINT_FILE
+from rollups import MentionRollups, DEFAULT_HOURLY_RETENTION_DAYS
+from polling import AdaptivePolling, DEFAULT_MIN_INTERVAL, DEFAULT_MAX_INTERVAL, DEFAULT_HALF_LIFE_DAYS
+from sharding import WorkerRegistry, WorkerPool, OWNED_SITES, DEFAULT_HEARTBEAT, DEFAULT_LEASE_TIMEOUT, DEFAULT_VIRTUAL_NODES
+from release_calendar import (BurstPolling, expand_releases, load_meetings, parse_fomc_calendar, save_meetings,
+                              FOMC_CALENDAR_URL, RELEASE_CALENDAR_FILE, DEFAULT_BEFORE, DEFAULT_AFTER,
+                              DEFAULT_BURST_INTERVAL, DEFAULT_HORIZON_DAYS)
+from reports import ReportEngine, TEMPLATE_DIR
+from export import StaticSiteExport, EXPORT_DIR, MANIFEST_FILE, DEFAULT_WORKERS as EXPORT_WORKERS
+from notifications import (NotificationDispatcher, sinks_from_config, KINDS, DEFAULT_WINDOW, DEFAULT_MAX_EVENTS,
+                           DEFAULT_MAX_ATTEMPTS, DEFAULT_INITIAL_BACKOFF, DEFAULT_MAX_BACKOFF)
+from jobs import JobScheduler, DEFAULT_WORKERS, DEFAULT_MAX_PER_HOST, DEFAULT_JITTER_FRACTION, DEFAULT_MAX_JITTER, DEFAULT_DEADLINE
+import metrics
+import tracing
+import hasher
 
 # File paths
 SITES_FILE = "tracked_sites.json"
 CONFIG_FILE = "config.json"
 LOG_FILE = "change_log.json"
 ENTITY_STORE = "entity_store.json"
+STORAGE_FILE = "fedload.db"
 FED_ENTITIES_FILE = "fed_entities.json"
-DAILY_REPORT = "daily_report.html"
-WEEKLY_SUMMARY = "weekly_summary.html"
+FED_TERMS_FILE = "fed_terms.json"
+FED_KB_ARTIFACT = "fed_kb.bin"
+CHANGE_EVENTS_FILE = "change_events.jsonl"
+ENTITY_INDEX_FILE = "entity_index.json"
 
 # Default values
 DEFAULT_CHECK_FREQUENCY = 30  # minutes
+DEFAULT_SHUTDOWN_TIMEOUT = 30  # seconds
 
 # Load configuration
 try:
@@ -32,13 +61,30 @@ try:
     # Get check frequency from config
     check_frequency = config.get("scheduling", {}).get("check_frequency_minutes", DEFAULT_CHECK_FREQUENCY)
     print(f"[{datetime.now().isoformat()}] Check frequency set to {check_frequency} minutes")
+    shutdown_timeout = config.get("scheduling", {}).get("shutdown_timeout_seconds", DEFAULT_SHUTDOWN_TIMEOUT)
+    adaptive_config = config.get("scheduling", {}).get("adaptive_polling", {})
+    adaptive_enabled = adaptive_config.get("enabled", True)
+    if adaptive_enabled:
+        print(f"[{datetime.now().isoformat()}] Adaptive polling: every {adaptive_config.get('min_interval_minutes', DEFAULT_MIN_INTERVAL)} to {adaptive_config.get('max_interval_minutes', DEFAULT_MAX_INTERVAL)} minutes per site")
+    job_config = config.get("scheduling", {}).get("job_queue", {})
+    job_queue_enabled = job_config.get("enabled", True)
+    sharding_config = config.get("scheduling", {}).get("sharding", {})
+    worker_count = sharding_config.get("workers", 1)
+    burst_config = config.get("scheduling", {}).get("burst_polling", {})
+    burst_enabled = burst_config.get("enabled", True)
+    if burst_enabled:
+        print(f"[{datetime.now().isoformat()}] Burst polling: every {burst_config.get('interval_seconds', DEFAULT_BURST_INTERVAL)}s from {burst_config.get('before_minutes', DEFAULT_BEFORE)} minutes before to {burst_config.get('after_minutes', DEFAULT_AFTER)} minutes after scheduled releases")
+    if job_queue_enabled:
+        print(f"[{datetime.now().isoformat()}] Job queue: {job_config.get('workers', DEFAULT_WORKERS)} workers, {job_config.get('max_per_host', DEFAULT_MAX_PER_HOST)} per host")
     
     # Get report generation settings
-    daily_report_config = config.get("scheduling", {}).get("report_generation", {}).get("daily_report", {})
+    report_config = config.get("scheduling", {}).get("report_generation", {})
+    report_refresh_seconds = report_config.get("refresh_seconds", 60)
+    daily_report_config = report_config.get("daily_report", {})
     daily_report_enabled = daily_report_config.get("enabled", True)
     daily_report_time = daily_report_config.get("time", "00:00")
     
-    weekly_summary_config = config.get("scheduling", {}).get("report_generation", {}).get("weekly_summary", {})
+    weekly_summary_config = report_config.get("weekly_summary", {})
     weekly_summary_enabled = weekly_summary_config.get("enabled", False)
     weekly_summary_day = weekly_summary_config.get("day", "Monday")
     weekly_summary_time = weekly_summary_config.get("time", "06:00")
@@ -46,15 +92,50 @@ try:
     print(f"[{datetime.now().isoformat()}] Daily report generation: {'enabled' if daily_report_enabled else 'disabled'}, time: {daily_report_time}")
     print(f"[{datetime.now().isoformat()}] Weekly summary generation: {'enabled' if weekly_summary_enabled else 'disabled'}, day: {weekly_summary_day}, time: {weekly_summary_time}")
     
+    # Get data retention settings
+    change_log_days = config.get("scheduling", {}).get("data_retention", {}).get("change_log_days", DEFAULT_RETENTION_DAYS)
+    rollup_hourly_days = config.get("scheduling", {}).get("data_retention", {}).get("rollup_hourly_days", DEFAULT_HOURLY_RETENTION_DAYS)
+    
+    # Get annotation cache and document store settings
+    annotation_cache_config = config.get("caching", {}).get("annotations", {})
+    doc_store_config = config.get("doc_store", {})
+    search_config = config.get("search", {})
+    export_config = config.get("export", {})
+    storage_config = config.get("storage", {})
+    metrics_config = config.get("metrics", {})
+    profiling_config = config.get("profiling", {})
+    notification_config = config.get("notifications", {})
+    
 except Exception as e:
     print(f"[{datetime.now().isoformat()}] Error loading configuration: {str(e)}")
     print(f"[{datetime.now().isoformat()}] Using default values")
     check_frequency = DEFAULT_CHECK_FREQUENCY
+    shutdown_timeout = DEFAULT_SHUTDOWN_TIMEOUT
+    adaptive_config = {}
+    adaptive_enabled = True
+    job_config = {}
+    job_queue_enabled = True
+    sharding_config = {}
+    worker_count = 1
+    burst_config = {}
+    burst_enabled = True
+    report_config = {}
+    report_refresh_seconds = 60
     daily_report_enabled = True
     daily_report_time = "00:00"
     weekly_summary_enabled = False
     weekly_summary_day = "Monday"
     weekly_summary_time = "06:00"
+    change_log_days = DEFAULT_RETENTION_DAYS
+    rollup_hourly_days = DEFAULT_HOURLY_RETENTION_DAYS
+    annotation_cache_config = {}
+    doc_store_config = {}
+    search_config = {}
+    export_config = {}
+    storage_config = {}
+    metrics_config = {}
+    profiling_config = {}
+    notification_config = {}
 
 # Initialize NLP pipeline
 try:
@@ -68,48 +149,157 @@ except Exception as e:
     print(f"[{datetime.now().isoformat()}] SOLUTION: Please run 'python -m spacy download en_core_web_sm'")
     print(f"[{datetime.now().isoformat()}] Continuing with limited functionality - entity recognition will be simplified")
     spacy_available = False
+# Serializes use of the spaCy pipeline across check workers
+nlp_lock = Lock()
+
+# Compiled knowledge base, reloaded automatically when the JSON files change
+kb_manager = KnowledgeBaseManager(FED_ENTITIES_FILE, FED_TERMS_FILE, artifact_file=FED_KB_ARTIFACT)
+print(f"[{datetime.now().isoformat()}] Knowledge base {kb_manager.get().version}: {kb_manager.get().summary()}")
+
+# Annotation cache shared with the API: identical text is only processed once
+annotation_cache = None
+if annotation_cache_config.get("enabled", True):
+    annotation_cache = AnnotationCache(annotation_cache_config.get("directory", "annotation_cache"),
+                                       annotation_cache_config.get("memory_entries", 256),
+                                       annotation_cache_config.get("disk_entries", DEFAULT_DISK_ENTRIES))
+
+# Optional store of processed Docs for re-querying annotations without re-parsing
+doc_store = None
+if doc_store_config.get("enabled", False):
+    doc_store = DocStore(doc_store_config.get("directory", "doc_store"),
+                         doc_store_config.get("max_versions_per_url", 5))
+    print(f"[{datetime.now().isoformat()}] Saving processed documents to {doc_store.directory}")
+
+# Full-text index of changed pages, searched by the API's /search endpoint
+search_index = None
+if search_config.get("enabled", True):
+    search_index = SearchIndex(search_config.get("database", "search_index.db"))
+
+# Cycle metrics, served with the shared stage metrics on the metrics side port
+SITE_CHECKS = metrics.Counter("fedload_site_checks_total",
+                              "Site checks by outcome (changed, unchanged, error)", ["outcome"])
+CYCLE_SECONDS = metrics.Histogram("fedload_cycle_seconds", "Duration of a full check_all_sites cycle",
+                                  buckets=metrics.CYCLE_BUCKETS)
+CYCLE_PENDING = metrics.Gauge("fedload_cycle_pending_sites", "Sites not yet checked in the running cycle")
+LAST_CYCLE = metrics.Gauge("fedload_last_cycle_timestamp_seconds", "Unix time at which the last cycle finished")
+# Opt-in per-URL traces (and cProfile for a sample of them)
+tracer = tracing.Tracer(profiling_config.get("trace_file", tracing.TRACE_FILE),
+                        profiling_config.get("enabled", False),
+                        profiling_config.get("cprofile_sample_rate", 0.0))
+if tracer.enabled:
+    print(f"[{datetime.now().isoformat()}] Profiling mode: writing traces to {tracer.path}")
+
+# Digests of changes and errors, delivered from a background thread so checks never wait on them
+notifier = None
+notification_sinks = {kind: sinks_from_config(notification_config.get(kind, {}), notification_config.get("smtp", {}))
+                      for kind in KINDS if notification_config.get(kind, {}).get("enabled", False)}
+if any(notification_sinks.values()):
+    retry_config = notification_config.get("retry", {})
+    notifier = NotificationDispatcher(notification_sinks,
+                                      notification_config.get("digest_window_seconds", DEFAULT_WINDOW),
+                                      notification_config.get("max_events_per_digest", DEFAULT_MAX_EVENTS),
+                                      max_attempts=retry_config.get("max_attempts", DEFAULT_MAX_ATTEMPTS),
+                                      initial_backoff=retry_config.get("initial_backoff_seconds", DEFAULT_INITIAL_BACKOFF),
+                                      max_backoff=retry_config.get("max_backoff_seconds", DEFAULT_MAX_BACKOFF))
+    print(f"[{datetime.now().isoformat()}] Notifications: {', '.join(f'{kind} to {len(sinks)} sinks' for kind, sinks in notifier.sinks.items())}")
+
+# Queue a change or error for the next notification digest
+def notify(kind, event):
+    if notifier is not None:
+        notifier.publish(kind, event)
 
 # Graceful exit flag
 exit_event = Event()
 
+# Per-URL completion checkpoint of the running cycle
+checkpoint = CycleCheckpoint(CHECKPOINT_FILE)
+
 # Load tracked sites
-def load_sites():
+def load_sites(quiet=False):
     try:
         with open(SITES_FILE, 'r') as f:
             data = json.load(f)
             # The tracked_sites.json file has a "sites" array of URL strings
             sites = data.get("sites", [])
-            print(f"[{datetime.now().isoformat()}] Loaded {len(sites)} sites to monitor")
+            if not quiet:
+                print(f"[{datetime.now().isoformat()}] Loaded {len(sites)} sites to monitor")
             return sites
     except Exception as e:
         print(f"[{datetime.now().isoformat()}] Error loading sites: {str(e)}")
         return []
 
-# Load entity store or create if not exists
+# Per-URL state and entities, upserted row by row (imports entity_store.json once)
+storage = Storage(storage_config.get("database", STORAGE_FILE))
+migrated = storage.migrate_json(ENTITY_STORE)
+if migrated:
+    print(f"[{datetime.now().isoformat()}] Migrated {migrated} pages from {ENTITY_STORE} to {storage.path}")
+
+# Load all stored pages in the former entity_store.json layout
 def load_entity_store():
-    try:
-        with open(ENTITY_STORE, 'r') as f:
-            data = json.load(f)
-            # Ensure the data has the required structure
-            if "entities" not in data:
-                data["entities"] = {}
-            return data
-    except Exception as e:
-        print(f"[{datetime.now().isoformat()}] Creating new entity store (no existing file or error: {str(e)})")
-        return {"entities": {}}
+    return storage.as_entity_store()
 
-# Save entity store
-def save_entity_store(entity_store):
-    with open(ENTITY_STORE, 'w') as f:
-        json.dump(entity_store, f, indent=2)
+# Inverted entity index, kept in memory between cycles and updated as pages change
+entity_index = None
 
-# Load change log or create if not exists
-def load_change_log():
-    try:
-        with open(LOG_FILE, 'r') as f:
-            return json.load(f)
-    except:
-        return []
+def get_entity_index():
+    global entity_index
+    if entity_index is None:
+        entity_index = load_entity_index(ENTITY_INDEX_FILE)
+        if entity_index is None:
+            print(f"[{datetime.now().isoformat()}] Building entity index from {storage.path}")
+            entity_index = EntityIndex.from_entity_store(load_entity_store())
+    return entity_index
+
+# Rebuild the index from storage, e.g. after a crash lost unsaved index updates
+def rebuild_entity_index():
+    global entity_index
+    entity_index = EntityIndex.from_entity_store(load_entity_store())
+
+# Append-only change log, one segment per day (imports change_log.json once)
+change_log = ChangeLog(CHANGE_LOG_DIR, change_log_days)
+migrated_entries = change_log.migrate_json(LOG_FILE)
+if migrated_entries:
+    print(f"[{datetime.now().isoformat()}] Migrated {migrated_entries} change log entries from {LOG_FILE} to {CHANGE_LOG_DIR}/")
+
+# Hourly and daily mention counters, updated as changes are logged (backfilled from the change log once)
+rollups = MentionRollups(storage.path, rollup_hourly_days)
+backfilled = rollups.backfill(change_log.read())
+if backfilled:
+    print(f"[{datetime.now().isoformat()}] Backfilled mention rollups from {backfilled} logged changes")
+
+# Reports rendered from the rollups and the change log into precompiled templates
+report_engine = ReportEngine(rollups, change_log, report_config.get("templates_directory", TEMPLATE_DIR),
+                             report_config.get("output_directory", "."))
+
+# Static site of entity and site pages, re-rendered as their data changes
+site_export = None
+if export_config.get("enabled", False):
+    site_export = StaticSiteExport(storage, change_log, export_config.get("directory", EXPORT_DIR),
+                                   report_config.get("templates_directory", TEMPLATE_DIR),
+                                   export_config.get("manifest", MANIFEST_FILE),
+                                   export_config.get("workers", EXPORT_WORKERS))
+    print(f"[{datetime.now().isoformat()}] Exporting the static site to {site_export.directory}/")
+
+# Per-URL check intervals learned from each site's change rate (seeded from the change log once)
+polling = AdaptivePolling(storage.path, check_frequency,
+                          adaptive_config.get("min_interval_minutes", DEFAULT_MIN_INTERVAL),
+                          adaptive_config.get("max_interval_minutes", DEFAULT_MAX_INTERVAL),
+                          adaptive_config.get("half_life_days", DEFAULT_HALF_LIFE_DAYS))
+if adaptive_enabled:
+    seeded = polling.backfill(change_log.read(), [url for url in load_sites() if url])
+    if seeded:
+        print(f"[{datetime.now().isoformat()}] Seeded change rates for {seeded} sites from the change log")
+
+# Frequent checks of release URLs around scheduled releases (job queue only)
+burst = None
+if burst_enabled:
+    burst = BurstPolling(burst_config.get("before_minutes", DEFAULT_BEFORE),
+                         burst_config.get("after_minutes", DEFAULT_AFTER),
+                         burst_config.get("interval_seconds", DEFAULT_BURST_INTERVAL))
+
+# Load change log entries, optionally only those since a given time
+def load_change_log(since=None):
+    return list(change_log.read(since))
 
 # Load Fed entities
 def load_fed_entities():
@@ -122,25 +312,38 @@ def load_fed_entities():
 
 # Signal handler for graceful exit
 def signal_handler(sig, frame):
-    print(f"\n[{datetime.now().isoformat()}] Received shutdown signal. Saving data and stopping scheduler...")
+    if exit_event.is_set():
+        print(f"\n[{datetime.now().isoformat()}] Received second shutdown signal. Exiting now...")
+        os._exit(1)
+    print(f"\n[{datetime.now().isoformat()}] Received shutdown signal. Finishing the current site, saving data and stopping scheduler (deadline {shutdown_timeout}s)...")
     exit_event.set()
-    # Force exit after 10 seconds if graceful shutdown doesn't complete
-    time.sleep(10)
-    print(f"[{datetime.now().isoformat()}] Forcing exit...")
-    sys.exit(0)
+    # Force exit if graceful shutdown doesn't complete in time; the cycle
+    # checkpoint lets the next start resume where this one stopped
+    watchdog = Timer(shutdown_timeout, force_exit)
+    watchdog.daemon = True
+    watchdog.start()
+
+def force_exit():
+    print(f"[{datetime.now().isoformat()}] Shutdown took longer than {shutdown_timeout}s. Forcing exit...")
+    os._exit(1)
 
 # Register signal handler
 signal.signal(signal.SIGINT, signal_handler)
 signal.signal(signal.SIGTERM, signal_handler)
 
-# Fetch content from a URL
-def fetch_url(url):
+# Returned by fetch_url when a conditional request found the page unchanged
+NOT_MODIFIED = object()
+
+# Fetch content from a URL; with validators from the last fetch the request is conditional
+def fetch_url(url, validators=None):
     try:
         from fetcher import fetch_page, extract_text, extract_main_content
         print(f"[{datetime.now().isoformat()}] Fetching content from {url}")
         
         # Use the enhanced content extraction
-        content_data = extract_main_content(url)
+        content_data = extract_main_content(url, validators=validators)
+        if content_data.get("not_modified"):
+            return NOT_MODIFIED
         if not content_data["text"]:
             return None
             
@@ -150,6 +353,9 @@ def fetch_url(url):
         print(f"[{datetime.now().isoformat()}] ERROR - Error fetching {url}: {str(e)}")
         
         # Fall back to basic fetching if the enhanced fetcher fails
+        if validators is not None:
+            # Plain GET: nothing to revalidate against next time
+            validators.clear()
         try:
             headers = {
                 "User-Agent": config.get("monitoring", {}).get("user_agent", "FedLoad Monitor/1.0")
@@ -197,539 +403,537 @@ def hash_content(content):
         # Default to sha256
         return hashlib.sha256(content.encode()).hexdigest()
 
-# Simple entity extraction if spaCy is not available
-def extract_entities_simple(text):
-    # A simple regex pattern to find title-cased words (names, organizations, etc.)
-    pattern = r'\b[A-Z][a-z]+\b'
-    entities = re.findall(pattern, text)
-    return list(set(entities))  # Remove duplicates
+# Run NLP on extracted text, reusing a cached annotation when the same text
+# was already processed by this process or by the API. When the document
+# store is enabled, a page version that is not stored yet is always parsed.
+def annotate_content(content, url=None, content_hash=None):
+    kb = kb_manager.get()
+    profile = pipeline_profile(nlp if spacy_available else None)
+    key = cache_key(hasher.hash_content(content), profile, kb.version)
+    store_doc = doc_store is not None and spacy_available and url is not None
+    if store_doc and doc_store.has(url, content_hash):
+        store_doc = False
+
+    if annotation_cache and not store_doc:
+        annotation = annotation_cache.get(key)
+        if annotation is not None:
+            return annotation
+
+    if spacy_available:
+        # Checks run in parallel; the spaCy pipeline is used by one at a time
+        with nlp_lock:
+            doc = nlp(content)
+        annotation = annotate_doc(doc, kb)
+        if store_doc:
+            try:
+                doc_store.save(url, content_hash, add_fed_spans(doc, kb), profile)
+            except Exception as e:
+                print(f"[{datetime.now().isoformat()}] ERROR saving document for {url}: {str(e)}")
+    else:
+        # Use simple entity extraction
+        annotation = annotate_text(content, kb)
+
+    if annotation_cache:
+        annotation_cache.put(key, annotation)
+    return annotation
+
+# Append a change to the change log and publish it to listeners
+def record_change(url, old_hash, new_hash, entities, fed_entities):
+    log_entry = {
+        "url": url,
+        "time": datetime.now().isoformat(),
+        "changed": True,
+        "old_hash": old_hash,
+        "new_hash": new_hash,
+        "entities_found": {
+            "basic": entities,
+            "fed_people": [e["text"] for e in fed_entities if e["type"] == "person"],
+            "fed_organizations": [e["text"] for e in fed_entities if e["type"] == "organization"],
+            "fed_publications": [e["text"] for e in fed_entities if e["type"] == "publication"]
+        }
+    }
+    change_log.append(log_entry)
+    rollups.add(log_entry)
+    
+    # Let the API and other listeners know right away
+    publish_change(url, old_hash, new_hash, log_entry["entities_found"], CHANGE_EVENTS_FILE)
+    notify("on_change", log_entry)
 
 # Check a site for changes
-def check_site(url, entity_store):
-    # Ensure entity_store has the proper structure
-    if "entities" not in entity_store:
-        entity_store["entities"] = {}
+def check_site(url):
+    # Get stored hash; pages seen before are fetched conditionally
+    old_hash = storage.get_hash(url)
+    validators = storage.get_validators(url) if old_hash is not None else {}
     
     # Get current content
-    content = fetch_url(url)
+    content = fetch_url(url, validators)
+    if content is NOT_MODIFIED:
+        tracing.annotate(changed=False)
+        storage.record_check(url)
+        return False, old_hash, old_hash, [], []
     if not content:
         return False, None, None, [], []
     
     # Calculate hash
-    new_hash = hash_content(content)
-    
-    # Get stored hash
-    old_hash = entity_store.get("entities", {}).get(url, {}).get("hash", None)
+    with metrics.stage("hashing", url):
+        new_hash = hash_content(content)
     
     # Check if content has changed
     changed = old_hash != new_hash
+    tracing.annotate(changed=changed, text_length=len(content))
     
     # Process text with NLP if changed
     entities = []
     fed_entities = []
     if changed:
-        if spacy_available:
-            doc = nlp(content)
-            
-            # Extract basic entities (title-case words)
-            for sent in doc.sents:
-                for token in sent:
-                    if token.is_alpha and token.is_title and len(token.text) > 1:
-                        entities.append(token.text)
-            
-            # Remove duplicates
-            entities = list(set(entities))
-        else:
-            # Use simple entity extraction
-            entities = extract_entities_simple(content)
+        with metrics.stage("nlp", url):
+            annotation = annotate_content(content, url, new_hash)
+        entities = annotation["basic_entities"]
+        fed_entities = annotation["fed_entities"]
+        tracing.annotate(basic_entities=len(entities), fed_entities=len(fed_entities))
         
-        # Extract Fed-specific entities
-        fed_entities = extract_fed_entities(content)
+        # Log the change before storing the new hash: if we crash in between,
+        # the page is seen as changed again after restart instead of the
+        # change being lost
+        record_change(url, old_hash, new_hash, entities, fed_entities)
         
         # Store hash and entities
-        if url not in entity_store["entities"]:
-            entity_store["entities"][url] = {"hash": new_hash, "entities": entities, "fed_entities": fed_entities}
-        else:
-            entity_store["entities"][url]["hash"] = new_hash
-            entity_store["entities"][url]["entities"] = entities
-            entity_store["entities"][url]["fed_entities"] = fed_entities
+        with metrics.stage("persistence", url):
+            storage.save_page(url, new_hash, entities, annotation["basic_entity_counts"], fed_entities,
+                              validators=validators)
+        
+        # Replace this page's contribution to the entity index
+        get_entity_index().update_url(url, annotation["basic_entity_counts"], fed_entities)
+        
+        # Index the new version's text for full-text search
+        if search_index:
+            try:
+                with metrics.stage("persistence", url):
+                    search_index.add_page(url, content, new_hash,
+                                          [(e, "basic") for e in entities] + [(e["text"], e["type"]) for e in fed_entities])
+            except Exception as e:
+                print(f"[{datetime.now().isoformat()}] ERROR indexing {url} for search: {str(e)}")
+    else:
+        storage.record_check(url, validators=validators)
     
     return changed, old_hash, new_hash, entities, fed_entities
 
-# Extract Fed-specific entities from text
-def extract_fed_entities(text):
-    fed_entities = []
-    fed_data = load_fed_entities()
-    
-    # Check for people
-    for person in fed_data.get("people", []):
-        name = person["name"]
-        aliases = person.get("aliases", [])
-        all_names = [name] + aliases
+# Check one site and record the outcome (metrics, change rate, errors in the change log)
+def run_site_check(url):
+    try:
+        print(f"[{datetime.now().isoformat()}] Checking {url}")
+        with tracer.trace(url, "scheduler"):
+            changed, old_hash, new_hash, matched_entities, fed_entities_found = tracing.profiled(check_site)(url)
         
-        for name_variant in all_names:
-            if name_variant in text:
-                fed_entities.append({
-                    "text": name_variant,
-                    "type": "person",
-                    "full_name": person["name"],
-                    "title": person.get("title", ""),
-                    "organization": person.get("organization", "")
-                })
-                break
-    
-    # Check for organizations
-    for org in fed_data.get("organizations", []):
-        name = org["name"]
-        acronym = org.get("acronym", "")
+        if new_hash is None:
+            # Nothing could be fetched or extracted
+            metrics.ERRORS.labels(host=metrics.host_of(url), stage="fetch").inc()
+            notify("on_error", {"url": url, "time": datetime.now().isoformat(), "error": "No content could be fetched"})
+            outcome = "error"
+        else:
+            outcome = "changed" if changed else "unchanged"
+        SITE_CHECKS.labels(outcome=outcome).inc()
         
-        if name in text or (acronym and acronym in text):
-            found_text = name if name in text else acronym
-            fed_entities.append({
-                "text": found_text,
-                "type": "organization",
-                "full_name": org["name"],
-                "acronym": org.get("acronym", ""),
-                "description": org.get("description", "")
-            })
-    
-    # Check for publications
-    for pub in fed_data.get("publications", []):
-        name = pub["name"]
-        full_name = pub.get("full_name", "")
+        # A first check has nothing to compare with, so it only sets the check time
+        polling.record_check(url, changed if old_hash is not None and new_hash is not None else None)
         
-        if name in text or (full_name and full_name in text):
-            found_text = name if name in text else full_name
-            fed_entities.append({
-                "text": found_text,
-                "type": "publication",
-                "full_name": pub.get("full_name", name),
-                "publishing_body": pub.get("publishing_body", ""),
-                "description": pub.get("description", "")
-            })
-    
-    return fed_entities
+        if changed:
+            print(f"[{datetime.now().isoformat()}] Changes detected on {url}")
+            print(f"[{datetime.now().isoformat()}] Found {len(matched_entities)} basic entities and {len(fed_entities_found)} Fed-specific entities")
+        return outcome
+    except Exception as e:
+        metrics.ERRORS.labels(host=metrics.host_of(url), stage="check").inc()
+        SITE_CHECKS.labels(outcome="error").inc()
+        print(f"[{datetime.now().isoformat()}] ERROR checking {url}: {str(e)}")
+        # Log the error
+        log_entry = {
+            "url": url,
+            "time": datetime.now().isoformat(),
+            "changed": False,
+            "error": str(e)
+        }
+        change_log.append(log_entry)
+        notify("on_error", log_entry)
+        polling.record_check(url, None)
+        return "error"
 
-# Check all sites
+# Save the entity index and apply retention to the change log, change events and rollups
+def persist_state():
+    if registry is not None:
+        if not registry.is_leader():
+            # One worker saves the shared index and applies retention for all
+            return
+        # Other workers' changes only reach this process through storage
+        rebuild_entity_index()
+    with metrics.stage("persistence"):
+        # Save entity index
+        save_entity_index(get_entity_index(), ENTITY_INDEX_FILE)
+        
+        # Drop change log segments older than the retention window
+        removed = change_log.enforce_retention()
+        if removed:
+            print(f"[{datetime.now().isoformat()}] Removed {removed} change log segments older than {change_log_days} days")
+        # The change event journal (live feed, API cache invalidation) keeps the same window
+        if change_log_days is not None:
+            dropped = trim_events(CHANGE_EVENTS_FILE, change_log_days)
+            if dropped:
+                print(f"[{datetime.now().isoformat()}] Removed {dropped} change events older than {change_log_days} days")
+        rollups.enforce_retention()
+
+# Check all sites in one blocking pass (used when the job queue is disabled)
 def check_all_sites():
     print(f"[{datetime.now().isoformat()}] Starting site checks...")
-    sites = load_sites()
-    entity_store = load_entity_store()
-    log_data = load_change_log()
-    
-    # Ensure entity_store has the proper structure
-    if "entities" not in entity_store:
-        entity_store["entities"] = {}
+    cycle_start = time.perf_counter()
+    
+    # Resume an interrupted cycle with the sites it had not finished
+    cycle = checkpoint.load()
+    if cycle is not None:
+        sites = checkpoint.remaining(cycle)
+        print(f"[{datetime.now().isoformat()}] Resuming cycle started at {cycle['started']}: {len(sites)} of {len(cycle['sites'])} sites left")
+        rebuild_entity_index()
+    else:
+        sites = [url for url in load_sites() if url]
+        if adaptive_enabled:
+            # Only the sites whose learned interval has elapsed
+            total_sites = len(sites)
+            sites = polling.due(sites)
+            print(f"[{datetime.now().isoformat()}] {len(sites)} of {total_sites} sites due")
+        cycle = checkpoint.start(sites)
     
     changes_detected = 0
     sites_checked = 0
     sites_errored = 0
+    CYCLE_PENDING.set(len(sites))
     
     for url in sites:
-        if not url:
-            continue
+        if exit_event.is_set():
+            print(f"[{datetime.now().isoformat()}] Shutdown requested, leaving {len(checkpoint.remaining(cycle))} sites for the next start")
+            break
+        CYCLE_PENDING.dec()
         
-        try:
-            sites_checked += 1
-            print(f"[{datetime.now().isoformat()}] Checking {url}")
-            changed, old_hash, new_hash, matched_entities, fed_entities_found = check_site(url, entity_store)
-            
-            if changed:
-                changes_detected += 1
-                print(f"[{datetime.now().isoformat()}] Changes detected on {url}")
-                print(f"[{datetime.now().isoformat()}] Found {len(matched_entities)} basic entities and {len(fed_entities_found)} Fed-specific entities")
-                
-                # Log the change
-                log_entry = {
-                    "url": url,
-                    "time": datetime.now().isoformat(),
-                    "changed": True,
-                    "old_hash": old_hash,
-                    "new_hash": new_hash,
-                    "entities_found": {
-                        "basic": matched_entities,
-                        "fed_people": [e["text"] for e in fed_entities_found if e["type"] == "person"],
-                        "fed_organizations": [e["text"] for e in fed_entities_found if e["type"] == "organization"],
-                        "fed_publications": [e["text"] for e in fed_entities_found if e["type"] == "publication"]
-                    }
-                }
-                log_data.append(log_entry)
-        except Exception as e:
+        sites_checked += 1
+        outcome = run_site_check(url)
+        if outcome == "changed":
+            changes_detected += 1
+        elif outcome == "error":
             sites_errored += 1
-            print(f"[{datetime.now().isoformat()}] ERROR checking {url}: {str(e)}")
-            # Log the error
-            log_entry = {
-                "url": url,
-                "time": datetime.now().isoformat(),
-                "changed": False,
-                "error": str(e)
-            }
-            log_data.append(log_entry)
-            continue
+        
+        checkpoint.mark_done(cycle, url)
     
-    # Save entity store
-    save_entity_store(entity_store)
+    persist_state()
+    update_reports()
+    export_site()
     
-    # Save log
-    with open(LOG_FILE, 'w') as f:
-        json.dump(log_data, f, indent=2)
+    cycle_seconds = time.perf_counter() - cycle_start
+    if checkpoint.remaining(cycle):
+        print(f"[{datetime.now().isoformat()}] Cycle interrupted after {cycle_seconds:.1f}s")
+        return changes_detected
+    checkpoint.finish()
+    CYCLE_SECONDS.observe(cycle_seconds)
+    LAST_CYCLE.set(time.time())
     
     print(f"[{datetime.now().isoformat()}] Site check summary:")
     print(f"[{datetime.now().isoformat()}] - Total sites checked: {sites_checked}")
     print(f"[{datetime.now().isoformat()}] - Sites with changes: {changes_detected}")
     print(f"[{datetime.now().isoformat()}] - Sites with errors: {sites_errored}")
+    print(f"[{datetime.now().isoformat()}] - Cycle duration: {cycle_seconds:.1f}s")
     print(f"[{datetime.now().isoformat()}] Completed site checks.")
     return changes_detected
 
-# Generate daily report
-def generate_daily_report():
-    print(f"[{datetime.now().isoformat()}] Generating daily report...")
-    log_data = load_change_log()
-    entity_store = load_entity_store()
-    
-    # Ensure entity_store has the proper structure
-    if "entities" not in entity_store:
-        entity_store["entities"] = {}
-    
-    # Filter logs for the last 24 hours
+# Reload scheduled releases from fed_entities.json and the FOMC calendar page
+def refresh_release_calendar(fetch=True):
+    if burst is None:
+        return []
+    meetings = load_meetings(RELEASE_CALENDAR_FILE)
+    if fetch:
+        try:
+            from fetcher import fetch_page
+            html = fetch_page(FOMC_CALENDAR_URL)
+            parsed = parse_fomc_calendar(html) if html else []
+            if parsed:
+                meetings = parsed
+                save_meetings(meetings, RELEASE_CALENDAR_FILE)
+            else:
+                print(f"[{datetime.now().isoformat()}] No FOMC meetings found on {FOMC_CALENDAR_URL}, keeping {len(meetings)} known meetings")
+        except Exception as e:
+            print(f"[{datetime.now().isoformat()}] ERROR refreshing the FOMC calendar: {str(e)}")
     now = datetime.now()
-    recent_logs = [log for log in log_data if (now - datetime.fromisoformat(log["time"].replace("Z", ""))).days < 1]
-    
-    # Count mentions of Fed entities
-    people_mentions = {}
-    org_mentions = {}
-    pub_mentions = {}
-    
-    for log in recent_logs:
-        for person in log["entities_found"].get("fed_people", []):
-            people_mentions[person] = people_mentions.get(person, 0) + 1
-        
-        for org in log["entities_found"].get("fed_organizations", []):
-            org_mentions[org] = org_mentions.get(org, 0) + 1
-        
-        for pub in log["entities_found"].get("fed_publications", []):
-            pub_mentions[pub] = pub_mentions.get(pub, 0) + 1
-    
-    # Sort by frequency
-    people_sorted = sorted(people_mentions.items(), key=lambda x: x[1], reverse=True)
-    org_sorted = sorted(org_mentions.items(), key=lambda x: x[1], reverse=True)
-    pub_sorted = sorted(pub_mentions.items(), key=lambda x: x[1], reverse=True)
-    
-    # Generate HTML report
+    horizon = burst_config.get("horizon_days", DEFAULT_HORIZON_DAYS)
+    releases = expand_releases(load_fed_entities(), meetings, now - burst.after, now + timedelta(days=horizon))
+    tracked = set(load_sites(quiet=True))
+    for url in sorted({url for release in releases for url in release.urls} - tracked):
+        print(f"[{datetime.now().isoformat()}] WARNING: release URL {url} is not in {SITES_FILE}, so it is never burst-polled")
+    burst.update(releases)
+    if releases:
+        print(f"[{datetime.now().isoformat()}] {len(releases)} scheduled releases in the next {horizon} days; next: {releases[0].name} at {releases[0].at.isoformat()}")
+    return releases
+
+# Membership and URL leases when running as one of several workers
+registry = None
+
+# Check a site if this worker still owns it and no other worker holds its lease
+def run_owned_check(url):
+    if not registry.owns(url):
+        # Moved to another worker since it was queued; the next sync drops it
+        return None
+    if not registry.claim(url):
+        print(f"[{datetime.now().isoformat()}] Skipping {url}: another worker is checking it")
+        return None
     try:
-        with open(DAILY_REPORT, 'r') as f:
-            template = f.read()
-    except:
-        # Create a simple template if file doesn't exist
-        template = """<!DOCTYPE html>
-<html>
-<head>
-    <title>FED Website Changes Report</title>
-    <style>
-        body { font-family: Arial, sans-serif; margin: 40px; line-height: 1.6; }
-        h1, h2 { color: #00395d; }
-        .container { max-width: 1000px; margin: 0 auto; }
-        .section { margin-bottom: 30px; border-bottom: 1px solid #ddd; padding-bottom: 20px; }
-        ul { padding-left: 20px; }
-        li { margin-bottom: 8px; }
-        footer { margin-top: 40px; font-size: 0.8em; color: #666; border-top: 1px solid #ddd; padding-top: 20px; }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>FED Website Changes Report</h1>
-        
-        <div class="section">
-            <h2>Recent Changes</h2>
-            <!-- CHANGES_CONTENT -->
-        </div>
-        
-        <div class="section">
-            <h2>FED Officials Mentioned</h2>
-            <!-- OFFICIALS_CONTENT -->
-        </div>
+        return run_site_check(url)
+    finally:
+        registry.release(url)
+
+# Run a shared task (reports, persistence) in one worker only
+def leader_only(function, **kwargs):
+    def run():
+        if registry is None or registry.is_leader():
+            return function(**kwargs)
+    return run
+
+# Check interval in minutes of each site handled by the job queue
+job_intervals = {}
+sync_lock = Lock()
+
+# Seconds until a site handled by the job queue is checked again; None once it is no longer tracked
+def next_check_delay(url, outcome=None):
+    interval = job_intervals.get(url)
+    if interval is None:
+        return None
+    if burst is None:
+        return interval * 60
+    burst.record_check(url, outcome == "changed")
+    if outcome == "changed" and url == FOMC_CALENDAR_URL:
+        refresh_release_calendar()
+    return burst.next_delay(url, interval * 60)
+
+# Queue newly tracked (or newly owned) sites, drop removed ones and refresh the check intervals
+def sync_jobs(jobs):
+    global job_intervals
+    with sync_lock:
+        sites = list(dict.fromkeys(url for url in load_sites() if url))
+        now = datetime.now()
+        # Intervals share the check budget of all sites, also across workers
+        if adaptive_enabled:
+            intervals = polling.intervals(sites, now)
+        else:
+            intervals = dict.fromkeys(sites, check_frequency)
+        if registry is not None:
+            intervals = {url: interval for url, interval in intervals.items() if registry.owns(url)}
+            OWNED_SITES.set(len(intervals))
+            print(f"[{datetime.now().isoformat()}] Worker {registry.worker_id} owns {len(intervals)} of {len(sites)} sites ({len(registry.workers())} workers)")
+        job_intervals = intervals
         
-        <div class="section">
-            <h2>FED Publications Mentioned</h2>
-            <!-- PUBLICATIONS_CONTENT -->
-        </div>
+        known = jobs.urls()
+        for url in known - set(intervals):
+            jobs.cancel(url)
+        new_sites = [url for url in intervals if url not in known]
+        if new_sites:
+            next_checks = polling.next_checks(sites, now, None if adaptive_enabled else check_frequency)
+            for url in new_sites:
+                delay = (next_checks[url] - now).total_seconds()
+                if burst is not None:
+                    delay = burst.next_delay(url, delay, now)
+                jobs.schedule(url, delay, intervals[url] * 60)
+            due = sum(1 for url in new_sites if next_checks[url] <= now)
+            print(f"[{datetime.now().isoformat()}] Queued {len(new_sites)} sites, {due} due now")
         
-        <footer>
-            <p>Generated by FedLoad on <!-- GENERATION_TIME --></p>
-            <p><a href="weekly_summary.html">View Weekly Summary</a></p>
-        </footer>
-    </div>
-</body>
-</html>"""
-    
-    # Replace placeholders with data
-    changes_html = ""
-    if recent_logs:
-        changes_html = "<ul>"
-        for log in recent_logs:
-            changes_html += f"<li><a href='{log['url']}'>{log['url']}</a> - {datetime.fromisoformat(log['time'].replace('Z', '')).strftime('%Y-%m-%d %H:%M:%S')}</li>"
-        changes_html += "</ul>"
-    else:
-        changes_html = "<p>No changes detected in the last 24 hours.</p>"
-    
-    people_html = ""
-    if people_sorted:
-        people_html = "<ul>"
-        for person, count in people_sorted[:10]:  # Top 10
-            people_html += f"<li>{person} - {count} mentions</li>"
-        people_html += "</ul>"
-    else:
-        people_html = "<p>No FED officials mentioned in the last 24 hours.</p>"
-    
-    pub_html = ""
-    if pub_sorted:
-        pub_html = "<ul>"
-        for pub, count in pub_sorted[:10]:  # Top 10
-            pub_html += f"<li>{pub} - {count} mentions</li>"
-        pub_html += "</ul>"
-    else:
-        pub_html = "<p>No FED publications mentioned in the last 24 hours.</p>"
-    
-    # Update the template with actual data
-    template = template.replace("<!-- CHANGES_CONTENT -->", changes_html)
-    template = template.replace("<!-- OFFICIALS_CONTENT -->", people_html)
-    template = template.replace("<!-- PUBLICATIONS_CONTENT -->", pub_html)
-    template = template.replace("<!-- GENERATION_TIME -->", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-    
-    # Write the report
-    with open(DAILY_REPORT, 'w') as f:
-        f.write(template)
-    
-    print(f"[{datetime.now().isoformat()}] Daily report generated successfully.")
+        if burst is not None:
+            # Bring queued checks forward to release windows learned since they were queued
+            for url, run_at in jobs.queued().items():
+                delay = run_at - time.time()
+                burst_delay = burst.next_delay(url, delay)
+                if burst_delay < delay - burst.interval:
+                    jobs.schedule(url, burst_delay, burst.interval)
+            for release in burst.active():
+                print(f"[{datetime.now().isoformat()}] Release window open: {release.name} at {release.at.isoformat()}")
+        return new_sites
+
+# Start checking sites through the job queue
+def start_jobs():
+    jobs = JobScheduler(run_site_check if registry is None else run_owned_check, next_check_delay,
+                        workers=job_config.get("workers", DEFAULT_WORKERS),
+                        max_per_host=job_config.get("max_per_host", DEFAULT_MAX_PER_HOST),
+                        jitter_fraction=job_config.get("jitter_fraction", DEFAULT_JITTER_FRACTION),
+                        max_jitter=job_config.get("max_jitter_seconds", DEFAULT_MAX_JITTER),
+                        deadline=job_config.get("deadline_seconds", DEFAULT_DEADLINE))
+    # Index updates made since the last save are lost if the previous run
+    # stopped abruptly; a leftover cycle checkpoint is covered by the queue
+    rebuild_entity_index()
+    if checkpoint.load() is not None:
+        checkpoint.finish()
+    
+    if registry is not None:
+        # Joins the ring first, so the initial sync sees the other workers
+        registry.start(lambda: sync_jobs(jobs))
+    refresh_release_calendar()
+    sync_jobs(jobs)
+    jobs.start()
+    return jobs
+
+# Update the daily report if its data changed; `force` rewrites it anyway (scheduled time, shutdown)
+def generate_daily_report(force=False):
+    try:
+        if report_engine.update_daily(force=force):
+            print(f"[{datetime.now().isoformat()}] Daily report updated")
+    except Exception as e:
+        print(f"[{datetime.now().isoformat()}] ERROR generating daily report: {str(e)}")
 
-# Generate weekly summary
-def generate_weekly_summary():
+# Update the weekly summary if its data changed; `force` rewrites it anyway (scheduled time, shutdown)
+def generate_weekly_summary(force=False):
     if not weekly_summary_enabled:
         return
-    
-    print(f"[{datetime.now().isoformat()}] Generating weekly summary...")
-    log_data = load_change_log()
-    entity_store = load_entity_store()
-    
-    # Ensure entity_store has the proper structure
-    if "entities" not in entity_store:
-        entity_store["entities"] = {}
-    
-    # Filter logs for the last 7 days
-    now = datetime.now()
-    recent_logs = [log for log in log_data if (now - datetime.fromisoformat(log["time"].replace("Z", ""))).days < 7]
-    
-    # Count stats
-    total_changes = len(recent_logs)
-    sites_with_changes = set([log["url"] for log in recent_logs])
-    total_sites_changed = len(sites_with_changes)
-    
-    # Count mentions of Fed entities
-    people_mentions = {}
-    org_mentions = {}
-    pub_mentions = {}
-    site_activity = {}
-    
-    for log in recent_logs:
-        site_url = log["url"]
-        site_activity[site_url] = site_activity.get(site_url, 0) + 1
-        
-        for person in log["entities_found"].get("fed_people", []):
-            people_mentions[person] = people_mentions.get(person, 0) + 1
-        
-        for org in log["entities_found"].get("fed_organizations", []):
-            org_mentions[org] = org_mentions.get(org, 0) + 1
-        
-        for pub in log["entities_found"].get("fed_publications", []):
-            pub_mentions[pub] = pub_mentions.get(pub, 0) + 1
-    
-    # Sort by frequency
-    people_sorted = sorted(people_mentions.items(), key=lambda x: x[1], reverse=True)
-    org_sorted = sorted(org_mentions.items(), key=lambda x: x[1], reverse=True)
-    pub_sorted = sorted(pub_mentions.items(), key=lambda x: x[1], reverse=True)
-    sites_sorted = sorted(site_activity.items(), key=lambda x: x[1], reverse=True)
-    
-    # Generate HTML report
     try:
-        with open(WEEKLY_SUMMARY, 'r') as f:
-            template = f.read()
-    except:
-        # Create a simple template if file doesn't exist
-        template = """<!DOCTYPE html>
-<html>
-<head>
-    <title>FED Website Weekly Summary</title>
-    <style>
-        body { font-family: Arial, sans-serif; margin: 40px; line-height: 1.6; }
-        h1, h2 { color: #00395d; }
-        .container { max-width: 1000px; margin: 0 auto; }
-        .section { margin-bottom: 30px; border-bottom: 1px solid #ddd; padding-bottom: 20px; }
-        .stats { display: flex; justify-content: space-between; text-align: center; margin: 30px 0; }
-        .stat-box { width: 22%; padding: 15px; border: 1px solid #ddd; border-radius: 5px; }
-        .stat-number { font-size: 2.5em; font-weight: bold; color: #00395d; }
-        .stat-label { font-size: 0.9em; color: #666; }
-        ol { padding-left: 20px; }
-        li { margin-bottom: 8px; }
-        footer { margin-top: 40px; font-size: 0.8em; color: #666; border-top: 1px solid #ddd; padding-top: 20px; }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>FED Website Weekly Summary</h1>
-        
-        <div class="section">
-            <h2>Weekly Overview</h2>
-            <!-- OVERVIEW_CONTENT -->
-        </div>
-        
-        <div class="section">
-            <h2>Most Active FED Sites</h2>
-            <!-- ACTIVE_SITES_CONTENT -->
-        </div>
-        
-        <div class="section">
-            <h2>Most Mentioned Officials</h2>
-            <!-- OFFICIALS_CONTENT -->
-        </div>
-        
-        <div class="section">
-            <h2>Most Mentioned Publications</h2>
-            <!-- PUBLICATIONS_CONTENT -->
-        </div>
-        
-        <div class="section">
-            <h2>Trending Topics</h2>
-            <!-- TOPICS_CONTENT -->
-        </div>
-        
-        <footer>
-            <p>Generated by FedLoad on <!-- GENERATION_TIME --></p>
-            <p><a href="daily_report.html">View Daily Report</a></p>
-        </footer>
-    </div>
-</body>
-</html>"""
-    
-    # Create overview section
-    overview_html = f"""
-    <div class="stats">
-        <div class="stat-box">
-            <div class="stat-number">{total_changes}</div>
-            <div class="stat-label">Total Changes</div>
-        </div>
-        <div class="stat-box">
-            <div class="stat-number">{total_sites_changed}</div>
-            <div class="stat-label">Active Sites</div>
-        </div>
-        <div class="stat-box">
-            <div class="stat-number">{len(people_mentions)}</div>
-            <div class="stat-label">Officials Mentioned</div>
-        </div>
-        <div class="stat-box">
-            <div class="stat-number">{len(pub_mentions)}</div>
-            <div class="stat-label">Publications Referenced</div>
-        </div>
-    </div>
-    """
-    
-    # Create active sites section
-    sites_html = ""
-    if sites_sorted:
-        sites_html = "<ol>"
-        for site, count in sites_sorted[:5]:  # Top 5
-            sites_html += f"<li><a href='{site}'>{site}</a> - {count} changes</li>"
-        sites_html += "</ol>"
-    else:
-        sites_html = "<p>No site activity this week.</p>"
-    
-    # Create officials section
-    officials_html = ""
-    if people_sorted:
-        officials_html = "<ol>"
-        for person, count in people_sorted[:5]:  # Top 5
-            officials_html += f"<li>{person} - {count} mentions</li>"
-        officials_html += "</ol>"
-    else:
-        officials_html = "<p>No FED officials mentioned this week.</p>"
-    
-    # Create publications section
-    pubs_html = ""
-    if pub_sorted:
-        pubs_html = "<ol>"
-        for pub, count in pub_sorted[:5]:  # Top 5
-            pubs_html += f"<li>{pub} - {count} mentions</li>"
-        pubs_html += "</ol>"
-    else:
-        pubs_html = "<p>No FED publications mentioned this week.</p>"
-    
-    # Update the template with actual data
-    template = template.replace("<!-- OVERVIEW_CONTENT -->", overview_html)
-    template = template.replace("<!-- ACTIVE_SITES_CONTENT -->", sites_html)
-    template = template.replace("<!-- OFFICIALS_CONTENT -->", officials_html)
-    template = template.replace("<!-- PUBLICATIONS_CONTENT -->", pubs_html)
-    template = template.replace("<!-- TOPICS_CONTENT -->", "<p>Topic analysis not yet implemented.</p>")
-    template = template.replace("<!-- GENERATION_TIME -->", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-    
-    # Write the report
-    with open(WEEKLY_SUMMARY, 'w') as f:
-        f.write(template)
-    
-    print(f"[{datetime.now().isoformat()}] Weekly summary generated successfully.")
+        if report_engine.update_weekly(force=force):
+            print(f"[{datetime.now().isoformat()}] Weekly summary updated")
+    except Exception as e:
+        print(f"[{datetime.now().isoformat()}] ERROR generating weekly summary: {str(e)}")
+
+# Re-render the static site pages whose data changed
+def export_site():
+    if site_export is None:
+        return
+    try:
+        written, removed = site_export.update(kb_manager.get().data, load_sites(quiet=True))
+        if written or removed:
+            print(f"[{datetime.now().isoformat()}] Static site: wrote {written} pages, removed {removed}")
+    except Exception as e:
+        print(f"[{datetime.now().isoformat()}] ERROR exporting static site: {str(e)}")
+
+# Bring the enabled reports up to date (after each cycle and every report_refresh_seconds)
+def update_reports(force=False):
+    if daily_report_enabled:
+        generate_daily_report(force)
+    generate_weekly_summary(force)
+
+# Run `worker_count` worker processes on this host, restarting any that exit
+def run_workers():
+    port = metrics_config.get("scheduler_port", 9108)
+    def command(index):
+        argv = [sys.executable, os.path.abspath(__file__), "--worker"]
+        if metrics_config.get("enabled", True):
+            argv += ["--metrics-port", str(port + index)]
+        return argv
+    
+    pool = WorkerPool(command, worker_count)
+    pool.start()
+    print(f"[{datetime.now().isoformat()}] Started {worker_count} workers")
+    while not exit_event.is_set():
+        for index in pool.poll():
+            print(f"[{datetime.now().isoformat()}] Restarted worker {index}")
+        exit_event.wait(1)
+    pool.stop(shutdown_timeout)
+    print(f"[{datetime.now().isoformat()}] ====== FedLoad Workers Stopped ======")
 
 # Main function
-def main():
+def main(worker=False, worker_id=None, metrics_port=None):
+    global registry
     print(f"[{datetime.now().isoformat()}] ====== FedLoad Scheduler Started ======")
     print(f"[{datetime.now().isoformat()}] Press Ctrl+C to exit gracefully")
     
+    if not worker and worker_count > 1:
+        run_workers()
+        sys.exit(0)
+    
+    # Expose metrics for Prometheus on a side port
+    if metrics_config.get("enabled", True):
+        address = metrics_config.get("scheduler_address", "127.0.0.1")
+        port = metrics_port or metrics_config.get("scheduler_port", 9108)
+        try:
+            metrics.start_http_server(port, address)
+            print(f"[{datetime.now().isoformat()}] Serving metrics on http://{address}:{port}/metrics")
+        except OSError as e:
+            print(f"[{datetime.now().isoformat()}] ERROR starting metrics server: {str(e)}")
+    
+    if notifier is not None:
+        notifier.start()
+    
+    jobs = None
+    daily_report_task = leader_only(generate_daily_report, force=True)
+    weekly_summary_task = leader_only(generate_weekly_summary, force=True)
+    reports_task = leader_only(update_reports)
+    export_task = leader_only(export_site)
     try:
-        # Initial check
-        check_all_sites()
+        if worker:
+            # Share the sites with the other workers on this database
+            registry = WorkerRegistry(storage.path, worker_id,
+                                      sharding_config.get("heartbeat_seconds", DEFAULT_HEARTBEAT),
+                                      sharding_config.get("lease_timeout_seconds", DEFAULT_LEASE_TIMEOUT),
+                                      sharding_config.get("virtual_nodes", DEFAULT_VIRTUAL_NODES))
+            print(f"[{datetime.now().isoformat()}] Running as worker {registry.worker_id}")
         
-        # Schedule regular checks
-        schedule.every(check_frequency).minutes.do(check_all_sites)
+        if job_queue_enabled or worker:
+            # Each site is checked on its own schedule by a pool of workers
+            jobs = start_jobs()
+            schedule.every(polling.min_interval if adaptive_enabled else check_frequency).minutes.do(sync_jobs, jobs)
+            schedule.every(check_frequency).minutes.do(persist_state)
+            # Checks finish one by one, so the reports follow on a short tick
+            schedule.every(report_refresh_seconds).seconds.do(reports_task)
+            schedule.every(report_refresh_seconds).seconds.do(export_task)
+            if burst is not None:
+                schedule.every(burst_config.get("calendar_refresh_hours", 12)).hours.do(refresh_release_calendar)
+        else:
+            # Initial check
+            check_all_sites()
+            
+            # Schedule regular checks; with adaptive polling, each run checks only the sites that are due
+            if adaptive_enabled:
+                schedule.every(polling.min_interval).minutes.do(check_all_sites)
+            else:
+                schedule.every(check_frequency).minutes.do(check_all_sites)
         
         # Schedule daily report generation
         if daily_report_enabled:
             hour, minute = map(int, daily_report_time.split(':'))
-            schedule.every().day.at(daily_report_time).do(generate_daily_report)
+            schedule.every().day.at(daily_report_time).do(daily_report_task)
             print(f"[{datetime.now().isoformat()}] Scheduled daily report at {daily_report_time}")
         
         # Schedule weekly summary generation
         if weekly_summary_enabled:
             hour, minute = map(int, weekly_summary_time.split(':'))
             if weekly_summary_day.lower() == "monday":
-                schedule.every().monday.at(weekly_summary_time).do(generate_weekly_summary)
+                schedule.every().monday.at(weekly_summary_time).do(weekly_summary_task)
             elif weekly_summary_day.lower() == "tuesday":
-                schedule.every().tuesday.at(weekly_summary_time).do(generate_weekly_summary)
+                schedule.every().tuesday.at(weekly_summary_time).do(weekly_summary_task)
             elif weekly_summary_day.lower() == "wednesday":
-                schedule.every().wednesday.at(weekly_summary_time).do(generate_weekly_summary)
+                schedule.every().wednesday.at(weekly_summary_time).do(weekly_summary_task)
             elif weekly_summary_day.lower() == "thursday":
-                schedule.every().thursday.at(weekly_summary_time).do(generate_weekly_summary)
+                schedule.every().thursday.at(weekly_summary_time).do(weekly_summary_task)
             elif weekly_summary_day.lower() == "friday":
-                schedule.every().friday.at(weekly_summary_time).do(generate_weekly_summary)
+                schedule.every().friday.at(weekly_summary_time).do(weekly_summary_task)
             elif weekly_summary_day.lower() == "saturday":
-                schedule.every().saturday.at(weekly_summary_time).do(generate_weekly_summary)
+                schedule.every().saturday.at(weekly_summary_time).do(weekly_summary_task)
             elif weekly_summary_day.lower() == "sunday":
-                schedule.every().sunday.at(weekly_summary_time).do(generate_weekly_summary)
+                schedule.every().sunday.at(weekly_summary_time).do(weekly_summary_task)
             
             print(f"[{datetime.now().isoformat()}] Scheduled weekly summary on {weekly_summary_day} at {weekly_summary_time}")
         
         # Run the scheduler
         while not exit_event.is_set():
             schedule.run_pending()
-            time.sleep(1)
+            exit_event.wait(1)
             
             # Check for exit event more frequently
             if exit_event.is_set():
                 break
         
-        # Generate final report before exit
-        generate_daily_report()
-        print(f"[{datetime.now().isoformat()}] Final daily report generated")
+        if jobs is not None:
+            # Let running checks finish, then save what they changed
+            jobs.stop()
+            persist_state()
+        leading = registry is None or registry.is_leader()
+        if registry is not None:
+            registry.leave()
         
-        if weekly_summary_enabled:
-            generate_weekly_summary()
-            print(f"[{datetime.now().isoformat()}] Final weekly summary generated")
+        # Bring the reports up to date before exit
+        if leading:
+            update_reports(force=True)
+            export_site()
+        if site_export is not None:
+            site_export.close()
+        if notifier is not None:
+            # Send the digests still collecting
+            notifier.stop(shutdown_timeout)
         
         print(f"[{datetime.now().isoformat()}] ====== FedLoad Scheduler Stopped ======")
         
@@ -744,4 +948,10 @@ def main():
         sys.exit(0)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="FedLoad scheduler")
+    parser.add_argument("--worker", action="store_true",
+                        help="Run as one of several workers sharing the sites through the database")
+    parser.add_argument("--worker-id", help="Unique worker ID (default: hostname:pid)")
+    parser.add_argument("--metrics-port", type=int, help="Metrics port, overriding metrics.scheduler_port")
+    args = parser.parse_args()
+    main(args.worker, args.worker_id, args.metrics_port)
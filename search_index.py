@@ -0,0 +1,185 @@
+import logging
+import re
+import sqlite3
+from datetime import datetime
+from urllib.parse import urlparse
+
+logger = logging.getLogger("search_index")
+
+SEARCH_INDEX_FILE = "search_index.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    site TEXT NOT NULL,
+    time TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    latest INTEGER NOT NULL DEFAULT 1,
+    UNIQUE (url, hash)
+);
+CREATE INDEX IF NOT EXISTS pages_site_time ON pages (site, time);
+CREATE INDEX IF NOT EXISTS pages_time ON pages (time);
+CREATE TABLE IF NOT EXISTS page_entities (
+    page_id INTEGER NOT NULL REFERENCES pages (id) ON DELETE CASCADE,
+    entity TEXT NOT NULL COLLATE NOCASE,
+    type TEXT NOT NULL,
+    PRIMARY KEY (page_id, entity, type)
+);
+CREATE INDEX IF NOT EXISTS page_entities_entity ON page_entities (entity);
+CREATE VIRTUAL TABLE IF NOT EXISTS page_text USING fts5 (text, tokenize = 'porter unicode61');
+"""
+
+_TOKEN = re.compile(r'[^\s"]+\*?')
+
+
+def fts_query(text):
+    """Turn free text into a safe FTS5 query.
+
+    Every word is quoted, so FTS5 operators and punctuation in user input are
+    matched literally; a trailing '*' keeps prefix matching. Words are
+    combined with AND.
+
+    Args:
+        text (str): Search terms as typed by the user
+
+    Returns:
+        str: FTS5 MATCH expression, empty if there are no words
+    """
+    terms = []
+    for token in _TOKEN.findall(text):
+        prefix = token.endswith("*")
+        word = token.rstrip("*")
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+def site_of(url):
+    return urlparse(url).netloc.lower()
+
+
+class SearchIndex:
+    """Full-text index of extracted page text, backed by SQLite FTS5.
+
+    Every content version of a page is one row in `pages`, with its text in
+    the `page_text` FTS5 table (sharing the row ID) and its entities in
+    `page_entities`. The newest version of each URL is flagged `latest`.
+    Connections are opened per call, so one index can be shared by threads,
+    and WAL mode lets the API search while the scheduler writes.
+
+    Args:
+        path (str): SQLite database file
+    """
+
+    def __init__(self, path=SEARCH_INDEX_FILE):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def add_page(self, url, text, content_hash, entities=(), seen_at=None):
+        """Index a new version of a page.
+
+        A version that is already indexed (same URL and hash) is not added
+        again; if the page reverted to it, it becomes the latest version
+        again, seen at `seen_at`.
+
+        Args:
+            url (str): Page URL
+            text (str): Extracted page text
+            content_hash (str): Hash of the text
+            entities (iterable): (entity, type) pairs found in the text
+            seen_at (str): ISO timestamp; now if omitted
+
+        Returns:
+            bool: True if the version was added
+        """
+        seen_at = seen_at or datetime.now().isoformat()
+        conn = self._connect()
+        try:
+            with conn:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO pages (url, site, time, hash) VALUES (?, ?, ?, ?)",
+                    (url, site_of(url), seen_at, content_hash))
+                added = cursor.rowcount > 0
+                if added:
+                    page_id = cursor.lastrowid
+                    conn.execute("INSERT INTO page_text (rowid, text) VALUES (?, ?)", (page_id, text))
+                    conn.executemany("INSERT OR IGNORE INTO page_entities (page_id, entity, type) VALUES (?, ?, ?)",
+                                     [(page_id, entity, entity_type) for entity, entity_type in entities])
+                else:
+                    page_id, latest = conn.execute("SELECT id, latest FROM pages WHERE url = ? AND hash = ?",
+                                                   (url, content_hash)).fetchone()
+                    if latest:
+                        return False
+                    conn.execute("UPDATE pages SET latest = 1, time = ? WHERE id = ?", (seen_at, page_id))
+                conn.execute("UPDATE pages SET latest = 0 WHERE url = ? AND id != ?", (url, page_id))
+            return added
+        finally:
+            conn.close()
+
+    def search(self, query, site=None, since=None, until=None, entity=None,
+               latest_only=False, offset=0, limit=20):
+        """Search page text, best matches first.
+
+        Args:
+            query (str): Search terms (see `fts_query`)
+            site (str): Only pages on this host, e.g. 'www.federalreserve.gov'
+            since (str): Only versions seen at or after this ISO date/time
+            until (str): Only versions seen before this ISO date/time
+            entity (str): Only pages mentioning this entity (case-insensitive)
+            latest_only (bool): Ignore superseded versions of each page
+            offset (int): Results to skip
+            limit (int): Page size
+
+        Returns:
+            tuple: (total matches, list of result dicts with 'url', 'site',
+            'time', 'hash', 'latest', 'score' and 'snippet')
+        """
+        match = fts_query(query)
+        if not match:
+            return 0, []
+
+        conditions = ["page_text MATCH ?"]
+        params = [match]
+        if site:
+            conditions.append("pages.site = ?")
+            params.append(site.lower())
+        if since:
+            conditions.append("pages.time >= ?")
+            params.append(since)
+        if until:
+            conditions.append("pages.time < ?")
+            params.append(until)
+        if entity:
+            conditions.append("pages.id IN (SELECT page_id FROM page_entities WHERE entity = ?)")
+            params.append(entity)
+        if latest_only:
+            conditions.append("pages.latest = 1")
+        where = " AND ".join(conditions)
+
+        conn = self._connect()
+        try:
+            total = conn.execute(
+                f"SELECT COUNT(*) FROM page_text JOIN pages ON pages.id = page_text.rowid WHERE {where}",
+                params).fetchone()[0]
+            rows = conn.execute(
+                f"""SELECT pages.url, pages.site, pages.time, pages.hash, pages.latest,
+                           bm25(page_text) AS score,
+                           snippet(page_text, 0, '[', ']', '…', 16) AS snippet
+                    FROM page_text JOIN pages ON pages.id = page_text.rowid
+                    WHERE {where}
+                    ORDER BY score, pages.time DESC
+                    LIMIT ? OFFSET ?""",
+                params + [limit, offset]).fetchall()
+        finally:
+            conn.close()
+        # bm25() is lower for better matches; report higher-is-better scores
+        return total, [dict(row, latest=bool(row["latest"]), score=-row["score"]) for row in rows]
@@ -0,0 +1,261 @@
+import bisect
+import hashlib
+import logging
+import os
+import socket
+import sqlite3
+import subprocess
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger("sharding")
+
+SHARDING_FILE = "fedload.db"
+DEFAULT_WORKERS = 1
+DEFAULT_HEARTBEAT = 10  # seconds
+DEFAULT_LEASE_TIMEOUT = 30  # seconds without a heartbeat before a worker is considered gone
+DEFAULT_VIRTUAL_NODES = 64
+
+LIVE_WORKERS = metrics.Gauge(
+    "fedload_live_workers",
+    "Workers with a current heartbeat, as seen by this worker")
+OWNED_SITES = metrics.Gauge(
+    "fedload_owned_sites",
+    "Sites assigned to this worker")
+LEASE_CONFLICTS = metrics.Counter(
+    "fedload_lease_conflicts_total",
+    "Checks skipped because another worker held the URL's lease")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    hostname TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    started_at REAL NOT NULL,
+    heartbeat_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS url_leases (
+    url TEXT PRIMARY KEY,
+    worker_id TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+def _point(key):
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring mapping keys (host names) to workers.
+
+    Each worker is placed at `virtual_nodes` points of a 64-bit ring and a
+    key belongs to the first worker point at or after its own hash. When a
+    worker joins or leaves, only the keys next to its points move, about
+    1/N of them, so the other workers keep their hosts.
+
+    Args:
+        nodes (iterable): Worker IDs
+        virtual_nodes (int): Points per worker; more points even out the shares
+    """
+
+    def __init__(self, nodes=(), virtual_nodes=DEFAULT_VIRTUAL_NODES):
+        self.nodes = sorted(set(nodes))
+        points = sorted((_point(f"{node}#{i}"), node) for node in self.nodes for i in range(virtual_nodes))
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def owner(self, key):
+        """Return the worker ID owning `key`, or None for an empty ring."""
+        if not self._points:
+            return None
+        i = bisect.bisect_left(self._points, _point(key)) % len(self._points)
+        return self._owners[i]
+
+
+class WorkerRegistry:
+    """Worker membership, URL ownership and per-URL leases shared through SQLite.
+
+    Workers sharing the database register themselves and heartbeat every
+    `heartbeat` seconds. Workers whose last heartbeat is older than
+    `lease_timeout` are considered gone, so when a worker crashes its hosts
+    move to the others on their next heartbeat. Each URL belongs to the
+    worker its host name hashes to (a `HashRing` over the live workers),
+    which keeps a host's politeness limits within one process.
+
+    Views of the membership can briefly differ between workers, so a check
+    also takes a lease on its URL. The lease is renewed with the heartbeat
+    while the check runs and expires `lease_timeout` seconds after a crash;
+    a URL is therefore never checked by two workers at once.
+
+    Args:
+        path (str): SQLite database file (shared with the page store)
+        worker_id (str): Unique ID; hostname:pid if omitted
+        heartbeat (float): Seconds between heartbeats
+        lease_timeout (float): Seconds without a heartbeat before a worker and its leases expire
+        virtual_nodes (int): Ring points per worker
+    """
+
+    def __init__(self, path=SHARDING_FILE, worker_id=None, heartbeat=DEFAULT_HEARTBEAT,
+                 lease_timeout=DEFAULT_LEASE_TIMEOUT, virtual_nodes=DEFAULT_VIRTUAL_NODES):
+        self.path = path
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.heartbeat_interval = heartbeat
+        self.lease_timeout = lease_timeout
+        self.virtual_nodes = virtual_nodes
+        self.ring = HashRing([self.worker_id], virtual_nodes)
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._thread = None
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def heartbeat(self, now=None):
+        """Record this worker as alive, renew its leases and refresh the ring.
+
+        Returns:
+            bool: Whether the set of live workers changed
+        """
+        now = now or time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                """INSERT INTO workers (worker_id, hostname, pid, started_at, heartbeat_at) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT (worker_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at""",
+                (self.worker_id, socket.gethostname(), os.getpid(), now, now))
+            conn.execute("UPDATE url_leases SET expires_at = ? WHERE worker_id = ?",
+                         (now + self.lease_timeout, self.worker_id))
+            # Forget workers and leases that expired
+            conn.execute("DELETE FROM workers WHERE heartbeat_at < ?", (now - self.lease_timeout,))
+            conn.execute("DELETE FROM url_leases WHERE expires_at < ?", (now,))
+            live = [row[0] for row in conn.execute("SELECT worker_id FROM workers")]
+        LIVE_WORKERS.set(len(live))
+        if sorted(live) == self.ring.nodes:
+            return False
+        self.ring = HashRing(live, self.virtual_nodes)
+        return True
+
+    def workers(self):
+        """Return the live worker IDs as of the last heartbeat."""
+        return list(self.ring.nodes)
+
+    def owns(self, url):
+        """Whether `url`'s host hashes to this worker."""
+        return self.ring.owner(metrics.host_of(url)) == self.worker_id
+
+    def is_leader(self):
+        """Whether this worker runs the shared tasks (the live worker with the lowest ID)."""
+        return bool(self.ring.nodes) and self.ring.nodes[0] == self.worker_id
+
+    def claim(self, url, now=None):
+        """Take the lease on `url`; False if another worker holds a current one."""
+        now = now or time.time()
+        conn = self._conn()
+        with conn:
+            claimed = conn.execute(
+                """INSERT INTO url_leases (url, worker_id, expires_at) VALUES (?, ?, ?)
+                   ON CONFLICT (url) DO UPDATE SET worker_id = excluded.worker_id, expires_at = excluded.expires_at
+                   WHERE url_leases.expires_at < ? OR url_leases.worker_id = excluded.worker_id""",
+                (url, self.worker_id, now + self.lease_timeout, now)).rowcount == 1
+        if not claimed:
+            LEASE_CONFLICTS.inc()
+        return claimed
+
+    def release(self, url):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM url_leases WHERE url = ? AND worker_id = ?", (url, self.worker_id))
+
+    def start(self, on_change=None):
+        """Heartbeat in a background thread, calling `on_change()` when workers join or leave."""
+        self.heartbeat()
+
+        def run():
+            while not self._stop.wait(self.heartbeat_interval):
+                try:
+                    if self.heartbeat() and on_change is not None:
+                        logger.info(f"Live workers: {', '.join(self.ring.nodes)}")
+                        on_change()
+                except Exception as e:
+                    logger.error(f"Heartbeat of {self.worker_id} failed: {str(e)}")
+
+        self._thread = threading.Thread(target=run, name="heartbeat", daemon=True)
+        self._thread.start()
+
+    def leave(self):
+        """Stop heartbeating and hand this worker's hosts to the others right away."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM url_leases WHERE worker_id = ?", (self.worker_id,))
+            conn.execute("DELETE FROM workers WHERE worker_id = ?", (self.worker_id,))
+
+
+class WorkerPool:
+    """Runs worker processes on this host and restarts the ones that exit.
+
+    Args:
+        command (callable): command(index) -> argv of worker `index`
+        count (int): Number of workers
+        restart_delay (float): Seconds to wait before restarting an exited worker
+    """
+
+    def __init__(self, command, count, restart_delay=5):
+        self.command = command
+        self.count = count
+        self.restart_delay = restart_delay
+        self.processes = {}
+        self._exited = {}
+
+    def _spawn(self, index):
+        # A new session keeps terminal signals away from the workers; stop() forwards one SIGTERM
+        self.processes[index] = subprocess.Popen(self.command(index), start_new_session=True)
+        self._exited.pop(index, None)
+        logger.info(f"Started worker {index} (pid {self.processes[index].pid})")
+
+    def start(self):
+        for index in range(self.count):
+            self._spawn(index)
+
+    def poll(self):
+        """Restart workers that exited; returns the indexes restarted."""
+        restarted = []
+        now = time.time()
+        for index, process in self.processes.items():
+            code = process.poll()
+            if code is None:
+                continue
+            exited_at = self._exited.setdefault(index, now)
+            if exited_at == now:
+                logger.warning(f"Worker {index} (pid {process.pid}) exited with code {code}")
+            if now - exited_at >= self.restart_delay:
+                restarted.append(index)
+        for index in restarted:
+            self._spawn(index)
+        return restarted
+
+    def stop(self, timeout=30):
+        """Ask every worker to finish, killing those still running after `timeout` seconds."""
+        for process in self.processes.values():
+            if process.poll() is None:
+                process.terminate()
+        deadline = time.time() + timeout
+        for process in self.processes.values():
+            try:
+                process.wait(max(deadline - time.time(), 0))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
@@ -0,0 +1,364 @@
+import argparse
+import json
+import logging
+import sqlite3
+import sys
+import threading
+from array import array
+from datetime import datetime
+
+from knowledge_base import entity_id
+
+logger = logging.getLogger("storage")
+
+STORAGE_FILE = "fedload.db"
+ENTITY_STORE_JSON = "entity_store.json"
+
+# Entity columns hold packed little-endian uint32 arrays of string IDs:
+# entities (most frequent first), entity_counts (aligned with entities)
+# and fed_entities as (type, text, knowledge base ID) triples
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    hash TEXT,
+    checked_at TEXT,
+    changed_at TEXT,
+    entities BLOB NOT NULL DEFAULT x'',
+    entity_counts BLOB NOT NULL DEFAULT x'',
+    fed_entities BLOB NOT NULL DEFAULT x''
+);
+CREATE TABLE IF NOT EXISTS strings (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS http_validators (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT
+);
+"""
+
+_FED_FIELDS = ("fed_people", "fed_organizations", "fed_publications")
+
+ENTITY_ENCODING = "interned-v1"
+
+
+def _pack(values):
+    arr = array("I", values)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _unpack(blob):
+    arr = array("I")
+    arr.frombytes(blob)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr
+
+
+class Storage:
+    """Per-URL state (hash, check times and entities) in SQLite.
+
+    The database runs in WAL mode, so the API can read while the scheduler
+    writes, and every change is a single-row upsert committed on its own:
+    a crash loses at most the page being written, never the whole store.
+    Each thread gets its own connection.
+
+    Entity strings are stored once in a global string table and pages hold
+    arrays of their IDs. FED entities are kept as (type, text, knowledge
+    base ID) and read back as small dicts with those three keys; titles and
+    descriptions are looked up in the knowledge base when a response needs
+    them. Decoded strings are shared through an in-memory table, so every
+    page mentioning "Powell" references the same string object.
+
+    Args:
+        path (str): SQLite database file
+    """
+
+    def __init__(self, path=STORAGE_FILE):
+        self.path = path
+        self._local = threading.local()
+        self._version_lock = threading.Lock()
+        self._version_conn = None
+        self._strings_lock = threading.Lock()
+        self._ids = {}
+        self._texts = {}
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        self._upgrade()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _intern(self, conn, texts, pending):
+        """Return the string ID of each text, adding new strings to the table.
+
+        IDs read inside the caller's transaction go to `pending` and only
+        enter the shared table through `_remember()` once it has committed.
+        """
+        with self._strings_lock:
+            known = {text: self._ids[text] for text in texts if text in self._ids}
+        missing = sorted({text for text in texts if text not in known and text not in pending})
+        if missing:
+            conn.executemany("INSERT OR IGNORE INTO strings (text) VALUES (?)", [(text,) for text in missing])
+            for chunk in _chunks(missing):
+                placeholders = ",".join("?" * len(chunk))
+                for row in conn.execute(f"SELECT id, text FROM strings WHERE text IN ({placeholders})", chunk):
+                    pending[row["text"]] = row["id"]
+        return [known[text] if text in known else pending[text] for text in texts]
+
+    def _remember(self, pending):
+        with self._strings_lock:
+            for text, string_id in pending.items():
+                self._ids[text] = string_id
+                self._texts[string_id] = text
+
+    def _lookup(self, ids):
+        """Return the text of each string ID, loading unknown IDs from the table."""
+        with self._strings_lock:
+            missing = {string_id for string_id in ids if string_id not in self._texts}
+        if missing:
+            found = {}
+            for chunk in _chunks(sorted(missing)):
+                placeholders = ",".join("?" * len(chunk))
+                for row in self._conn().execute(f"SELECT id, text FROM strings WHERE id IN ({placeholders})", chunk):
+                    found[row["text"]] = row["id"]
+            self._remember(found)
+        with self._strings_lock:
+            return [self._texts[string_id] for string_id in ids]
+
+    def _encode(self, conn, entities, entity_counts, fed_entities, pending):
+        fed_strings = []
+        for entity in fed_entities:
+            fed_strings += [entity["type"], entity["text"], entity_id(entity)]
+        ids = self._intern(conn, list(entities) + fed_strings, pending)
+        return (_pack(ids[:len(entities)]),
+                _pack(entity_counts.get(text, 1) for text in entities),
+                _pack(ids[len(entities):]))
+
+    def _page(self, row):
+        entity_ids = _unpack(row["entities"])
+        fed_ids = _unpack(row["fed_entities"])
+        texts = self._lookup(list(entity_ids) + list(fed_ids))
+        entities = texts[:len(entity_ids)]
+        fed_texts = texts[len(entity_ids):]
+        return {
+            "url": row["url"],
+            "hash": row["hash"],
+            "checked_at": row["checked_at"],
+            "changed_at": row["changed_at"],
+            "entities": entities,
+            "entity_counts": dict(zip(entities, _unpack(row["entity_counts"]))),
+            "fed_entities": [{"type": fed_texts[i], "text": fed_texts[i + 1], "id": fed_texts[i + 2]}
+                             for i in range(0, len(fed_texts), 3)]
+        }
+
+    def get_page(self, url):
+        """Return a page with its entities decoded, or None if it is unknown.
+
+        FED entities come back as {"type", "text", "id"} dicts; use
+        `KnowledgeBase.lookup(type, id)` for the rest of the record.
+        """
+        row = self._conn().execute("SELECT * FROM pages WHERE url = ?", (url,)).fetchone()
+        return self._page(row) if row else None
+
+    def get_hash(self, url):
+        row = self._conn().execute("SELECT hash FROM pages WHERE url = ?", (url,)).fetchone()
+        return row["hash"] if row else None
+
+    def get_validators(self, url):
+        """Return the HTTP validators ('etag', 'last_modified') stored with the page's hash."""
+        row = self._conn().execute("SELECT etag, last_modified FROM http_validators WHERE url = ?", (url,)).fetchone()
+        return {"etag": row["etag"], "last_modified": row["last_modified"]} if row else {}
+
+    def _save_validators(self, conn, url, validators):
+        # Stored in the page's transaction: validators must never be newer than the hash
+        if validators is None:
+            return
+        if validators.get("etag") or validators.get("last_modified"):
+            conn.execute(
+                """INSERT INTO http_validators (url, etag, last_modified) VALUES (?, ?, ?)
+                   ON CONFLICT (url) DO UPDATE SET etag = excluded.etag, last_modified = excluded.last_modified""",
+                (url, validators.get("etag"), validators.get("last_modified")))
+        else:
+            conn.execute("DELETE FROM http_validators WHERE url = ?", (url,))
+
+    def pages(self):
+        """Yield every stored page as a dict."""
+        for row in self._conn().execute("SELECT * FROM pages ORDER BY url"):
+            yield self._page(row)
+
+    def save_page(self, url, content_hash, entities, entity_counts, fed_entities, seen_at=None, validators=None):
+        """Record a new version of a page and its entities.
+
+        Args:
+            url (str): Page URL
+            content_hash (str): Hash of the extracted text
+            entities (list): Basic entities, most frequent first
+            entity_counts (dict): Basic entity -> occurrences
+            fed_entities (list): FED entity dicts
+            seen_at (str): ISO timestamp; now if omitted
+            validators (dict): HTTP validators of the fetched version, if any
+        """
+        seen_at = seen_at or datetime.now().isoformat()
+        conn = self._conn()
+        pending = {}
+        with conn:
+            encoded = self._encode(conn, entities, entity_counts, fed_entities, pending)
+            conn.execute(
+                """INSERT INTO pages (url, hash, checked_at, changed_at, entities, entity_counts, fed_entities)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (url) DO UPDATE SET
+                       hash = excluded.hash, checked_at = excluded.checked_at,
+                       changed_at = excluded.changed_at, entities = excluded.entities,
+                       entity_counts = excluded.entity_counts, fed_entities = excluded.fed_entities""",
+                (url, content_hash, seen_at, seen_at) + encoded)
+            self._save_validators(conn, url, validators)
+        self._remember(pending)
+
+    def record_check(self, url, checked_at=None, validators=None):
+        """Record that a page was checked and had not changed (with its current HTTP validators, if any)."""
+        checked_at = checked_at or datetime.now().isoformat()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                """INSERT INTO pages (url, checked_at, entities, entity_counts, fed_entities)
+                   VALUES (?, ?, x'', x'', x'')
+                   ON CONFLICT (url) DO UPDATE SET checked_at = excluded.checked_at""",
+                (url, checked_at))
+            self._save_validators(conn, url, validators)
+
+    def as_entity_store(self):
+        """Return every page in the scheduler's former entity_store.json layout."""
+        return {"entities": {page["url"]: {"hash": page["hash"],
+                                           "entities": page["entities"],
+                                           "entity_counts": page["entity_counts"],
+                                           "fed_entities": page["fed_entities"],
+                                           "time": page["changed_at"]}
+                             for page in self.pages() if page["hash"] is not None}}
+
+    def data_version(self):
+        """Return a value that changes whenever another connection commits.
+
+        Used by readers to notice writes by the scheduler without polling
+        the data itself.
+        """
+        with self._version_lock:
+            if self._version_conn is None:
+                self._version_conn = sqlite3.connect(self.path, check_same_thread=False)
+            return self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def get_meta(self, key):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def migrate_json(self, path=ENTITY_STORE_JSON):
+        """Import entity_store.json once, in either of its historical layouts.
+
+        The scheduler wrote {"entities": {url: {"hash": ..., ...}}}; the API
+        wrote {url: {"basic": [...], "fed_people": [...], ...}} without a
+        hash. Pages already in the database are left untouched, and the
+        import is recorded so it never runs twice. The JSON file is kept.
+
+        Returns:
+            int: Number of pages imported (0 if already migrated or no file)
+        """
+        if self.get_meta("json_migrated_from"):
+            return 0
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {}
+        except Exception as e:
+            logger.error(f"Could not read {path} for migration: {str(e)}")
+            return 0
+
+        pages = data["entities"] if isinstance(data.get("entities"), dict) else data
+        rows = []
+        for url, page in pages.items():
+            if not isinstance(page, dict):
+                continue
+            entities = page.get("entities", page.get("basic", []))
+            counts = page.get("entity_counts") or {text: 1 for text in entities}
+            fed_entities = list(page.get("fed_entities", []))
+            for field in _FED_FIELDS:
+                fed_entities += [e for e in page.get(field, []) if isinstance(e, dict)]
+            rows.append((url, page.get("hash"), page.get("time"), entities, counts, fed_entities))
+
+        conn = self._conn()
+        pending = {}
+        with conn:
+            # Takes the write lock first, so concurrent migrations do not both run
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated_from'").fetchone():
+                return 0
+            rows = [(url, content_hash, seen_at) + self._encode(conn, entities, counts, fed_entities, pending)
+                    for url, content_hash, seen_at, entities, counts, fed_entities in rows]
+            cursor = conn.executemany(
+                """INSERT OR IGNORE INTO pages (url, hash, changed_at, entities, entity_counts, fed_entities)
+                   VALUES (?, ?, ?, ?, ?, ?)""", rows)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated_from', ?)", (path,))
+        self._remember(pending)
+        imported = cursor.rowcount if rows else 0
+        if imported:
+            logger.info(f"Migrated {imported} pages from {path} to {self.path}")
+        return imported
+
+    def _upgrade(self):
+        """Convert pages written with JSON entity columns to the interned encoding, once."""
+        if self.get_meta("entity_encoding") == ENTITY_ENCODING:
+            return
+        conn = self._conn()
+        pending = {}
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'entity_encoding'").fetchone():
+                return
+            rows = conn.execute("""SELECT url, entities, entity_counts, fed_entities FROM pages
+                                   WHERE typeof(entities) = 'text'""").fetchall()
+            for row in rows:
+                entities = json.loads(row["entities"])
+                encoded = self._encode(conn, entities, json.loads(row["entity_counts"]),
+                                       [e for e in json.loads(row["fed_entities"]) if isinstance(e, dict)], pending)
+                conn.execute("UPDATE pages SET entities = ?, entity_counts = ?, fed_entities = ? WHERE url = ?",
+                             encoded + (row["url"],))
+            conn.execute("INSERT INTO meta (key, value) VALUES ('entity_encoding', ?)", (ENTITY_ENCODING,))
+        self._remember(pending)
+        if rows:
+            logger.info(f"Converted {len(rows)} pages in {self.path} to interned entity storage")
+
+
+def _chunks(values, size=500):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the FedLoad SQLite store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate = subparsers.add_parser("migrate", help="Import entity_store.json (runs once)")
+    migrate.add_argument("--json", default=ENTITY_STORE_JSON)
+    migrate.add_argument("--database", default=STORAGE_FILE)
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        imported = Storage(args.database).migrate_json(args.json)
+        print(f"Imported {imported} pages into {args.database}")
+
+
+if __name__ == "__main__":
+    main()
@@ -27,3 +27,822 @@ def test_is_changed():
     h3 = hash_content("other")
     assert is_changed(h1, h3)
     assert not is_changed(h1, h2)
+
+def test_knowledge_base_extract_fed_entities():
+    from knowledge_base import KnowledgeBase
+    kb = KnowledgeBase({
+        "people": [{"name": "Jerome H. Powell", "title": "Chair", "aliases": ["Powell", "Chair Powell"]}],
+        "organizations": [{"name": "Federal Open Market Committee", "acronym": "FOMC"}],
+        "publications": [{"name": "Beige Book", "full_name": "Summary of Commentary"}],
+    })
+    found = kb.extract_fed_entities("Chair Powell said the FOMC met.")
+    assert [(e["type"], e["text"]) for e in found] == [("person", "Powell"), ("organization", "FOMC")]
+    assert found[0]["full_name"] == "Jerome H. Powell"
+    spans = kb.find_spans("Chair Powell")
+    assert (0, 12, "FED_PERSON") in spans and (6, 12, "FED_PERSON") in spans
+
+def test_knowledge_base_manager_reloads_on_change(tmp_path):
+    import json
+    import os
+    from knowledge_base import KnowledgeBaseManager
+    path = tmp_path / "fed_entities.json"
+    path.write_text(json.dumps({"people": [{"name": "Powell"}]}))
+    manager = KnowledgeBaseManager(str(path), str(tmp_path / "missing.json"), check_interval=0)
+    first = manager.get()
+    assert first.lookup("person", "Powell") is not None
+
+    path.write_text(json.dumps({"people": [{"name": "Cook"}]}))
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+    second = manager.get()
+    assert second is not first and second.version != first.version
+    assert second.lookup("person", "Cook") is not None
+
+    path.write_text("{not json")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 2 * 10**9))
+    assert manager.get() is second
+
+def test_knowledge_base_artifact_roundtrip(tmp_path):
+    import json
+    import os
+    from knowledge_base import build_artifact, load_artifact
+    entities = tmp_path / "fed_entities.json"
+    entities.write_text(json.dumps({
+        "people": [{"name": "Jerome H. Powell", "aliases": ["Powell", "Chair Powell"]}],
+        "publications": [{"name": "Beige Book", "full_name": "Summary of Commentary"}],
+    }))
+    terms = tmp_path / "fed_terms.json"
+    artifact = tmp_path / "fed_kb.bin"
+    built = build_artifact(str(artifact), str(entities), str(terms))
+
+    loaded = load_artifact(str(artifact), str(entities), str(terms))
+    assert loaded.version == built.version
+    text = "Chair Powell discussed the Beige Book."
+    assert loaded.extract_fed_entities(text) == built.extract_fed_entities(text)
+    assert loaded.data == built.data
+
+    os.utime(entities, ns=(0, os.stat(entities).st_mtime_ns + 10**9))
+    assert load_artifact(str(artifact), str(entities), str(terms)) is None
+
+def test_annotation_cache_tiers(tmp_path, monkeypatch):
+    from annotation_cache import AnnotationCache, cache_key
+    key = cache_key(hash_content("some text"), "en_core_web_sm-3.8.0/1", "kbv1")
+    assert key != cache_key(hash_content("some text"), "en_core_web_sm-3.8.0/1", "kbv2")
+
+    annotation = {"basic_entities": ["Board"], "fed_entities": [], "summary": "some text"}
+    cache = AnnotationCache(str(tmp_path), memory_entries=1)
+    assert cache.get(key) is None
+    cache.put(key, annotation)
+    cache.put("other", {"basic_entities": [], "fed_entities": [], "summary": ""})
+    assert key not in cache._entries
+    assert cache.get(key) == annotation
+
+    # A second process sees the persisted entry
+    assert AnnotationCache(str(tmp_path)).get(key) == annotation
+    assert AnnotationCache(None).get(key) is None
+
+    # The disk tier keeps the most recently used files
+    import os
+    import annotation_cache
+    bounded = AnnotationCache(str(tmp_path / "bounded"), memory_entries=1, disk_entries=3)
+    for i in range(5):
+        bounded.put(f"{i:02d}key", {"n": i})
+        path = bounded._path(f"{i:02d}key")
+        os.utime(path, ns=(i * 10**9, i * 10**9))
+    os.utime(bounded._path("00key"), ns=(9 * 10**9, 9 * 10**9))
+    assert bounded.prune() == 2
+    assert sorted(p.name for p in (tmp_path / "bounded").rglob("*.json")) == ["00key.json", "03key.json", "04key.json"]
+    monkeypatch.setattr(annotation_cache, "PRUNE_EVERY", 2)
+    bounded.put("05key", {"n": 5})
+    assert len(list((tmp_path / "bounded").rglob("*.json"))) == 3
+
+def test_doc_store_roundtrip(tmp_path):
+    spacy = pytest.importorskip("spacy")
+    from doc_store import DocStore, add_fed_spans, mentions
+    from knowledge_base import KnowledgeBase
+    nlp = spacy.blank("en")
+    nlp.add_pipe("sentencizer")
+    kb = KnowledgeBase({"publications": [{"name": "Beige Book"}]})
+    store = DocStore(str(tmp_path), max_versions=1)
+    url = "https://www.federalreserve.gov/monetarypolicy/beigebook"
+
+    store.save(url, "v1", add_fed_spans(nlp("Old text."), kb))
+    store.save(url, "v2", add_fed_spans(nlp("Rates held. The Beige Book was released."), kb))
+    assert store.urls() == [url]
+    assert [v["hash"] for v in store.versions(url)] == ["v2"]
+    assert store.load(url, nlp.vocab, "v1") is None
+
+    doc = store.load(url, nlp.vocab)
+    found = mentions(doc, "Beige Book")
+    assert found[0]["label"] == "FED_PUB"
+    assert found[0]["sentence"] == "The Beige Book was released."
+
+def test_basic_entity_counts():
+    spacy = pytest.importorskip("spacy")
+    from annotator import basic_entity_counts, entity_counts_simple
+    nlp = spacy.blank("en")
+    doc = nlp("The Board met. The Board and the FOMC spoke to A Reporter.")
+    assert basic_entity_counts(doc) == {"Board": 2, "The": 2, "Reporter": 1}
+    assert list(entity_counts_simple("Board Board Policy")) == ["Board", "Policy"]
+
+def test_single_flight_and_admission():
+    import asyncio
+    from concurrency import AdmissionController, Saturated, SingleFlight
+
+    async def scenario():
+        flights = SingleFlight()
+        calls = []
+
+        async def job():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*[flights.do("url", job) for _ in range(5)])
+        assert results == ["result"] * 5 and len(calls) == 1
+        assert "url" not in flights
+
+        admission = AdmissionController(max_active=1, max_queued=1)
+
+        async def guarded():
+            async with admission:
+                await asyncio.sleep(0.01)
+
+        outcomes = await asyncio.gather(*[guarded() for _ in range(3)], return_exceptions=True)
+        assert [isinstance(o, Saturated) for o in outcomes] == [False, False, True]
+
+    asyncio.run(scenario())
+
+def test_response_cache_etags_and_invalidation():
+    from response_cache import ResponseCache, etag_matches
+    cache = ResponseCache({"entities": 30, "check": 0})
+    entry = cache.put("entities", None, {"a": 1})
+    assert cache.get("entities") is entry
+    assert etag_matches(entry.etag, entry.etag)
+    assert etag_matches(f'W/{entry.etag}, "other"', entry.etag)
+    assert not etag_matches('"other"', entry.etag)
+    assert cache.put("entities", None, {"a": 1}).etag == entry.etag
+
+    cache.put("check", "https://www.federalreserve.gov/", {})
+    assert cache.get("check", "https://www.federalreserve.gov/") is None
+    cache.invalidate("entities")
+    assert cache.get("entities") is None
+
+def test_change_event_journal(tmp_path):
+    from events import ChangeEventReader, publish_change
+    path = str(tmp_path / "change_events.jsonl")
+    reader = ChangeEventReader(path)
+    assert reader.poll() == []
+    publish_change("https://www.federalreserve.gov/", None, "h1", {}, path)
+    publish_change("https://www.federalreserve.gov/", "h1", "h2", {}, path)
+    events = reader.poll()
+    assert [e["new_hash"] for e in events] == ["h1", "h2"]
+    assert reader.poll() == []
+
+    resumed = ChangeEventReader(path, offset=events[0]["offset"])
+    assert [e["new_hash"] for e in resumed.poll()] == ["h2"]
+
+    capped = ChangeEventReader(path, offset=0, max_events=1)
+    assert [e["new_hash"] for e in capped.poll() + capped.poll()] == ["h1", "h2"]
+
+    # Trimming to the retention window keeps the offsets of the remaining events
+    from datetime import datetime, timedelta
+    from events import trim_events
+    publish_change("https://www.federalreserve.gov/", "h2", "h3", {}, path)
+    live = ChangeEventReader(path)
+    assert trim_events(path, 2, datetime.now() + timedelta(days=1)) == 0
+    assert trim_events(path, 2, datetime.now() + timedelta(days=3)) == 3
+    publish_change("https://www.federalreserve.gov/", "h3", "h4", {}, path)
+    assert [e["new_hash"] for e in live.poll()] == ["h4"]
+    assert [e["new_hash"] for e in ChangeEventReader(path, offset=events[0]["offset"]).poll()] == ["h4"]
+    assert [e["new_hash"] for e in ChangeEventReader(path, offset=0).poll()] == ["h4"]
+    assert trim_events(path, 2, datetime.now() + timedelta(days=3)) == 1
+    publish_change("https://www.federalreserve.gov/", "h4", "h5", {}, path)
+    assert [e["new_hash"] for e in live.poll()] == ["h5"]
+
+def test_entity_index_incremental_updates(tmp_path):
+    from entity_index import EntityIndex, load_entity_index, save_entity_index
+    fomc = {"text": "FOMC", "type": "organization", "full_name": "Federal Open Market Committee"}
+    index = EntityIndex()
+    index.update_url("https://a", {"Powell": 3, "Rates": 1}, [fomc], "2024-01-01T00:00:00")
+    index.update_url("https://b", {"Powell": 2}, [], "2024-01-02T00:00:00")
+
+    total, items = index.query("basic")
+    assert total == 2
+    assert (items[0]["entity"], items[0]["count"], items[0]["last_seen"]) == ("Powell", 5, "2024-01-02T00:00:00")
+    assert index.query("organization")[1][0]["id"] == "Federal Open Market Committee"
+
+    # Re-checking a page replaces its previous contribution
+    index.update_url("https://a", {"Powell": 1}, [], "2024-01-03T00:00:00")
+    assert index.query("organization")[0] == 0
+    assert [(e["entity"], e["count"]) for e in index.query(sort="entity", descending=False)[1]] == [("Powell", 3)]
+    assert index.query(offset=1)[1] == []
+
+    path = str(tmp_path / "entity_index.json")
+    save_entity_index(index, path)
+    assert load_entity_index(path).query()[1] == index.query()[1]
+
+def test_search_index_ranking_and_filters(tmp_path):
+    from search_index import SearchIndex, fts_query
+    index = SearchIndex(str(tmp_path / "search_index.db"))
+    url = "https://www.federalreserve.gov/monetarypolicy/fomc.htm"
+    assert index.add_page(url, "The FOMC raised rates. Inflation remains elevated.", "h1",
+                          [("FOMC", "organization")], "2024-01-01T00:00:00")
+    assert index.add_page(url, "The FOMC held rates steady as inflation eased.", "h2",
+                          [("FOMC", "organization")], "2024-02-01T00:00:00")
+    assert not index.add_page(url, "duplicate", "h2")
+    index.add_page("https://example.org/", "Inflation expectations survey", "h3", [], "2024-03-01T00:00:00")
+
+    total, results = index.search("inflation")
+    assert total == 3
+    assert "[" in results[0]["snippet"]
+    assert index.search("inflation", site="example.org")[0] == 1
+    assert index.search("inflation", since="2024-01-15", until="2024-02-15")[1][0]["hash"] == "h2"
+    assert [r["hash"] for r in index.search("rat*", entity="fomc", latest_only=True)[1]] == ["h2"]
+    assert fts_query('NEAR("x') == '"NEAR(" "x"'
+
+    # Reverting to an earlier version makes it the latest again
+    assert not index.add_page(url, "The FOMC raised rates. Inflation remains elevated.", "h1",
+                              seen_at="2024-04-01T00:00:00")
+    (result,) = index.search("fomc", latest_only=True)[1]
+    assert result["hash"] == "h1" and result["time"] == "2024-04-01T00:00:00"
+
+def test_metrics_exposition():
+    from metrics import Counter, Histogram, Registry, stage
+    registry = Registry()
+    errors = Counter("test_errors_total", "Errors", ["host"], registry=registry)
+    latency = Histogram("test_seconds", "Latency", buckets=(0.1, 1), registry=registry)
+    errors.labels(host='a"b').inc(2)
+    latency.observe(0.05)
+    latency.observe(5)
+
+    text = registry.render()
+    assert "# TYPE test_errors_total counter" in text
+    assert 'test_errors_total{host="a\\"b"} 2' in text
+    assert 'test_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_seconds_bucket{le="1"} 1' in text
+    assert 'test_seconds_bucket{le="+Inf"} 2' in text
+    assert "test_seconds_count 2" in text
+
+    with pytest.raises(ValueError):
+        with stage("parse", "https://www.federalreserve.gov/x"):
+            raise ValueError("boom")
+
+def test_tracing_records_spans_and_report(tmp_path):
+    import tracing
+    from metrics import stage
+    path = str(tmp_path / "traces.jsonl")
+    tracer = tracing.Tracer(path, enabled=True, profile_rate=1.0)
+    url = "https://www.federalreserve.gov/monetarypolicy.htm"
+
+    with tracer.trace(url, "scheduler"):
+        with stage("hashing", url):
+            tracing.profiled(sum)(range(1000))
+        tracing.annotate(text_length=42)
+    tracing.annotate(ignored=True)
+
+    (record,) = tracing.load_traces(path)
+    assert record["url"] == url and record["text_length"] == 42
+    assert [span["name"] for span in record["spans"]] == ["hashing"]
+    assert record["functions"]
+    assert url in tracing.report([record])
+
+def test_tracing_concurrent_profiled_calls(tmp_path):
+    import threading
+    import tracing
+    path = str(tmp_path / "traces.jsonl")
+    tracer = tracing.Tracer(path, enabled=True, profile_rate=1.0)
+    barrier = threading.Barrier(2, timeout=5)
+    results = []
+
+    def work(n):
+        barrier.wait()
+        return sum(range(n))
+
+    def check(n):
+        with tracer.trace(f"https://www.federalreserve.gov/{n}", "scheduler"):
+            results.append(tracing.profiled(work)(n))
+
+    threads = [threading.Thread(target=check, args=(n,)) for n in (10, 20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == [45, 190]
+    records = tracing.load_traces(path)
+    assert len(records) == 2 and not any("error" in record for record in records)
+    assert sum(1 for record in records if record.get("functions")) == 1
+
+def test_storage_upserts_and_json_migration(tmp_path):
+    import json
+    from storage import Storage
+    legacy = tmp_path / "entity_store.json"
+    legacy.write_text(json.dumps({"entities": {"https://a": {"hash": "h0", "entities": ["Powell"],
+                                                            "fed_entities": []}}}))
+    storage = Storage(str(tmp_path / "fedload.db"))
+    assert storage.migrate_json(str(legacy)) == 1
+    assert storage.migrate_json(str(legacy)) == 0
+    assert storage.get_hash("https://a") == "h0"
+    assert storage.get_page("https://a")["entity_counts"] == {"Powell": 1}
+
+    version = storage.data_version()
+    writer = Storage(storage.path)
+    writer.save_page("https://a", "h1", ["Cook"], {"Cook": 2}, [{"text": "FOMC", "type": "organization"}])
+    writer.record_check("https://b")
+    assert storage.data_version() != version
+    assert storage.get_hash("https://a") == "h1"
+    assert storage.get_hash("https://b") is None
+    assert list(storage.as_entity_store()["entities"]) == ["https://a"]
+
+def test_storage_interns_entity_strings(tmp_path):
+    import sqlite3
+    from storage import Storage
+    storage = Storage(str(tmp_path / "fedload.db"))
+    fomc = {"text": "FOMC", "type": "organization", "id": "Federal Open Market Committee",
+            "full_name": "Federal Open Market Committee", "description": "Sets monetary policy"}
+    storage.save_page("https://a", "h1", ["Powell", "Rates"], {"Powell": 3, "Rates": 1}, [fomc])
+    storage.save_page("https://b", "h2", ["Powell"], {"Powell": 2}, [fomc])
+
+    page = Storage(storage.path).get_page("https://a")
+    assert page["entities"] == ["Powell", "Rates"]
+    assert page["entity_counts"] == {"Powell": 3, "Rates": 1}
+    assert page["fed_entities"] == [{"type": "organization", "text": "FOMC", "id": "Federal Open Market Committee"}]
+    conn = sqlite3.connect(storage.path)
+    assert conn.execute("SELECT COUNT(*) FROM strings").fetchone()[0] == 5
+
+def test_change_log_segments_and_retention(tmp_path):
+    import json
+    from datetime import datetime, timedelta
+    from change_log import ChangeLog
+    now = datetime(2024, 6, 30, 12, 0)
+    log = ChangeLog(str(tmp_path / "change_log"), retention_days=90)
+    for days_ago in (120, 10, 1, 0):
+        log.append({"url": f"https://a/{days_ago}", "time": (now - timedelta(days=days_ago)).isoformat(),
+                    "changed": True})
+    assert len(log.segments()) == 4
+    assert [e["url"] for e in log.read(since=now - timedelta(days=2))] == ["https://a/1", "https://a/0"]
+
+    assert log.enforce_retention(now) == 1
+    assert [e["url"] for e in log.read()] == ["https://a/10", "https://a/1", "https://a/0"]
+
+    legacy = tmp_path / "change_log.json"
+    legacy.write_text(json.dumps([{"url": "https://b", "time": now.isoformat(), "changed": False}]))
+    assert log.migrate_json(str(legacy)) == 1
+    assert log.migrate_json(str(legacy)) == 0
+    assert len(list(log.read(since=now))) == 2
+
+def test_cycle_checkpoint_resume(tmp_path):
+    from checkpoint import CycleCheckpoint
+    path = tmp_path / "cycle_checkpoint.jsonl"
+    checkpoint = CycleCheckpoint(str(path))
+    assert checkpoint.load() is None
+
+    state = checkpoint.start(["https://a", "https://b", "https://c"])
+    checkpoint.mark_done(state, "https://a")
+    # A write torn by a crash is ignored, so that site is checked again
+    with open(path, "a") as f:
+        f.write('{"done": "https://b')
+
+    resumed = checkpoint.load()
+    assert resumed["cycle"] == state["cycle"]
+    assert CycleCheckpoint.remaining(resumed) == ["https://b", "https://c"]
+    checkpoint.mark_done(resumed, "https://b")
+    assert CycleCheckpoint.remaining(checkpoint.load()) == ["https://c"]
+
+    checkpoint.finish()
+    assert checkpoint.load() is None
+
+def test_mention_rollups_windows(tmp_path):
+    from datetime import datetime, timedelta
+    from rollups import MentionRollups
+    rollups = MentionRollups(str(tmp_path / "rollups.db"))
+    now = datetime.now().replace(minute=30, second=0, microsecond=0)
+    def change(url, when, people):
+        return {"url": url, "time": when.isoformat(), "changed": True,
+                "entities_found": {"basic": [], "fed_people": people, "fed_organizations": [], "fed_publications": []}}
+    assert rollups.backfill([change("https://a", now - timedelta(days=3), ["Jerome Powell"]),
+                             {"url": "https://a", "time": now.isoformat(), "changed": False, "error": "timeout"}]) == 1
+    assert rollups.backfill([change("https://a", now, ["Jerome Powell"])]) == 0
+    rollups.add(change("https://a", now - timedelta(hours=2), ["Jerome Powell", "Lisa Cook"]))
+    rollups.add(change("https://b", now, ["Jerome Powell"]))
+
+    assert rollups.mentions(now - timedelta(days=1), now, "person") == [
+        ("Jerome Powell", "person", 2), ("Lisa Cook", "person", 1)]
+    assert rollups.mentions(now - timedelta(days=7), now, "person", site="https://a")[0] == ("Jerome Powell", "person", 2)
+    assert rollups.changes(now - timedelta(days=7), now) == [("https://a", 2), ("https://b", 1)]
+    assert rollups.changes(now - timedelta(hours=1), now) == [("https://b", 1)]
+
+def test_adaptive_polling_intervals(tmp_path):
+    from datetime import datetime, timedelta
+    from polling import AdaptivePolling
+    polling = AdaptivePolling(str(tmp_path / "fedload.db"), base_interval=30, min_interval=5, max_interval=1440)
+    start = datetime(2024, 1, 1)
+    urls = ["https://busy", "https://static", "https://new"]
+    assert polling.due(urls, start) == urls
+
+    # Two days of half-hourly checks: one page changes every time, one never
+    for step in range(96):
+        now = start + timedelta(minutes=30 * step)
+        polling.record_check("https://busy", step > 0, now)
+        polling.record_check("https://static", False if step > 0 else None, now)
+
+    intervals = polling.intervals(urls, now)
+    assert intervals["https://busy"] < 30 < intervals["https://static"]
+    assert 5 <= intervals["https://busy"] and intervals["https://static"] <= 1440
+    # The overall number of checks matches checking every URL every 30 minutes
+    assert abs(sum(1 / i for i in intervals.values()) - len(urls) / 30) < 1e-9
+    assert polling.due(urls, now + timedelta(minutes=intervals["https://busy"] + 1)) == ["https://busy", "https://new"]
+
+def test_job_scheduler_overlap_and_rescheduling():
+    import threading
+    import time
+    from jobs import JobScheduler
+    lock = threading.Lock()
+    running = set()
+    started = []
+    overlaps = []
+    def run(url):
+        with lock:
+            if url in running:
+                overlaps.append(url)
+            running.add(url)
+            started.append(url)
+        time.sleep(0.05)
+        with lock:
+            running.discard(url)
+        return "unchanged"
+    # a.test is rechecked right away, so only overlap protection keeps its checks apart
+    delays = {"https://a.test/1": 0, "https://b.test/": None, "https://c.test/": None}
+    jobs = JobScheduler(run, lambda url, result: delays[url], workers=4, max_per_host=2, deadline=0.01)
+    jobs.schedule("https://c.test/", 0.2)
+    jobs.schedule("https://b.test/", 0.1)
+    jobs.schedule("https://a.test/1", 0)
+    jobs.schedule("https://b.test/", 0.1)  # replaces the queued job
+    jobs.start()
+    time.sleep(0.4)
+    jobs.cancel("https://a.test/1")
+    jobs.stop()
+
+    assert not overlaps
+    assert started.count("https://b.test/") == 1 and started.count("https://c.test/") == 1
+    assert started.index("https://b.test/") < started.index("https://c.test/")
+    assert 3 <= started.count("https://a.test/1") <= 9
+    assert jobs.queued() == {} and jobs.urls() == set()
+
+def test_sharding_ring_and_leases(tmp_path):
+    from sharding import HashRing, WorkerRegistry
+    hosts = [f"www.host{i}.org" for i in range(200)]
+    ring = HashRing(["a", "b", "c"])
+    before = {host: ring.owner(host) for host in hosts}
+    assert set(before.values()) == {"a", "b", "c"}
+    # Removing a worker only moves its own hosts
+    after = HashRing(["a", "c"])
+    assert all(after.owner(host) == owner for host, owner in before.items() if owner != "b")
+
+    path = str(tmp_path / "fedload.db")
+    a = WorkerRegistry(path, "a", lease_timeout=30)
+    b = WorkerRegistry(path, "b", lease_timeout=30)
+    a.heartbeat(1000)
+    assert b.heartbeat(1000) and a.heartbeat(1001)
+    assert a.workers() == ["a", "b"] and a.is_leader() and not b.is_leader()
+    url = next(f"https://{host}/" for host in hosts if a.ring.owner(host) == "b")
+    assert b.owns(url) and not a.owns(url)
+    assert b.claim(url, 1001) and not a.claim(url, 1002)
+
+    # b stops heartbeating: its lease expires and its hosts move to a
+    assert a.heartbeat(1040)
+    assert a.workers() == ["a"] and a.owns(url) and a.claim(url, 1040)
+    a.release(url)
+    a.leave()
+    assert b.heartbeat(1041) and b.workers() == ["b"]
+
+def test_release_calendar_and_burst_windows():
+    from datetime import date, datetime, timedelta
+    from release_calendar import BurstPolling, expand_releases, parse_fomc_calendar
+    html = """<h4>2025 FOMC Meetings</h4>
+    <div><strong>January</strong></div><div>28-29</div><p>Statement: HTML</p>
+    <div><strong>Apr/May</strong></div><div>30-1*</div>"""
+    meetings = parse_fomc_calendar(html)
+    assert meetings == [(date(2025, 1, 28), date(2025, 1, 29)), (date(2025, 4, 30), date(2025, 5, 1))]
+
+    entities = {"events": [{"name": "FOMC Meeting", "release": {
+                    "basis": "fomc", "time": "14:00", "timezone": "UTC", "urls": ["https://fed/fomc"]}}],
+                "publications": [{"name": "Minutes", "release": {
+                    "basis": "fomc", "offset_days": 21, "time": "14:00", "timezone": "UTC", "urls": ["https://fed/minutes"]}}]}
+    releases = expand_releases(entities, meetings, datetime(2025, 1, 1), datetime(2025, 3, 1))
+    assert [release.name for release in releases] == ["FOMC Meeting", "Minutes"]
+    statement = releases[0].at
+    assert statement - releases[1].at == timedelta(days=-21)
+
+    burst = BurstPolling(before=5, after=30, interval=15)
+    burst.update(releases)
+    url = "https://fed/fomc"
+    assert burst.next_delay(url, 1800, statement - timedelta(minutes=20)) == 900
+    assert burst.next_delay(url, 1800, statement - timedelta(minutes=1)) == 15
+    assert burst.next_delay("https://fed/other", 1800, statement) == 1800
+    # The change that follows the release ends the window
+    burst.record_check(url, True, statement + timedelta(seconds=20))
+    assert burst.next_delay(url, 1800, statement + timedelta(minutes=1)) == 1800
+
+def test_report_engine_incremental_updates(tmp_path):
+    import shutil
+    from pathlib import Path
+    from datetime import datetime, timedelta
+    from change_log import ChangeLog
+    from reports import ReportEngine
+    from rollups import MentionRollups
+    templates = tmp_path / "templates"
+    shutil.copytree(Path(__file__).parent.parent / "templates", templates)
+    template_text = (templates / "daily_report.html").read_text()
+    log = ChangeLog(str(tmp_path / "change_log"))
+    rollups = MentionRollups(str(tmp_path / "fedload.db"))
+    engine = ReportEngine(rollups, log, str(templates), str(tmp_path))
+    now = datetime.now()
+
+    def change(url, minutes_ago, people=()):
+        entry = {"url": url, "time": (now - timedelta(minutes=minutes_ago)).isoformat(), "changed": True,
+                 "entities_found": {"basic": [], "fed_people": list(people), "fed_organizations": [], "fed_publications": []}}
+        log.append(entry)
+        rollups.add(entry)
+
+    change("https://fed.test/old", 60 * 30)
+    change("https://fed.test/a?x=1&y=<2>", 30, ["Jerome Powell"])
+    assert engine.update_daily(now) and engine.update_weekly(now)
+    report = (tmp_path / "daily_report.html").read_text()
+    assert "<!--" not in report and "https://fed.test/a?x=1&amp;y=&lt;2&gt;" in report
+    assert "fed.test/old" not in report and "Jerome Powell - 1 mentions" in report
+    assert "fed.test/old" in (tmp_path / "weekly_summary.html").read_text()
+    # Templates are never written; unchanged data leaves the reports alone
+    assert (templates / "daily_report.html").read_text() == template_text
+    assert not engine.update_daily(now) and not engine.update_weekly(now)
+    # The scheduled run rewrites it anyway, with the new generation time
+    later = now + timedelta(minutes=1)
+    assert engine.update_weekly(later, force=True)
+    assert later.strftime("%Y-%m-%d %H:%M:%S") in (tmp_path / "weekly_summary.html").read_text()
+    # Only the newly logged change is read
+    change("https://fed.test/b", 1)
+    assert engine.update_daily(now)
+    assert "https://fed.test/b" in (tmp_path / "daily_report.html").read_text()
+    assert not list(tmp_path.glob("*.tmp"))
+
+def test_static_site_export_rerenders_dependent_pages(tmp_path):
+    from pathlib import Path
+    from datetime import datetime
+    from change_log import ChangeLog
+    from export import StaticSiteExport, site_slug
+    from storage import Storage
+    storage = Storage(str(tmp_path / "fedload.db"))
+    log = ChangeLog(str(tmp_path / "change_log"))
+    entities = {"people": [{"name": "Jerome H. Powell", "title": "Chair"}, {"name": "Lisa D. Cook", "title": "Governor"}],
+                "organizations": [{"name": "Federal Reserve Bank of Boston", "type": "reserve bank"}]}
+    sites = ["https://fed.test/a", "https://fed.test/b"]
+    site = tmp_path / "site"
+    export = StaticSiteExport(storage, log, str(site), str(Path(__file__).parent.parent / "templates"),
+                              str(tmp_path / "manifest.json"), workers=2, min_batch=1)
+    try:
+        # Index, 2 group indexes with entries, 4 empty group indexes, 3 entity pages, sites index and 2 site pages
+        assert export.update(entities, sites) == (13, 0)
+        assert export.update(entities, sites) == (0, 0)
+
+        storage.save_page(sites[0], "h1", ["Boston"], {"Boston": 1},
+                          [{"type": "person", "text": "Powell", "id": "Jerome H. Powell"}])
+        log.append({"url": sites[0], "time": datetime.now().isoformat(), "changed": True})
+        # The site's page, the sites index, Powell's page and the people index
+        assert export.update(entities, sites) == (4, 0)
+        powell = (site / "people" / "jerome-h-powell.html").read_text()
+        assert f"../sites/{site_slug(sites[0])}.html" in powell and "<!--" not in powell
+
+        entities["people"].pop()
+        assert export.update(entities, sites) == (2, 1)
+        assert not (site / "people" / "lisa-d-cook.html").exists()
+    finally:
+        export.close()
+
+def test_notification_digests_with_smtp_retry():
+    import socketserver
+    import threading
+    import time
+    from notifications import NotificationDispatcher, SmtpSink
+    received = []
+
+    class SMTPStandIn(socketserver.StreamRequestHandler):
+        # Just enough SMTP for smtplib; the first message is refused with a temporary error
+        def handle(self):
+            self.wfile.write(b"220 localhost\r\n")
+            while True:
+                line = self.rfile.readline().decode()
+                command = line[:4].upper()
+                if not line or command == "QUIT":
+                    self.wfile.write(b"221 bye\r\n")
+                    return
+                if command == "DATA":
+                    self.wfile.write(b"354 go ahead\r\n")
+                    message = b"".join(iter(lambda: self.rfile.readline(), b".\r\n")).decode()
+                    refused = not hasattr(self.server, "refused")
+                    self.server.refused = True
+                    if refused:
+                        self.wfile.write(b"451 try again later\r\n")
+                    else:
+                        received.append(message)
+                        self.wfile.write(b"250 queued\r\n")
+                else:
+                    self.wfile.write(b"250 ok\r\n")
+
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), SMTPStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    sink = SmtpSink(["desk@example.org"], "127.0.0.1", server.server_address[1], timeout=5)
+    dispatcher = NotificationDispatcher({"on_change": [sink]}, window=0.3, max_events=100,
+                                        initial_backoff=0.2, max_backoff=1)
+    dispatcher.start()
+    try:
+        started = time.perf_counter()
+        for i in range(30):
+            dispatcher.publish("on_change", {"url": f"https://fed.test/{i % 3}", "time": f"2025-01-29T14:00:{i:02d}",
+                                             "entities_found": {"fed_people": ["Powell"]}})
+        assert time.perf_counter() - started < 0.1
+        dispatcher.publish("on_error", {"url": "https://fed.test/x", "time": "now", "error": "ignored: no sinks"})
+        deadline = time.time() + 10
+        while not received and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        dispatcher.stop()
+        server.shutdown()
+        server.server_close()
+    assert len(received) == 1
+    assert "Subject: FedLoad: 30 changes on 3 sites" in received[0]
+    assert received[0].count("(people: Powell)") == 30
+
+def _api(monkeypatch, tmp_path):
+    # main.py loads the spaCy model at import time
+    pytest.importorskip("en_core_web_sm")
+    import main
+    monkeypatch.setattr(main, "CHANGE_EVENTS_FILE", str(tmp_path / "change_events.jsonl"))
+    monkeypatch.setattr(main, "feed_poll_interval", 0.01)
+    monkeypatch.setattr(main, "feed_keepalive", 0.2)
+    return main
+
+def test_api_change_feed_sse(monkeypatch, tmp_path):
+    import json
+    import threading
+    import time
+    import httpx
+    import uvicorn
+    from events import ChangeEventReader, publish_change
+    from fastapi.testclient import TestClient
+    main = _api(monkeypatch, tmp_path)
+    for i in range(3):
+        publish_change(f"https://www.federalreserve.gov/{i}", None, f"h{i}", {}, main.CHANGE_EVENTS_FILE)
+    offsets = [event["offset"] for event in ChangeEventReader(main.CHANGE_EVENTS_FILE, 0).poll()]
+    assert TestClient(main.app).get("/events", params={"offset": -1}).status_code == 422
+
+    # The feed never ends, so it is read from a real server; without the
+    # lifespan, so its shutdown leaves the API's executors to other tests
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=0, log_level="warning", lifespan="off"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        ids, hashes, keepalives = [], [], 0
+        with httpx.stream("GET", f"http://127.0.0.1:{port}/events", timeout=5,
+                          headers={"Last-Event-ID": str(offsets[0])}) as response:
+            assert response.headers["content-type"].startswith("text/event-stream")
+            for line in response.iter_lines():
+                if line.startswith("id: "):
+                    ids.append(int(line[4:]))
+                elif line.startswith("data: "):
+                    hashes.append(json.loads(line[6:])["new_hash"])
+                elif line == ": keepalive":
+                    keepalives += 1
+                    break
+        # Disconnecting ends the stream; the server keeps serving
+        assert hashes == ["h1", "h2"] and ids == offsets[1:]
+        assert keepalives == 1
+        assert httpx.get(f"http://127.0.0.1:{port}/", timeout=5).status_code == 200
+    finally:
+        server.should_exit = True
+        thread.join(10)
+
+def test_api_change_feed_websocket(monkeypatch, tmp_path):
+    from events import ChangeEventReader, publish_change
+    from fastapi.testclient import TestClient
+    from starlette.websockets import WebSocketDisconnect
+    main = _api(monkeypatch, tmp_path)
+    for i in range(3):
+        publish_change(f"https://www.federalreserve.gov/{i}", None, f"h{i}", {}, main.CHANGE_EVENTS_FILE)
+    offsets = [event["offset"] for event in ChangeEventReader(main.CHANGE_EVENTS_FILE, 0).poll()]
+    client = TestClient(main.app)
+
+    with client.websocket_connect(f"/ws/events?offset={offsets[0]}") as websocket:
+        assert [websocket.receive_json()["new_hash"] for _ in range(2)] == ["h1", "h2"]
+        assert websocket.receive_json() == {"type": "keepalive"}
+        publish_change("https://www.federalreserve.gov/3", "h2", "h3", {}, main.CHANGE_EVENTS_FILE)
+        event = websocket.receive_json()
+        while event["type"] == "keepalive":
+            event = websocket.receive_json()
+        assert event["new_hash"] == "h3" and event["offset"] > offsets[-1]
+
+    # After a disconnect the feed serves new clients from the end of the journal
+    with client.websocket_connect("/ws/events") as websocket:
+        assert websocket.receive_json() == {"type": "keepalive"}
+
+    with pytest.raises(WebSocketDisconnect) as rejected:
+        with client.websocket_connect("/ws/events?offset=-1") as websocket:
+            websocket.receive_json()
+    assert rejected.value.code == 1008
+
+def test_api_check_batch_streams_ndjson(monkeypatch, tmp_path):
+    import json
+    import time
+    from concurrency import AdmissionController
+    from fastapi.testclient import TestClient
+    from response_cache import ResponseCache
+    main = _api(monkeypatch, tmp_path)
+    monkeypatch.setattr(main, "response_cache", ResponseCache({"check": 60}))
+    monkeypatch.setattr(main, "annotation_cache", None)
+    delays = {"https://www.federalreserve.gov/slow": 0.4, "https://www.federalreserve.gov/broken": 0.2,
+              "https://www.federalreserve.gov/fast": 0.0}
+
+    def extract_main_content(url):
+        time.sleep(delays[url])
+        if url.endswith("broken"):
+            raise ConnectionError("connection reset")
+        return {"text": f"Chair Powell spoke about {url[-4:]} inflation.", "meta": {}}
+
+    monkeypatch.setattr(main, "extract_main_content", extract_main_content)
+    client = TestClient(main.app)
+    response = client.post("/check/batch", json={"urls": list(delays) + ["https://example.com/", list(delays)[0]]})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+
+    # Rejected URLs first, then results in the order their fetches finish;
+    # a failed URL gets an error line and the rest of the batch continues
+    assert [(line["url"], line["ok"]) for line in lines] == [
+        ("https://example.com/", False), ("https://www.federalreserve.gov/fast", True),
+        ("https://www.federalreserve.gov/broken", False), ("https://www.federalreserve.gov/slow", True)]
+    assert lines[0]["status_code"] == 400
+    assert lines[2]["status_code"] == 500 and "connection reset" in lines[2]["error"]
+    assert lines[3]["result"]["url"] == "https://www.federalreserve.gov/slow"
+
+    monkeypatch.setattr(main, "check_admission", AdmissionController(1, 0))
+    main.check_admission.active = 1
+    response = client.post("/check/batch", json={"urls": ["https://www.federalreserve.gov/fast"]})
+    assert response.status_code == 503 and response.headers["retry-after"] == "5"
+
+def test_api_refreshes_from_events_in_background(monkeypatch, tmp_path):
+    import time
+    from events import ChangeEventReader, publish_change
+    main = _api(monkeypatch, tmp_path)
+    monkeypatch.setattr(main, "change_events", ChangeEventReader(main.CHANGE_EVENTS_FILE))
+    monkeypatch.setattr(main, "EVENT_POLL_INTERVAL", 0.02)
+    url = "https://www.federalreserve.gov/monetarypolicy.htm"
+    main.response_cache.put("check", url, {"url": url})
+    main.on_startup()
+    try:
+        publish_change(url, "h1", "h2", {}, main.CHANGE_EVENTS_FILE)
+        deadline = time.time() + 5
+        while main.response_cache.get("check", url) is not None and time.time() < deadline:
+            time.sleep(0.02)
+        assert main.response_cache.get("check", url) is None
+    finally:
+        main.refresher_stop.set()
+        main.refresher_thread.join(5)
+
+def test_api_swaps_reloaded_entity_index(monkeypatch, tmp_path):
+    main = _api(monkeypatch, tmp_path)
+    current = main.entity_index
+    monkeypatch.setattr(main, "entity_index_file_mtime", -1)
+
+    def broken():
+        raise ValueError("truncated index file")
+
+    monkeypatch.setattr(main, "load_index", broken)
+    main.refresh_from_events()
+    assert main.entity_index is current and main.entity_index_file_mtime == -1
+
+    replacement = main.EntityIndex()
+    monkeypatch.setattr(main, "load_index", lambda: replacement)
+    main.refresh_from_events()
+    assert main.entity_index is replacement and main.entity_index_file_mtime != -1
+
+def test_api_config_redacts_notification_secrets(monkeypatch, tmp_path):
+    import json
+    from fastapi.testclient import TestClient
+    main = _api(monkeypatch, tmp_path)
+    secret_hook = "https://hooks.example.org/services/T000/B000/s3cr3t"
+    config = {"notifications": {
+        "smtp": {"host": "mail.example.org", "username": "fedload", "password": "hunter2"},
+        "on_change": {"email_recipients": ["desk@example.org"], "webhook_urls": [secret_hook]},
+        "on_error": {"email_recipients": ["oncall@example.org"], "webhook_urls": [secret_hook]}}}
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(config))
+    monkeypatch.setattr(main, "CONFIG_FILE", str(path))
+
+    body = TestClient(main.app).get("/config").text
+    for secret in ("hunter2", "fedload", "desk@example.org", "oncall@example.org", "s3cr3t"):
+        assert secret not in body
+    notifications = json.loads(body)["notifications"]
+    assert notifications["smtp"]["host"] == "mail.example.org"
+    assert notifications["on_error"]["webhook_urls"] == ["***"]
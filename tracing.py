@@ -0,0 +1,265 @@
+import argparse
+import contextvars
+import cProfile
+import functools
+import json
+import logging
+import pstats
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger("tracing")
+
+TRACE_FILE = "traces.jsonl"
+# Functions kept per trace when a run is profiled
+PROFILE_TOP_FUNCTIONS = 25
+
+_current = contextvars.ContextVar("fedload_trace", default=None)
+_write_lock = threading.Lock()
+# Held while a profiled call runs: from Python 3.12 cProfile allows one
+# active profiler per process, so concurrent calls run unprofiled instead
+_profile_lock = threading.Lock()
+
+
+class Trace:
+    """Structured record of one URL check.
+
+    Stage spans are added by `metrics.stage()` while the trace is current,
+    other fields (bytes, text length, entity counts) with `annotate()`. When
+    the run is profiled, cProfile statistics of its profiled calls (see
+    `profiled()`) are merged into `functions`.
+    """
+
+    def __init__(self, url, source, profile=False):
+        self.url = url
+        self.source = source
+        self.profile = profile
+        self.time = datetime.now().isoformat()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.spans = []
+        self.fields = {}
+        self.functions = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, name, start, duration):
+        with self._lock:
+            self.spans.append({"name": name, "start": round(start - self.start, 6),
+                               "duration": round(duration, 6)})
+
+    def add_profile(self, profiler):
+        try:
+            stats = pstats.Stats(profiler).stats
+        except Exception as e:
+            # A profile that collected nothing must not fail the work it wrapped
+            logger.warning(f"Could not read profile of {self.url}: {str(e)}")
+            return
+        with self._lock:
+            for (filename, line, function), (_, calls, tottime, cumtime, _) in stats.items():
+                key = f"{filename}:{line}({function})"
+                entry = self.functions.setdefault(key, [0, 0.0, 0.0])
+                entry[0] += calls
+                entry[1] += tottime
+                entry[2] += cumtime
+
+    def to_dict(self):
+        record = {"time": self.time, "source": self.source, "url": self.url,
+                  "duration": round(self.duration, 6) if self.duration is not None else None,
+                  "spans": self.spans}
+        record.update(self.fields)
+        if self.functions:
+            top = sorted(self.functions.items(), key=lambda item: -item[1][2])[:PROFILE_TOP_FUNCTIONS]
+            record["functions"] = [{"function": key, "calls": calls, "tottime": round(tottime, 6),
+                                    "cumtime": round(cumtime, 6)}
+                                   for key, (calls, tottime, cumtime) in top]
+        return record
+
+
+class Tracer:
+    """Create traces for URL checks and append them to a JSONL trace file.
+
+    Args:
+        path (str): Trace file
+        enabled (bool): Record traces at all
+        profile_rate (float): Fraction of traced runs (0-1) to run under cProfile
+    """
+
+    def __init__(self, path=TRACE_FILE, enabled=False, profile_rate=0.0):
+        self.path = path
+        self.enabled = enabled
+        self.profile_rate = profile_rate
+
+    @contextmanager
+    def trace(self, url, source):
+        """Make a new trace current for the duration of the block.
+
+        Yields None when tracing is disabled. The trace is written when the
+        block exits, with the exception (if any) recorded as 'error'.
+        """
+        if not self.enabled:
+            yield None
+            return
+        current = Trace(url, source, profile=random.random() < self.profile_rate)
+        token = _current.set(current)
+        try:
+            yield current
+        except Exception as e:
+            current.fields["error"] = str(e)
+            raise
+        finally:
+            _current.reset(token)
+            current.duration = time.perf_counter() - current.start
+            self.write(current)
+
+    def write(self, record):
+        line = json.dumps(record.to_dict(), default=str) + "\n"
+        try:
+            with _write_lock:
+                with open(self.path, "a") as f:
+                    f.write(line)
+        except OSError as e:
+            logger.error(f"Could not write trace to {self.path}: {str(e)}")
+
+
+def current():
+    """Return the trace being recorded in this context, or None."""
+    return _current.get()
+
+
+def annotate(**fields):
+    """Add fields to the current trace; does nothing when not tracing."""
+    record = _current.get()
+    if record is not None:
+        record.fields.update(fields)
+
+
+def add_span(name, start, duration):
+    record = _current.get()
+    if record is not None:
+        record.add_span(name, start, duration)
+
+
+def profiled(function):
+    """Wrap `function` so it runs under cProfile when the current trace is profiled.
+
+    Only one call in the process is profiled at a time; calls made while
+    another is being profiled (or while a debugger or other profiler is
+    active) run normally and add no function statistics.
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        record = _current.get()
+        if record is None or not record.profile or not _profile_lock.acquire(blocking=False):
+            return function(*args, **kwargs)
+        try:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler or a debugger is active
+                profiler = None
+            if profiler is None:
+                return function(*args, **kwargs)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.disable()
+                record.add_profile(profiler)
+        finally:
+            _profile_lock.release()
+    return wrapper
+
+
+def in_context(function, *args):
+    """Bind `function(*args)` to the current context, for use with run_in_executor.
+
+    Executor threads do not inherit context variables, so without this the
+    work done in them would not be attached to the current trace.
+    """
+    return functools.partial(contextvars.copy_context().run, profiled(function), *args)
+
+
+def load_traces(path=TRACE_FILE, source=None):
+    traces = []
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if source is None or record.get("source") == source:
+                traces.append(record)
+    return traces
+
+
+def report(traces, top=10):
+    """Summarize traces as text: slowest URLs, time per stage, hottest functions.
+
+    Args:
+        traces (list): Trace records from `load_traces`
+        top (int): Rows per section
+
+    Returns:
+        str: Report text
+    """
+    by_url = defaultdict(list)
+    stages = defaultdict(float)
+    functions = defaultdict(lambda: [0, 0.0, 0.0])
+    for record in traces:
+        if record.get("duration") is None:
+            continue
+        by_url[record["url"]].append(record)
+        for span in record.get("spans", []):
+            stages[span["name"]] += span["duration"]
+        for entry in record.get("functions", []):
+            totals = functions[entry["function"]]
+            totals[0] += entry["calls"]
+            totals[1] += entry["tottime"]
+            totals[2] += entry["cumtime"]
+
+    lines = [f"{len(traces)} traces for {len(by_url)} URLs", "", f"Slowest URLs (top {top} by mean duration):"]
+    rows = []
+    for url, records in by_url.items():
+        durations = [r["duration"] for r in records]
+        stage_means = defaultdict(float)
+        for r in records:
+            for span in r.get("spans", []):
+                stage_means[span["name"]] += span["duration"] / len(records)
+        slowest_stage = max(stage_means.items(), key=lambda item: item[1], default=("-", 0.0))
+        rows.append((sum(durations) / len(durations), max(durations), len(records), url, slowest_stage))
+    rows.sort(reverse=True)
+    lines.append(f"  {'mean s':>8} {'max s':>8} {'runs':>5}  {'slowest stage':<22} url")
+    for mean, maximum, runs, url, (stage_name, stage_mean) in rows[:top]:
+        lines.append(f"  {mean:8.3f} {maximum:8.3f} {runs:5d}  {f'{stage_name} {stage_mean:.3f}s':<22} {url}")
+
+    lines += ["", "Time per stage (all traces):"]
+    for name, total in sorted(stages.items(), key=lambda item: -item[1]):
+        lines.append(f"  {total:10.3f}s  {name}")
+
+    if functions:
+        lines += ["", f"Hottest functions in profiled runs (top {top} by cumulative time):"]
+        lines.append(f"  {'cumtime':>10} {'tottime':>10} {'calls':>9}  function")
+        for name, (calls, tottime, cumtime) in sorted(functions.items(), key=lambda item: -item[1][2])[:top]:
+            lines.append(f"  {cumtime:10.3f} {tottime:10.3f} {calls:9d}  {name}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize FedLoad trace files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser("report", help="Show the slowest URLs, stages and functions")
+    report_parser.add_argument("--file", default=TRACE_FILE)
+    report_parser.add_argument("--top", type=int, default=10)
+    report_parser.add_argument("--source", choices=["scheduler", "api"], help="Only traces from this process")
+    args = parser.parse_args()
+
+    if args.command == "report":
+        print(report(load_traces(args.file, args.source), args.top))
+
+
+if __name__ == "__main__":
+    main()